@@ -136,6 +136,39 @@ class ApiClient {
     return MapData.fromJson(response.data!);
   }
 
+  Future<MapTileManifest> fetchMapTileManifest() async {
+    final response = await _dio.get<Map<String, dynamic>>('/map/tiles');
+    return MapTileManifest.fromJson(response.data!);
+  }
+
+  Future<MapTileData> fetchMapTile(String tileId) async {
+    final response = await _dio.get<Map<String, dynamic>>(
+      '/map/tiles/${Uri.encodeComponent(tileId)}',
+    );
+    return MapTileData.fromJson(response.data!);
+  }
+
+  Future<MapPointData> fetchMapAt(double x, double y) async {
+    final response = await _dio.get<Map<String, dynamic>>(
+      '/map/at',
+      queryParameters: {'x': x, 'y': y},
+    );
+    return MapPointData.fromJson(response.data!);
+  }
+
+  Future<MapViewportData> fetchMapViewport({
+    double x0 = 0,
+    double y0 = 0,
+    double x1 = 1,
+    double y1 = 1,
+  }) async {
+    final response = await _dio.get<Map<String, dynamic>>(
+      '/map/viewport',
+      queryParameters: {'x0': x0, 'y0': y0, 'x1': x1, 'y1': y1},
+    );
+    return MapViewportData.fromJson(response.data!);
+  }
+
   Future<LocationNode?> fetchCurrentLocation() async {
     final response = await _dio.get<Map<String, dynamic>>('/location/current');
     if (response.data == null) {
@@ -279,6 +312,122 @@ class MapData {
   }
 }
 
+class MapTileSummary {
+  MapTileSummary({
+    required this.id,
+    required this.x0,
+    required this.y0,
+    required this.x1,
+    required this.y1,
+    required this.nodeCount,
+  });
+
+  final String id;
+  final double x0;
+  final double y0;
+  final double x1;
+  final double y1;
+  final int nodeCount;
+
+  factory MapTileSummary.fromJson(Map<String, dynamic> json) {
+    final bbox = json['bbox'] as Map<String, dynamic>;
+    return MapTileSummary(
+      id: json['id'] as String,
+      x0: (bbox['x0'] as num).toDouble(),
+      y0: (bbox['y0'] as num).toDouble(),
+      x1: (bbox['x1'] as num).toDouble(),
+      y1: (bbox['y1'] as num).toDouble(),
+      nodeCount: (json['node_count'] as num).toInt(),
+    );
+  }
+}
+
+class MapTileManifest {
+  MapTileManifest({required this.style, required this.tiles});
+
+  final MapStyle style;
+  final List<MapTileSummary> tiles;
+
+  factory MapTileManifest.fromJson(Map<String, dynamic> json) {
+    return MapTileManifest(
+      style: MapStyle.fromJson(json['style'] as Map<String, dynamic>),
+      tiles: (json['tiles'] as List<dynamic>)
+          .map((item) => MapTileSummary.fromJson(item as Map<String, dynamic>))
+          .toList(),
+    );
+  }
+}
+
+class MapTileData {
+  MapTileData({
+    required this.tile,
+    required this.nodes,
+    required this.edges,
+    required this.boundaryNodes,
+  });
+
+  final MapTileStyle tile;
+  final List<LocationNode> nodes;
+  final List<MapEdge> edges;
+  final List<LocationNode> boundaryNodes;
+
+  factory MapTileData.fromJson(Map<String, dynamic> json) {
+    List<LocationNode> parseNodes(Object? raw) => (raw as List<dynamic>)
+        .map((item) => LocationNode.fromJson(item as Map<String, dynamic>))
+        .toList();
+    return MapTileData(
+      tile: MapTileStyle.fromJson(json['tile'] as Map<String, dynamic>),
+      nodes: parseNodes(json['nodes']),
+      edges: (json['edges'] as List<dynamic>)
+          .map((item) => MapEdge.fromJson(item as Map<String, dynamic>))
+          .toList(),
+      boundaryNodes: parseNodes(json['boundary_nodes']),
+    );
+  }
+}
+
+class MapPointData {
+  MapPointData({
+    this.tileId,
+    required this.areaIndices,
+    this.nearestNode,
+    this.distance,
+  });
+
+  final String? tileId;
+  final List<int> areaIndices;
+  final LocationNode? nearestNode;
+  final double? distance;
+
+  factory MapPointData.fromJson(Map<String, dynamic> json) {
+    final nearest = json['nearest_node'] as Map<String, dynamic>?;
+    return MapPointData(
+      tileId: json['tile_id'] as String?,
+      areaIndices: (json['area_indices'] as List<dynamic>? ?? const [])
+          .map((item) => (item as num).toInt())
+          .toList(),
+      nearestNode: nearest == null ? null : LocationNode.fromJson(nearest),
+      distance: (json['distance'] as num?)?.toDouble(),
+    );
+  }
+}
+
+class MapViewportData {
+  MapViewportData({required this.tileIds, required this.nodes});
+
+  final List<String> tileIds;
+  final List<LocationNode> nodes;
+
+  factory MapViewportData.fromJson(Map<String, dynamic> json) {
+    return MapViewportData(
+      tileIds: (json['tile_ids'] as List<dynamic>).cast<String>(),
+      nodes: (json['nodes'] as List<dynamic>)
+          .map((item) => LocationNode.fromJson(item as Map<String, dynamic>))
+          .toList(),
+    );
+  }
+}
+
 class MapStyle {
   MapStyle({
     required this.backgroundColor,
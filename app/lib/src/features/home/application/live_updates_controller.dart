@@ -32,6 +32,10 @@ class HomeLiveUpdatesController
   WebSocketChannel? _channel;
   StreamSubscription<dynamic>? _subscription;
   bool _disposed = false;
+  // 续传游标：重连时携带 since/epoch，服务端只补发断线期间错过的更新
+  int? _lastSeq;
+  String? _epoch;
+  String? _cursorPid;
 
   Future<void> _connect() async {
     if (_disposed) {
@@ -44,14 +48,22 @@ class HomeLiveUpdatesController
       final base = Uri.parse(config.wsChroniclesUrl);
       String? pid = await LocalCache.loadPlayerId();
       pid ??= await _ref.read(apiClientProvider).whoAmI();
-      final uri = pid == null
-          ? base
-          : base.replace(
-              queryParameters: {
-                ...base.queryParameters,
-                'pid': pid,
-              },
-            );
+      if (pid != _cursorPid) {
+        _lastSeq = null;
+        _epoch = null;
+        _cursorPid = pid;
+      }
+      final resume = _lastSeq != null && _epoch != null;
+      // batch=1：事件高峰时服务端把多条更新合并为一个 batch 帧下发
+      final uri = base.replace(
+        queryParameters: {
+          ...base.queryParameters,
+          'batch': '1',
+          if (pid != null) 'pid': pid,
+          if (pid != null && resume) 'since': '$_lastSeq',
+          if (pid != null && resume) 'epoch': _epoch!,
+        },
+      );
       _channel = WebSocketChannel.connect(uri);
       _subscription = _channel!.stream.listen(
         _handleMessage,
@@ -80,7 +92,24 @@ class HomeLiveUpdatesController
       return;
     }
     final type = data['type'] as String?;
+    if (type == 'batch') {
+      // 合并帧：按序逐条处理
+      for (final event in data['events'] as List<dynamic>) {
+        _handleMessage(event);
+      }
+      return;
+    }
+    final seq = data['seq'];
+    if (seq is int) {
+      _lastSeq = seq;
+    }
     if (type == 'snapshot') {
+      _lastSeq = seq is int ? seq : null;
+      // 连接时的快照带 epoch；连接期间推送的快照只带 seq，沿用当前 epoch
+      final epoch = data['epoch'];
+      if (epoch is String) {
+        _epoch = epoch;
+      }
       // 1) 刷新时间线列表
       final items = (data['logs'] as List<dynamic>)
           .map((item) => ChronicleLog.fromJson(item as Map<String, dynamic>))
@@ -0,0 +1,97 @@
+"""状态文件编码基准脚本。
+
+运行方式：
+    python scripts/bench_codec.py [--players server/players] [--world server/world_state.json] [--rounds 50]
+
+对真实的玩家状态文件与世界存档，分别统计：
+1. 旧版写法（json.dumps(model_dump(mode="json"), indent=2) / json.loads + model_validate）；
+2. app.codec 中当前环境可用的各编码器（json / orjson / msgpack）；
+的编码、解码耗时与文件体积。未安装的可选依赖会被跳过。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "server"))
+
+from pydantic import BaseModel  # noqa: E402
+
+from app.codec import available_codecs, decode_state  # noqa: E402
+from app.world_state import PlayerState, WorldState  # noqa: E402
+
+
+def _legacy_encode(model: BaseModel) -> bytes:
+    return json.dumps(model.model_dump(mode="json"), ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def _legacy_decode(data: bytes, model_type: type[BaseModel]) -> BaseModel:
+    return model_type.model_validate(json.loads(data))
+
+
+def _load_samples(players_dir: Path, world_path: Path) -> list[tuple[str, BaseModel]]:
+    samples: list[tuple[str, BaseModel]] = []
+    for path in sorted(players_dir.glob("*.json")) + sorted(players_dir.rglob("state.json")):
+        try:
+            samples.append(("player", decode_state(path.read_bytes(), PlayerState)))
+        except Exception:
+            continue
+    if world_path.exists():
+        samples.append(("world", decode_state(world_path.read_bytes(), WorldState)))
+    return samples
+
+
+def _measure(models: list[BaseModel], encode, decode, rounds: int) -> tuple[float, float, int]:
+    model_type = type(models[0])
+    blobs = [encode(m) for m in models]
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for m in models:
+            encode(m)
+    encode_s = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for blob in blobs:
+            decode(blob, model_type)
+    decode_s = time.perf_counter() - started
+    per_op = rounds * len(models)
+    return encode_s / per_op * 1e6, decode_s / per_op * 1e6, sum(len(b) for b in blobs)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="对比状态文件各编码器的速度与体积")
+    parser.add_argument("--players", type=Path, default=ROOT / "server" / "players")
+    parser.add_argument("--world", type=Path, default=ROOT / "server" / "world_state.json")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    samples = _load_samples(args.players, args.world)
+    if not samples:
+        print("未找到可用的状态文件")
+        return 1
+
+    variants = [("legacy-indent", _legacy_encode, _legacy_decode)]
+    for name, codec in available_codecs().items():
+        variants.append((name, codec.encode, codec.decode))
+
+    for kind in ("player", "world"):
+        models = [m for k, m in samples if k == kind]
+        if not models:
+            continue
+        print(f"\n[{kind}] {len(models)} 个文件，{args.rounds} 轮")
+        print(f"{'codec':<14}{'encode µs':>12}{'decode µs':>12}{'total bytes':>14}{'size %':>9}")
+        baseline = None
+        for name, encode, decode in variants:
+            enc_us, dec_us, size = _measure(models, encode, decode, args.rounds)
+            baseline = baseline or size
+            print(f"{name:<14}{enc_us:>12.1f}{dec_us:>12.1f}{size:>14}{size / baseline * 100:>8.1f}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import fcntl
+import logging
+import os
+import struct
+import tempfile
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger("lingyan.events.transport")
+
+# 投递回调收到频道与已编码的 JSON 字节，传输层不再解析或重新编码载荷
+Deliver = Callable[[str, bytes], Awaitable[None]]
+
+# 帧格式：4 字节大端长度 + 频道（UTF-8）+ b"\n" + 已编码的 JSON 载荷
+_HEADER = struct.Struct(">I")
+_MAX_FRAME = 16 * 1024 * 1024
+# hub 对单个 worker 积压的未发送字节上限，超过即断开该连接（对方会自动重连）
+_MAX_PEER_BACKLOG = 8 * 1024 * 1024
+
+
+def encode_frame(channel: str, data: bytes) -> bytes:
+    body = channel.encode("utf-8") + b"\n" + data
+    return _HEADER.pack(len(body)) + body
+
+
+def decode_frame(body: bytes) -> tuple[str, bytes]:
+    channel, _, data = body.partition(b"\n")
+    return channel.decode("utf-8"), data
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    if size > _MAX_FRAME:
+        raise ValueError(f"event frame too large: {size}")
+    return await reader.readexactly(size)
+
+
+class LocalTransport:
+    """进程内传输（默认）：broadcast 直接投递给本进程的订阅者。"""
+
+    name = "local"
+
+    def __init__(self) -> None:
+        self._deliver: Deliver | None = None
+
+    def bind(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def start(self) -> None:
+        return None
+
+    async def publish(self, channel: str, data: bytes) -> None:
+        if self._deliver is not None:
+            await self._deliver(channel, data)
+
+    async def close(self) -> None:
+        return None
+
+    def stats(self) -> dict[str, Any]:
+        return {"transport": self.name}
+
+
+class UnixSocketTransport:
+    """同机多进程传输：各 worker 经 Unix 域套接字连到一个转发中心（hub）。
+
+    - 第一个启动的 worker 在文件锁保护下绑定套接字并兼任 hub，其余 worker 作为客户端连接；
+    - publish 把帧发给 hub，hub 原样转发给所有连接（含发送方），各 worker 收到后投递本地订阅者，
+      因此 broadcast(channel, payload) 的语义与单进程一致，只是投递改为异步；
+    - hub 所在进程退出后，其余 worker 自动重连并重新选出 hub；未连上 hub 期间退化为仅本地投递。
+    """
+
+    name = "unix"
+
+    def __init__(self, path: Path, reconnect_delay: float = 0.5) -> None:
+        self._path = path
+        self._reconnect_delay = reconnect_delay
+        self._deliver: Deliver | None = None
+        self._server: asyncio.AbstractServer | None = None
+        self._peers: set[asyncio.StreamWriter] = set()
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task | None = None
+        self._started = False
+        self._closing = False
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def is_hub(self) -> bool:
+        return self._server is not None
+
+    def bind(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        self._closing = False
+        await self._connect()
+        self._reader_task = asyncio.create_task(self._run())
+
+    async def publish(self, channel: str, data: bytes) -> None:
+        if not self._started:
+            await self.start()
+        frame = encode_frame(channel, data)
+        writer = self._writer
+        if writer is not None and not writer.is_closing():
+            try:
+                writer.write(frame)
+                await writer.drain()
+                return
+            except (ConnectionError, OSError):
+                logger.warning("event hub connection lost while publishing to %s", channel)
+        # 未连上 hub：至少投递给本进程的订阅者
+        if self._deliver is not None:
+            await self._deliver(channel, data)
+
+    async def close(self) -> None:
+        self._closing = True
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await self._reader_task
+            self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._server is not None:
+            self._server.close()
+            for peer in list(self._peers):
+                peer.close()
+            self._peers.clear()
+            with contextlib.suppress(Exception):
+                await self._server.wait_closed()
+            self._server = None
+            with contextlib.suppress(FileNotFoundError):
+                self._path.unlink()
+        self._started = False
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "transport": self.name,
+            "socket": str(self._path),
+            "hub": self.is_hub,
+            "connected": self._writer is not None and not self._writer.is_closing(),
+            "peers": len(self._peers),
+        }
+
+    # ===== 连接与 hub 选举 =====
+    async def _connect(self) -> None:
+        try:
+            reader, writer = await asyncio.open_unix_connection(str(self._path))
+        except (FileNotFoundError, ConnectionRefusedError):
+            await self._elect_hub()
+            reader, writer = await asyncio.open_unix_connection(str(self._path))
+        self._reader, self._writer = reader, writer
+
+    async def _elect_hub(self) -> None:
+        """在文件锁内再次确认无人监听后绑定套接字（清理崩溃遗留的套接字文件）。"""
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self._path.with_name(self._path.name + ".lock")
+        fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+            try:
+                _, probe = await asyncio.open_unix_connection(str(self._path))
+                probe.close()
+                return  # 其他 worker 已成为 hub
+            except (FileNotFoundError, ConnectionRefusedError):
+                pass
+            with contextlib.suppress(FileNotFoundError):
+                self._path.unlink()
+            self._server = await asyncio.start_unix_server(self._serve_peer, path=str(self._path))
+            logger.info("event hub listening on %s (pid %d)", self._path, os.getpid())
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                while True:
+                    channel, data = decode_frame(await read_frame(self._reader))
+                    if self._deliver is not None:
+                        try:
+                            await self._deliver(channel, data)
+                        except Exception:
+                            logger.exception("event delivery failed")
+            except asyncio.CancelledError:
+                raise
+            except (asyncio.IncompleteReadError, ConnectionError, OSError, ValueError):
+                if self._closing:
+                    return
+                logger.warning("event hub connection closed, reconnecting")
+            self._writer = None
+            while not self._closing:
+                await asyncio.sleep(self._reconnect_delay)
+                try:
+                    await self._connect()
+                    break
+                except OSError:
+                    continue
+
+    # ===== hub 端 =====
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._peers.add(writer)
+        try:
+            while True:
+                body = await read_frame(reader)
+                frame = _HEADER.pack(len(body)) + body
+                for peer in list(self._peers):
+                    try:
+                        if peer.transport.get_write_buffer_size() > _MAX_PEER_BACKLOG:
+                            raise ConnectionError("peer backlog exceeded")
+                        peer.write(frame)
+                    except Exception:
+                        self._peers.discard(peer)
+                        peer.close()
+                # 只等待发送方的写缓冲，避免单个慢 worker 阻塞整个 hub
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+
+def transport_from_environment() -> LocalTransport | UnixSocketTransport:
+    """EVENT_BROKER_TRANSPORT：local（默认）或 unix；unix 时套接字路径取 EVENT_BROKER_SOCKET。"""
+    kind = os.environ.get("EVENT_BROKER_TRANSPORT", "local").strip().lower()
+    if kind == "unix":
+        default = Path(tempfile.gettempdir()) / "lingyan-events.sock"
+        return UnixSocketTransport(Path(os.environ.get("EVENT_BROKER_SOCKET") or default))
+    if kind != "local":
+        logger.warning("unknown event broker transport %s, using local", kind)
+    return LocalTransport()
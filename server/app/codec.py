@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, TypeVar
+
+from pydantic import BaseModel
+from pydantic_core import from_json, to_json, to_jsonable_python
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+logger = logging.getLogger("lingyan.codec")
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+# 二进制格式文件头：b"LYC1:<codec>\n"；无文件头的内容一律按 JSON 解析（兼容旧版缩进 JSON）
+_MAGIC = b"LYC1:"
+
+
+class StateCodec:
+    """状态文件编解码器：JSON（默认）、orjson（可选依赖）、msgpack（可选依赖，二进制）。"""
+
+    name = "json"
+
+    def encode(self, model: BaseModel) -> bytes:
+        return model.model_dump_json().encode("utf-8")
+
+    def decode(self, data: bytes, model_type: type[ModelT]) -> ModelT:
+        return model_type.model_validate_json(data)
+
+    # 任意值（模型、列表、字典）的编解码：用于分段存储中的非模型片段
+    def dump(self, value: Any) -> bytes:
+        return to_json(value)
+
+    def load(self, data: bytes) -> Any:
+        return from_json(data)
+
+
+class OrjsonCodec(StateCodec):
+    name = "orjson"
+
+    def encode(self, model: BaseModel) -> bytes:
+        return orjson.dumps(model.model_dump(mode="json"))
+
+    def decode(self, data: bytes, model_type: type[ModelT]) -> ModelT:
+        return model_type.model_validate(orjson.loads(data))
+
+    def dump(self, value: Any) -> bytes:
+        return orjson.dumps(to_jsonable_python(value))
+
+    def load(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+class MsgpackCodec(StateCodec):
+    name = "msgpack"
+
+    def encode(self, model: BaseModel) -> bytes:
+        return self.dump(model)
+
+    def decode(self, data: bytes, model_type: type[ModelT]) -> ModelT:
+        return model_type.model_validate(self.load(data))
+
+    def dump(self, value: Any) -> bytes:
+        header = _MAGIC + self.name.encode("ascii") + b"\n"
+        return header + msgpack.packb(to_jsonable_python(value), use_bin_type=True)
+
+    def load(self, data: bytes) -> Any:
+        body = data[data.index(b"\n") + 1 :] if data.startswith(_MAGIC) else data
+        return msgpack.unpackb(body, raw=False)
+
+
+def available_codecs() -> dict[str, StateCodec]:
+    codecs: dict[str, StateCodec] = {"json": StateCodec()}
+    if orjson is not None:
+        codecs["orjson"] = OrjsonCodec()
+    if msgpack is not None:
+        codecs["msgpack"] = MsgpackCodec()
+    return codecs
+
+
+def get_codec(name: str | None = None) -> StateCodec:
+    """按名称（默认读取 STATE_CODEC）选择编码器；依赖缺失时回退 JSON 并记录日志。"""
+    wanted = (name or os.environ.get("STATE_CODEC") or "json").strip().lower()
+    codecs = available_codecs()
+    codec = codecs.get(wanted)
+    if codec is None:
+        logger.warning("state codec %s unavailable, falling back to json", wanted)
+        codec = codecs["json"]
+    return codec
+
+
+def decode_state(data: bytes, model_type: type[ModelT]) -> ModelT:
+    """按文件头自动识别格式解码，与当前写入所用编码器无关，切换编码器后旧文件仍可读取。"""
+    if data.startswith(_MAGIC):
+        return _binary_codec(data).decode(data, model_type)
+    return model_type.model_validate_json(data)
+
+
+def _binary_codec(data: bytes) -> StateCodec:
+    name = data[len(_MAGIC) : data.index(b"\n")].decode("ascii")
+    if name == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("state file is msgpack-encoded but msgpack is not installed")
+        return MsgpackCodec()
+    raise RuntimeError(f"unknown state codec {name!r}")
+
+
+def decode_value(data: bytes) -> Any:
+    """decode_state 的非模型版本：按文件头识别格式，返回 JSON 兼容的 Python 值。"""
+    if data.startswith(_MAGIC):
+        return _binary_codec(data).load(data)
+    return from_json(data)
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+from collections import OrderedDict
+from concurrent.futures import Future
 from datetime import UTC, datetime
-from typing import List, Tuple
+from typing import Callable, Iterable, List, Tuple
 from uuid import uuid4
 
 from fastapi import HTTPException, status
+from pydantic import BaseModel
 
 from .schemas import (
     AscensionChallenge,
@@ -12,72 +15,349 @@ from .schemas import (
     CommandRequest,
     CommandResult,
     Companion,
+    MapNodeView,
+    MapTileManifestResponse,
+    MapTileResponse,
+    MapTileSummary,
+    MapViewResponse,
     MemoryAppendRequest,
     MemoryRecord,
     PillRecipe,
     PlayerProfile,
     SecretRealm,
 )
-from .world_state import AuctionHouse, Shop, WorldState, WorldStateStore, PlayerState
+from .codec import StateCodec, decode_state, get_codec
+from .journal import LotRemoved, NodeDiscovered, StockDelta
+from .persistence import GroupCommitWriter, atomic_write
+from .routing import RouteTable
+from .spatial import SpatialIndex
+from .stock import OutOfStockError, StockConflictError, StockLedger
+from .segments import SegmentLog
+from .world_state import AuctionHouse, AuctionLot, MapNode, Shop, ShopItem, WorldState, WorldStateStore, PlayerState
 from pathlib import Path
-import json as _json
+import hashlib
 import random as _random
 import shutil as _shutil
+import threading as _threading
 import os as _os
+import logging as _logging
+
+logger = _logging.getLogger("lingyan.players")
+
+
+class _Pending:
+    """缓存标记：保存已提交给组提交队列、尚未确认落盘（每次保存一个实例）。"""
+
+    __slots__ = ()
+
+
+class StateCache:
+    """已校验 PlayerState 的有界 LRU 缓存。
+
+    存入与取出时各做一次深拷贝：调用方拿到的实例可随意修改，不会影响缓存或其他请求持有的对象。
+    每个条目附带一个有效性标记（文件后端为 (mtime_ns, size)，SQLite 后端为行版本号），
+    读取时标记不一致即视为失效。统计 hits/misses 便于按活跃玩家规模调整容量。
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self._capacity = capacity
+        self._lock = _threading.Lock()
+        self._entries: OrderedDict[str, tuple[object, PlayerState]] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, player_id: str, stamp: object) -> PlayerState | None:
+        with self._lock:
+            entry = self._entries.get(player_id)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(player_id)
+                self._hits += 1
+                return entry[1].model_copy(deep=True)
+            self._misses += 1
+            return None
+
+    def peek_stamp(self, player_id: str) -> object | None:
+        """仅查看缓存条目的有效性标记，不影响命中统计与 LRU 顺序。"""
+        with self._lock:
+            entry = self._entries.get(player_id)
+            return entry[0] if entry is not None else None
+
+    def restamp(self, player_id: str, old: object, new: object) -> None:
+        """条目标记仍为 old 时替换为 new（组提交落盘后补记文件标记）。"""
+        with self._lock:
+            entry = self._entries.get(player_id)
+            if entry is not None and entry[0] is old:
+                self._entries[player_id] = (new, entry[1])
+
+    def put(self, player_id: str, stamp: object, state: PlayerState) -> None:
+        if self._capacity <= 0:
+            return
+        state = state.model_copy(deep=True)
+        with self._lock:
+            self._entries[player_id] = (stamp, state)
+            self._entries.move_to_end(player_id)
+            while len(self._entries) > self._capacity:
+                self._entries.popitem(last=False)
+
+    def drop(self, player_id: str) -> None:
+        with self._lock:
+            self._entries.pop(player_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def info(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "size": len(self._entries),
+                "capacity": self._capacity,
+            }
 
 
 class PlayerStore:
     """按浏览器/客户端区分的玩家状态存储（世界共享，玩家数据独立）。
 
-    - 存储路径：server/players/{player_id}.json
+    - 存储路径（v3）：server/players/{ab}/{cd}/{player_id}/state.json，按 id 前四个字符分两级分片，
+      单个目录的条目数保持在可控范围；路径计算结果有缓存，读路径不创建目录。
+    - 旧布局在线迁移：v2 的 players/{pid}/ 目录与 v1 的 players/{pid}.json 在启动时登记，
+      首次访问该玩家时迁移（亦可调用 migrate_layout 一次性完成），期间服务照常读写。
+    - 编年史/指令历史：logs.jsonl、commands.jsonl 追加式段文件，见 SegmentLog。
     - 初始数据：基于当前世界的 player 模板复制，并随机选择一个地图节点作为起点。
     - 仅管理 PlayerState，不改动全局 WorldState。
+    - 状态文件编码由 codec 决定（默认紧凑 JSON）；读取按文件头识别，旧版缩进 JSON 照常可读。
     """
 
-    def __init__(self, root: Path) -> None:
+    _path_cache_size = 65536
+    # v2 目录布局中可能出现的文件，用于区分玩家目录与 v3 分片目录
+    _v2_markers = ("state.json", "logs.jsonl", "commands.jsonl", "logs.json", "commands.json")
+    _staging_prefix = ".migrating-"
+
+    def __init__(
+        self,
+        root: Path,
+        cache_size: int = 1024,
+        writer: GroupCommitWriter | None = None,
+        codec: StateCodec | None = None,
+    ) -> None:
         self._root = root
         self._root.mkdir(parents=True, exist_ok=True)
+        self._codec = codec or get_codec()
+        # 状态文件写入：提供 writer 时走组提交（窗口内合并），否则同步原子写
+        self._writer = writer
+        self._log_segments = SegmentLog(GameRepository._max_chronicle_entries, cache_size=cache_size)
+        self._command_segments = SegmentLog(GameRepository._max_commands, cache_size=cache_size)
+        # 路径缓存（pid -> 玩家目录）与已确认存在的目录；均有上限，超出时整体清空
+        self._dir_cache: dict[str, Path] = {}
+        self._ready_dirs: set[str] = set()
+        # 待迁移的旧布局玩家：v2 目录 / v1 扁平文件
+        self._migrate_lock = _threading.Lock()
+        self._v2_dirs: dict[str, Path] = {}
+        self._flat_pids: set[str] = set()
+        # 位置索引：co-location 查询无需扫描全部玩家文件
+        self._index_lock = _threading.Lock()
+        self._location_of: dict[str, str] = {}
+        self._pids_by_location: dict[str, set[str]] = {}
+        self._build_location_index()
+        # 已校验 PlayerState 的 LRU 缓存，以状态文件 (mtime_ns, size) 作为有效性标记
+        self._cache = StateCache(cache_size)
+
+    # v3 目录结构：players/{ab}/{cd}/{pid}/state.json, logs.jsonl, commands.jsonl
+    @staticmethod
+    def _shard(player_id: str) -> tuple[str, str]:
+        key = "".join(c if c.isalnum() else "_" for c in player_id[:4].lower()).ljust(4, "_")
+        return key[:2], key[2:]
 
-    # 新版目录结构：players/{pid}/state.json, logs.json, commands.json
     def _dir_for(self, player_id: str) -> Path:
-        d = self._root / player_id
-        d.mkdir(parents=True, exist_ok=True)
+        """纯路径计算（带缓存），不访问文件系统。"""
+        d = self._dir_cache.get(player_id)
+        if d is None:
+            first, second = self._shard(player_id)
+            d = self._root / first / second / player_id
+            if len(self._dir_cache) >= self._path_cache_size:
+                self._dir_cache.clear()
+            self._dir_cache[player_id] = d
+        return d
+
+    def _ensure_dir(self, player_id: str) -> Path:
+        """写路径专用：首次写入时创建玩家目录。"""
+        d = self._dir_for(player_id)
+        if player_id not in self._ready_dirs:
+            d.mkdir(parents=True, exist_ok=True)
+            if len(self._ready_dirs) >= self._path_cache_size:
+                self._ready_dirs.clear()
+            self._ready_dirs.add(player_id)
         return d
 
     def _state_path(self, player_id: str) -> Path:
         return self._dir_for(player_id) / "state.json"
 
     def _logs_path(self, player_id: str) -> Path:
-        return self._dir_for(player_id) / "logs.json"
+        return self._dir_for(player_id) / "logs.jsonl"
 
     def _commands_path(self, player_id: str) -> Path:
+        return self._dir_for(player_id) / "commands.jsonl"
+
+    # 兼容旧版整文件 JSON 数组：{pid 目录}/logs.json, commands.json（首次访问时迁移为 JSONL）
+    def _legacy_logs_path(self, player_id: str) -> Path:
+        return self._dir_for(player_id) / "logs.json"
+
+    def _legacy_commands_path(self, player_id: str) -> Path:
         return self._dir_for(player_id) / "commands.json"
 
-    # 兼容旧版：players/{pid}.json
+    # 兼容旧版布局：v2 players/{pid}/，v1 players/{pid}.json
+    def _staging_dir(self, player_id: str) -> Path:
+        return self._root / f"{self._staging_prefix}{player_id}"
+
     def _legacy_state_path(self, player_id: str) -> Path:
         return self._root / f"{player_id}.json"
 
+    # ===== 旧布局在线迁移 =====
+    def _migrate_if_needed(self, player_id: str) -> None:
+        # 集合查询无系统调用；已迁移或新玩家直接返回
+        if player_id in self._v2_dirs or player_id in self._flat_pids:
+            self._migrate_player(player_id)
+
+    def _migrate_player(self, player_id: str) -> None:
+        with self._migrate_lock:
+            if player_id in self._v2_dirs:
+                src = self._v2_dirs[player_id]
+                dst = self._dir_for(player_id)
+                try:
+                    if dst.exists():
+                        logger.warning("player %s exists in both layouts, keeping %s", player_id, dst)
+                    else:
+                        # 先移到临时名再归位：极短 id（如 "ab"）的 v2 目录与其分片目录同名
+                        staging = self._staging_dir(player_id)
+                        if src != staging:
+                            _os.replace(src, staging)
+                        dst.parent.mkdir(parents=True, exist_ok=True)
+                        _os.replace(staging, dst)
+                        self._ready_dirs.add(player_id)
+                except FileNotFoundError:
+                    pass
+                self._v2_dirs.pop(player_id, None)
+                # 目录整体迁入后，v1 扁平文件只是更旧的副本
+                if player_id in self._flat_pids and dst.joinpath("state.json").exists():
+                    self._flat_pids.discard(player_id)
+                    self._remove_flat(player_id)
+            if player_id in self._flat_pids:
+                legacy = self._legacy_state_path(player_id)
+                try:
+                    data = legacy.read_bytes()
+                except FileNotFoundError:
+                    data = None
+                if data is not None:
+                    state = decode_state(data, PlayerState)
+                    # 直接同步原子写入新位置，确认落盘后再删除旧文件
+                    atomic_write(self._ensure_dir(player_id) / "state.json", self._codec.encode(state))
+                    self._index_location(player_id, state.current_location)
+                    self._remove_flat(player_id)
+                self._flat_pids.discard(player_id)
+
+    def _remove_flat(self, player_id: str) -> None:
+        try:
+            self._legacy_state_path(player_id).unlink()
+        except FileNotFoundError:
+            pass
+
+    def migrate_layout(self) -> int:
+        """将全部旧布局玩家迁移到 v3 分片目录，返回迁移人数（可在后台线程中调用）。"""
+        with self._migrate_lock:
+            pending = self._v2_dirs.keys() | self._flat_pids
+        migrated = 0
+        for pid in pending:
+            try:
+                self._migrate_player(pid)
+                migrated += 1
+            except Exception:
+                logger.warning("migrate player %s failed", pid, exc_info=True)
+        return migrated
+
+    def pending_migrations(self) -> int:
+        with self._migrate_lock:
+            return len(self._v2_dirs.keys() | self._flat_pids)
+
     def exists(self, player_id: str) -> bool:
-        return self._state_path(player_id).exists() or self._legacy_state_path(player_id).exists()
+        if player_id in self._location_of:
+            return True
+        self._migrate_if_needed(player_id)
+        return self._state_path(player_id).exists()
 
     def load(self, player_id: str) -> PlayerState:
+        """读取玩家状态；命中缓存且文件 (mtime, size) 未变时直接复用已校验对象。
+
+        返回独立副本，修改后须调用 save 落盘。
+        """
+        self._migrate_if_needed(player_id)
         path = self._state_path(player_id)
-        if not path.exists():
-            legacy = self._legacy_state_path(player_id)
-            if not legacy.exists():
-                raise FileNotFoundError(f"player {player_id} not found")
-            # 迁移旧版为新目录结构
-            data = _json.loads(legacy.read_text(encoding="utf-8"))
-            state = PlayerState.model_validate(data)
-            self.save(player_id, state)
-            return state
-        data = _json.loads(path.read_text(encoding="utf-8"))
-        return PlayerState.model_validate(data)
-
-    def save(self, player_id: str, state: PlayerState) -> None:
-        path = self._state_path(player_id)
-        serialized = _json.dumps(state.model_dump(mode="json"), ensure_ascii=False, indent=2)
-        path.write_text(serialized, encoding="utf-8")
+        if self._writer is not None:
+            # 尚未落盘的保存：以排队内容为准（读己之写）
+            pending = self._writer.peek(path)
+            if pending is not None:
+                marker = self._cache.peek_stamp(player_id)
+                if isinstance(marker, _Pending):
+                    cached = self._cache.get(player_id, marker)
+                    if cached is not None:
+                        return cached
+                state = decode_state(pending, PlayerState)
+                self._cache.put(player_id, _Pending(), state)
+                return state
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"player {player_id} not found") from None
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = self._cache.get(player_id, stamp)
+        if cached is not None:
+            return cached
+        state = decode_state(path.read_bytes(), PlayerState)
+        self._cache.put(player_id, stamp, state)
+        return state
+
+    def save(self, player_id: str, state: PlayerState) -> Future[None] | None:
+        """保存玩家状态。走组提交时返回落盘后完成的 Future，调用方须等待后再确认；同步写入时返回 None。"""
+        self._migrate_if_needed(player_id)
+        path = self._ensure_dir(player_id) / "state.json"
+        data = self._codec.encode(state)
+        commit: Future[None] | None = None
+        try:
+            if self._writer is not None:
+                commit = self._writer.submit(path, data)
+                stamp: object = _Pending()
+            else:
+                atomic_write(path, data)
+                st = path.stat()
+                stamp = (st.st_mtime_ns, st.st_size)
+        except Exception:
+            self._cache.drop(player_id)
+            raise
+        self._cache.put(player_id, stamp, state)
+        self._index_location(player_id, state.current_location)
+        if commit is not None:
+            commit.add_done_callback(lambda done: self._settle(player_id, path, stamp, done))
+        return commit
+
+    def _settle(self, player_id: str, path: Path, marker: object, commit: Future[None]) -> None:
+        """组提交结束后整理缓存：成功时为本次保存的条目补记文件标记，失败时丢弃条目。
+
+        失败的保存不能继续留在缓存里，否则会被当作已落盘的状态返回并在下次保存时写出。
+        """
+        if commit.exception() is not None:
+            self._cache.drop(player_id)
+            return
+        try:
+            st = path.stat()
+        except OSError:
+            self._cache.drop(player_id)
+            return
+        self._cache.restamp(player_id, marker, (st.st_mtime_ns, st.st_size))
+
+    def cache_info(self) -> dict[str, int]:
+        """缓存命中统计，用于按活跃玩家规模调整 PLAYER_CACHE_SIZE。"""
+        return self._cache.info()
 
     def create_from_world(self, player_id: str, world: WorldState) -> PlayerState:
         template = world.player
@@ -85,103 +365,171 @@ class PlayerStore:
         nodes = world.map_state.nodes
         start_id = nodes[_random.randrange(0, len(nodes))].id if nodes else template.current_location
         new_state = PlayerState(
-            profile=template.profile,
+            profile=template.profile.model_copy(deep=True),
             current_location=start_id,
             spirit_stones=template.spirit_stones,
-            inventory=list(template.inventory),
+            inventory=[entry.model_copy(deep=True) for entry in template.inventory],
             blood_percent=template.blood_percent,
         )
         self.save(player_id, new_state)
         return new_state
 
     # ===== 玩家个人编年史（独立于世界） =====
-    def list_logs(self, player_id: str) -> list[ChronicleLog]:
+    def list_logs(
+        self,
+        player_id: str,
+        limit: int | None = None,
+        before: int | None = None,
+        after: int | None = None,
+    ) -> list[ChronicleLog]:
+        """新→旧返回编年史；before/after 为记录的 cursor，仅读取所需窗口。
+
+        after 游标已被压缩淘汰时抛出 CursorExpiredError。
+        """
+        self._migrate_if_needed(player_id)
         p = self._logs_path(player_id)
-        if not p.exists():
-            return []
-        try:
-            raw = _json.loads(p.read_text(encoding="utf-8"))
-            return [ChronicleLog.model_validate(item) for item in raw]
-        except Exception:
-            return []
+        self._log_segments.migrate_legacy(self._legacy_logs_path(player_id), p)
+        items: list[ChronicleLog] = []
+        for line in self._log_segments.window(p, limit, before=before, after=after):
+            try:
+                items.append(ChronicleLog.model_validate_json(line))
+            except Exception:
+                continue
+        return items
 
     def append_log(self, player_id: str, event: ChronicleLog) -> None:
-        items = self.list_logs(player_id)
-        items.insert(0, event)
-        # 截断避免无限增长
-        items = items[: GameRepository._max_chronicle_entries]
-        p = self._logs_path(player_id)
-        data = [e.model_dump(mode="json") for e in items]
-        p.write_text(_json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        self._migrate_if_needed(player_id)
+        p = self._ensure_dir(player_id) / "logs.jsonl"
+        self._log_segments.migrate_legacy(self._legacy_logs_path(player_id), p)
+        # 单行追加；截断由段文件的周期性压缩完成
+        self._log_segments.append(p, event.model_dump_json(exclude={"cursor"}))
 
     # ===== 玩家个人指令历史 =====
-    def list_commands(self, player_id: str) -> list[CommandResult]:
+    def list_commands(
+        self,
+        player_id: str,
+        limit: int | None = None,
+        before: int | None = None,
+        after: int | None = None,
+    ) -> list[CommandResult]:
+        self._migrate_if_needed(player_id)
         p = self._commands_path(player_id)
-        if not p.exists():
-            return []
-        try:
-            raw = _json.loads(p.read_text(encoding="utf-8"))
-            return [CommandResult.model_validate(item) for item in raw]
-        except Exception:
-            return []
+        self._command_segments.migrate_legacy(self._legacy_commands_path(player_id), p)
+        items: list[CommandResult] = []
+        for line in self._command_segments.window(p, limit, before=before, after=after):
+            try:
+                items.append(CommandResult.model_validate_json(line))
+            except Exception:
+                continue
+        return items
 
     def append_command(self, player_id: str, cmd: CommandResult) -> None:
-        items = self.list_commands(player_id)
-        items.insert(0, cmd)
-        items = items[: GameRepository._max_commands]
-        p = self._commands_path(player_id)
-        data = [c.model_dump(mode="json") for c in items]
-        p.write_text(_json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        self._migrate_if_needed(player_id)
+        p = self._ensure_dir(player_id) / "commands.jsonl"
+        self._command_segments.migrate_legacy(self._legacy_commands_path(player_id), p)
+        self._command_segments.append(p, cmd.model_dump_json(exclude={"cursor"}))
 
     def list_players_at(self, location_id: str, exclude_pid: str | None = None) -> list[tuple[str, PlayerState]]:
+        """同域玩家查询：经位置索引定位，成本仅与该节点的玩家数相关。"""
+        with self._index_lock:
+            pids = list(self._pids_by_location.get(location_id, ()))
         players: list[tuple[str, PlayerState]] = []
-        # 新版目录结构优先
-        for path in self._root.glob("*/state.json"):
-            pid = path.parent.name
+        for pid in pids:
             if exclude_pid and pid == exclude_pid:
                 continue
             try:
-                data = _json.loads(path.read_text(encoding="utf-8"))
-                state = PlayerState.model_validate(data)
-                if state.current_location == location_id:
-                    players.append((pid, state))
+                state = self.load(pid)
             except Exception:
                 continue
-        # 兼容旧版扁平文件
-        if not players:
-            for opath in self._root.glob("*.json"):
-                pid = opath.stem
-                if exclude_pid and pid == exclude_pid:
-                    continue
+            if state.current_location == location_id:
+                players.append((pid, state))
+        return players
+
+    # ===== 位置索引（location -> player ids） =====
+    def _build_location_index(self) -> None:
+        """启动时全量扫描一次，之后由 save/delete_player/clear_all 增量维护。
+
+        同时登记待迁移的旧布局玩家；同一玩家按 v3 > v2 > v1 的优先级取位置。
+        """
+        found: dict[str, str] = {}
+        flat: set[str] = set()
+        v2: dict[str, Path] = {}
+        for entry in self._root.iterdir():
+            if entry.is_file():
+                if entry.suffix == ".json":
+                    flat.add(entry.stem)
+            elif entry.is_dir() and any((entry / name).exists() for name in self._v2_markers):
+                # 上次迁移在两次 rename 之间中断时，从临时目录继续
+                pid = entry.name.removeprefix(self._staging_prefix)
+                if pid not in v2 or entry.name != pid:
+                    v2[pid] = entry
+        for layout in (
+            [self._legacy_state_path(pid) for pid in flat],
+            [d / "state.json" for d in v2.values()],
+            list(self._root.glob("*/*/*/state.json")),
+        ):
+            for path in layout:
+                pid = path.stem if path.name != "state.json" else path.parent.name.removeprefix(self._staging_prefix)
                 try:
-                    state = self.load(pid)
-                    if state.current_location == location_id:
-                        players.append((pid, state))
+                    found[pid] = decode_state(path.read_bytes(), PlayerState).current_location
                 except Exception:
                     continue
-        return players
+        with self._migrate_lock:
+            self._flat_pids = flat
+            self._v2_dirs = v2
+        with self._index_lock:
+            self._location_of.clear()
+            self._pids_by_location.clear()
+        for pid, location_id in found.items():
+            self._index_location(pid, location_id)
+
+    def _index_location(self, player_id: str, location_id: str) -> None:
+        with self._index_lock:
+            previous = self._location_of.get(player_id)
+            if previous == location_id:
+                return
+            if previous is not None:
+                members = self._pids_by_location.get(previous)
+                if members is not None:
+                    members.discard(player_id)
+                    if not members:
+                        del self._pids_by_location[previous]
+            self._location_of[player_id] = location_id
+            self._pids_by_location.setdefault(location_id, set()).add(player_id)
+
+    def _unindex(self, player_id: str) -> None:
+        with self._index_lock:
+            previous = self._location_of.pop(player_id, None)
+            if previous is None:
+                return
+            members = self._pids_by_location.get(previous)
+            if members is not None:
+                members.discard(player_id)
+                if not members:
+                    del self._pids_by_location[previous]
 
     # ===== 管理工具 =====
     def list_ids(self) -> list[str]:
-        ids: list[str] = []
-        # 新版目录结构
-        for d in self._root.iterdir():
-            if d.is_dir() and (d / "state.json").exists():
-                ids.append(d.name)
-        # 兼容旧版扁平文件
-        for p in self._root.glob("*.json"):
-            pid = p.stem
-            if pid not in ids:
-                ids.append(pid)
-        return ids
+        with self._index_lock:
+            return list(self._location_of)
 
     def delete_player(self, player_id: str) -> None:
-        # 不要通过 _dir_for 创建目录再删，直接定位目录路径
-        d = self._root / player_id
+        d = self._dir_for(player_id)
+        self._log_segments.forget(d / "logs.jsonl")
+        self._command_segments.forget(d / "commands.jsonl")
+        self._unindex(player_id)
+        self._cache.drop(player_id)
+        self._ready_dirs.discard(player_id)
+        with self._migrate_lock:
+            v2_dir = self._v2_dirs.pop(player_id, None)
+            self._flat_pids.discard(player_id)
+        if self._writer is not None:
+            self._writer.discard(under=d)
         try:
-            if d.exists():
-                _shutil.rmtree(d)
-            # 兼容旧版扁平文件
+            # 同时清理尚未迁移的旧布局（v2 目录 / v1 扁平文件）
+            for old in (d, v2_dir):
+                if old is not None and old.is_dir():
+                    _shutil.rmtree(old)
             legacy = self._legacy_state_path(player_id)
             if legacy.exists():
                 legacy.unlink()
@@ -189,6 +537,19 @@ class PlayerStore:
             pass
 
     def clear_all(self) -> None:
+        self._log_segments.clear()
+        self._command_segments.clear()
+        with self._index_lock:
+            self._location_of.clear()
+            self._pids_by_location.clear()
+        with self._migrate_lock:
+            self._v2_dirs.clear()
+            self._flat_pids.clear()
+        self._cache.clear()
+        self._dir_cache.clear()
+        self._ready_dirs.clear()
+        if self._writer is not None:
+            self._writer.discard(under=self._root)
         try:
             if self._root.exists():
                 for entry in self._root.iterdir():
@@ -203,19 +564,96 @@ class PlayerStore:
             pass
 
 
+class WorldIndex:
+    """WorldState 实体的派生索引（节点、邻接、商铺与拍卖行），查询成本与世界规模无关。
+
+    只记录节点下标与字典键，不引用具体对象：写时复制产生的新快照结构不变（节点顺序、
+    商铺/拍卖行键集合相同），同一索引对各版本快照均有效；世界整体替换时由
+    GameRepository 按存储代数重建。
+    """
+
+    def __init__(self, state: WorldState) -> None:
+        nodes = state.map_state.nodes
+        self.node_pos: dict[str, int] = {node.id: pos for pos, node in enumerate(nodes)}
+        self.adjacency: dict[str, frozenset[str]] = {node.id: frozenset(node.connections) for node in nodes}
+        self.routes = RouteTable(self.adjacency)
+        self.spatial = SpatialIndex.from_map(state.map_state)
+        # tile id -> 落在该 tile 内的节点下标
+        self.nodes_by_tile: dict[str, list[int]] = {}
+        for pos, node in enumerate(nodes):
+            tile_id = self.spatial.tile_at(node.coords.x, node.coords.y)
+            if tile_id is not None:
+                self.nodes_by_tile.setdefault(tile_id, []).append(pos)
+        self.shops_by_location: dict[str, list[str]] = {}
+        for key, shop in state.shops.items():
+            self.shops_by_location.setdefault(shop.location_id, []).append(key)
+        # 拍卖行按其 id 查找（字典键可能与 id 不同），记录键以便定位对应片段
+        self.auction_key_by_id: dict[str, str] = {}
+        self.auctions_by_location: dict[str, list[str]] = {}
+        for key, auction in state.auctions.items():
+            self.auction_key_by_id.setdefault(auction.id, key)
+            self.auctions_by_location.setdefault(auction.location_id, []).append(key)
+
+
 class GameRepository:
     """世界状态仓库，负责管理玩家、地图、商店与事件记录。"""
 
     _max_chronicle_entries = 256
     _max_commands = 200
 
-    def __init__(self, store: WorldStateStore) -> None:
+    def __init__(self, store: WorldStateStore, ledger: StockLedger | None = None) -> None:
         self._store = store
+        self._ledger = ledger or StockLedger()
+        self._index: WorldIndex | None = None
+        self._index_key: int | None = None
+        # 地图视图缓存（整图、清单、各 tile）：(存储代数, 地图版本) -> {名称: (ETag, 预序列化 JSON)}
+        self._map_view_key: tuple[int, int] | None = None
+        self._map_payloads: dict[str, tuple[str, bytes]] = {}
 
     # 基础读接口 ------------------------------------------------------------
     def get_state(self) -> WorldState:
+        """当前世界快照（不可变）：一次请求内应只取一次并传给下面各查询方法。"""
         return self._store.state
 
+    def index(self) -> WorldIndex:
+        """返回当前世界的派生索引；世界被整体替换（存储代数变化）后自动重建。"""
+        generation = self._store.generation
+        if self._index is None or self._index_key != generation:
+            self._index = WorldIndex(self._store.state)
+            self._index_key = generation
+        return self._index
+
+    def node(self, node_id: str, state: WorldState | None = None) -> MapNode | None:
+        pos = self.index().node_pos.get(node_id)
+        if pos is None:
+            return None
+        return (state or self.get_state()).map_state.nodes[pos]
+
+    def neighbors(self, node_id: str) -> frozenset[str]:
+        return self.index().adjacency.get(node_id, frozenset())
+
+    def spatial(self) -> SpatialIndex:
+        return self.index().spatial
+
+    def route(self, source: str, target: str) -> list[str] | None:
+        """两节点间的最短路径（节点 id 序列，含两端），不可达时返回 None。"""
+        return self.index().routes.path(source, target)
+
+    def shops_at(self, location_id: str, state: WorldState | None = None) -> list[Shop]:
+        shops = (state or self.get_state()).shops
+        return [shops[key] for key in self.index().shops_by_location.get(location_id, ())]
+
+    def auction_by_id(self, auction_id: str, state: WorldState | None = None) -> tuple[str, AuctionHouse] | None:
+        """按拍卖行 id 查找，返回 (字典键, 拍卖行)。"""
+        key = self.index().auction_key_by_id.get(auction_id)
+        if key is None:
+            return None
+        return key, (state or self.get_state()).auctions[key]
+
+    def auctions_at(self, location_id: str, state: WorldState | None = None) -> list[AuctionHouse]:
+        auctions = (state or self.get_state()).auctions
+        return [auctions[key] for key in self.index().auctions_by_location.get(location_id, ())]
+
     def get_profile(self) -> PlayerProfile:
         return self.get_state().player.profile
 
@@ -278,27 +716,37 @@ class GameRepository:
             tags=["指令", location_name],
         )
 
-        state.command_history.insert(0, command)
-        del state.command_history[self._max_commands :]
-
-        state.chronicle_logs.insert(0, chronicle)
-        del state.chronicle_logs[self._max_chronicle_entries :]
+        def change(current: WorldState) -> WorldState:
+            return current.model_copy(
+                update={
+                    "command_history": [command, *current.command_history[: self._max_commands - 1]],
+                    "chronicle_logs": self._prepend_chronicle(current, chronicle),
+                }
+            )
 
-        self._store.update_state(state)
+        self._store.update(change, sections=["command_history", "chronicle_logs"])
         return command, chronicle
 
     def append_event(self, event: ChronicleLog) -> None:
-        state = self.get_state()
-        state.chronicle_logs.insert(0, event)
-        del state.chronicle_logs[self._max_chronicle_entries :]
-        self._store.update_state(state)
+        self._store.update(
+            lambda current: current.model_copy(update={"chronicle_logs": self._prepend_chronicle(current, event)}),
+            sections=["chronicle_logs"],
+        )
+
+    def _prepend_chronicle(self, state: WorldState, entry: ChronicleLog) -> List[ChronicleLog]:
+        return [entry, *state.chronicle_logs[: self._max_chronicle_entries - 1]]
+
+    def _update_player(
+        self, change: Callable[[PlayerState], PlayerState], sections: Iterable[str] = ()
+    ) -> WorldState:
+        """写时复制地更新主角模板（位于 meta 片段，随每次保存写入）。"""
+        return self._store.update(
+            lambda current: current.model_copy(update={"player": change(current.player)}),
+            sections=sections,
+        )
 
     # 位置与地图 ------------------------------------------------------------
-    def get_map_view(self) -> dict:
-        state = self.get_state()
-        visible_nodes = [node for node in state.map_state.nodes if node.discovered]
-        visible_ids = {node.id for node in visible_nodes}
-        # 生成更丰富的渲染样式
+    def _map_style(self, state: WorldState) -> dict:
         style = state.map_state.style.model_dump()
         # 默认样式 + 可由状态内 extras 覆盖
         defaults = {
@@ -320,55 +768,132 @@ class GameRepository:
         )
 
         # 不自动生成 tiles。AI-only 模式下，tiles/tiling 必须由 AI 在 style.extras 中提供。
+        return style
 
+    @staticmethod
+    def _edge_type(a_cat: str, b_cat: str) -> str:
         # 为边增加类型，便于前端按样式绘制
-        node_map = {n.id: n for n in visible_nodes}
-        def _edge_type(a_cat: str, b_cat: str) -> str:
-            pair = {a_cat, b_cat}
-            if "secret_realm" in pair:
-                return "realm_path"
-            if "trail" in pair:
-                return "trail"
-            return "road"
+        pair = {a_cat, b_cat}
+        if "secret_realm" in pair:
+            return "realm_path"
+        if "trail" in pair:
+            return "trail"
+        return "road"
 
+    def _edges_from(self, sources: Iterable[MapNode], state: WorldState) -> list[dict]:
+        """sources 中各节点指向已发现节点的边。"""
         edges = []
-        for node in visible_nodes:
-            for target in node.connections:
-                if target in visible_ids:
-                    etype = _edge_type(node.category, node_map[target].category)
-                    edges.append({"from": node.id, "to": target, "type": etype})
+        for node in sources:
+            for target_id in node.connections:
+                target = self.node(target_id, state)
+                if target is not None and target.discovered:
+                    edges.append({"from": node.id, "to": target_id, "type": self._edge_type(node.category, target.category)})
+        return edges
 
+    def get_map_view(self) -> dict:
+        state = self.get_state()
+        visible_nodes = [node for node in state.map_state.nodes if node.discovered]
+        style = self._map_style(state)
+        edges = self._edges_from(visible_nodes, state)
         return {"style": style, "nodes": [n.model_dump() for n in visible_nodes], "edges": edges}
+
+    def _cached_map_payload(self, name: str, build: Callable[[], BaseModel | None]) -> tuple[str, bytes] | None:
+        """地图类视图缓存：(存储代数, 地图版本) 变化后整体失效；返回 (强 ETag, 预序列化 JSON)。
+
+        build 返回 None（如不存在的 tile）时不缓存：tile id 来自客户端，缓存未命中会让条目随请求无限增长。
+        """
+        key = (self._store.generation, self._store.map_version)
+        if self._map_view_key != key:
+            self._map_payloads = {}
+            self._map_view_key = key
+        cached = self._map_payloads.get(name)
+        if cached is not None:
+            return cached
+        model = build()
+        if model is None:
+            return None
+        body = model.model_dump_json().encode("utf-8")
+        cached = (f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"', body)
+        self._map_payloads[name] = cached
+        return cached
+
+    def get_map_view_encoded(self) -> tuple[str, bytes]:
+        """返回 (强 ETag, 预序列化的 MapViewResponse JSON)；仅在地图版本变化后重新计算。"""
+        return self._cached_map_payload("view", lambda: MapViewResponse(**self.get_map_view()))
+
+    def get_map_manifest(self) -> MapTileManifestResponse:
+        """分块地图清单：全局样式（不含 tiles）与各 tile 的范围及已发现节点数。"""
+        state = self.get_state()
+        index = self.index()
+        style = self._map_style(state)
+        tiles = style.pop("tiles", None) or []
+        summaries = []
+        for tile in tiles:
+            if not isinstance(tile, dict) or "id" not in tile:
+                continue
+            positions = index.nodes_by_tile.get(str(tile["id"]), ())
+            summaries.append(
+                MapTileSummary(
+                    id=str(tile["id"]),
+                    bbox=tile.get("bbox") or {},
+                    node_count=sum(1 for pos in positions if state.map_state.nodes[pos].discovered),
+                )
+            )
+        return MapTileManifestResponse(style=style, tiles=summaries)
+
+    def get_map_tile(self, tile_id: str) -> MapTileResponse | None:
+        """单个 tile 的已发现节点、区域多边形与出入该 tile 的边（跨界边另一端附于 boundary_nodes）。"""
+        state = self.get_state()
+        index = self.index()
+        extras = state.map_state.style.extras or {}
+        tile = next(
+            (t for t in extras.get("tiles") or () if isinstance(t, dict) and str(t.get("id")) == tile_id),
+            None,
+        )
+        if tile is None:
+            return None
+        nodes = [state.map_state.nodes[pos] for pos in index.nodes_by_tile.get(tile_id, ())]
+        nodes = [node for node in nodes if node.discovered]
+        inside = {node.id for node in nodes}
+        edges = self._edges_from(nodes, state)
+        boundary = {e["to"] for e in edges if e["to"] not in inside}
+        return MapTileResponse(
+            tile=tile,
+            nodes=[MapNodeView(**n.model_dump()) for n in nodes],
+            edges=edges,
+            boundary_nodes=[MapNodeView(**self.node(node_id, state).model_dump()) for node_id in sorted(boundary)],
+        )
+
+    def get_map_manifest_encoded(self) -> tuple[str, bytes]:
+        return self._cached_map_payload("manifest", self.get_map_manifest)
+
+    def get_map_tile_encoded(self, tile_id: str) -> tuple[str, bytes] | None:
+        return self._cached_map_payload(f"tile:{tile_id}", lambda: self.get_map_tile(tile_id))
 
     def get_current_location_node(self):
         state = self.get_state()
-        return next(
-            (node for node in state.map_state.nodes if node.id == state.player.current_location),
-            None,
-        )
+        return self.node(state.player.current_location, state)
 
     def travel_to(self, location_id: str) -> PlayerProfile:
         state = self.get_state()
-        node = next((n for n in state.map_state.nodes if n.id == location_id), None)
+        node = self.node(location_id, state)
         if not node:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="未知地点")
         current = state.player.current_location
-        current_node = next((n for n in state.map_state.nodes if n.id == current), None)
-        if current_node and location_id not in current_node.connections:
+        if self.node(current, state) and location_id not in self.neighbors(current):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无法直接前往该地点")
-        node.discovered = True
-        state.player.current_location = location_id
-        self._store.update_state(state)
+        if not node.discovered:
+            self._store.apply(NodeDiscovered(node_id=node.id))
+        state = self._update_player(lambda player: player.model_copy(update={"current_location": location_id}))
         return state.player.profile
 
     # 商店与拍卖 ------------------------------------------------------------
     def list_shops_for_current_location(self) -> List[Shop]:
         state = self.get_state()
-        current = state.player.current_location
-        return [shop for shop in state.shops.values() if shop.location_id == current]
+        return self.shops_at(state.player.current_location, state)
 
-    def get_shop(self, shop_id: str) -> Shop:
-        state = self.get_state()
+    def get_shop(self, shop_id: str, state: WorldState | None = None) -> Shop:
+        state = state or self.get_state()
         shop = state.shops.get(shop_id)
         if not shop:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="未找到商铺")
@@ -378,55 +903,143 @@ class GameRepository:
 
     def list_auctions_for_current_location(self) -> AuctionHouse | None:
         state = self.get_state()
-        current = state.player.current_location
-        for auction in state.auctions.values():
-            if auction.location_id == current:
-                return auction
-        return None
+        auctions = self.auctions_at(state.player.current_location, state)
+        return auctions[0] if auctions else None
+
+    # 库存预留 ------------------------------------------------------------
+    # 商品库存与拍品以共享账本（StockLedger）为准：世界快照中的库存只作为首次登记的初始值，
+    # 成交后仍通过 StockDelta/LotRemoved 同步本进程的快照，供展示与持久化。
+    @property
+    def ledger(self) -> StockLedger:
+        return self._ledger
+
+    @staticmethod
+    def _shop_key(shop: Shop, item_id: str) -> str:
+        return f"shop/{shop.id}/{item_id}"
+
+    @staticmethod
+    def _lot_key(auction: AuctionHouse, lot_id: str) -> str:
+        return f"auction/{auction.id}/{lot_id}"
+
+    def shop_stock(self, shop: Shop, state: WorldState | None = None) -> dict[str, tuple[int, int]]:
+        """商品 id -> (实时库存, 版本)。"""
+        state = state or self.get_state()
+        initial = {self._shop_key(shop, item.id): item.stock for item in shop.inventory}
+        live = self._ledger.snapshot(state.world_id, initial)
+        return {item.id: live[self._shop_key(shop, item.id)] for item in shop.inventory}
+
+    def open_lots(self, auction: AuctionHouse, state: WorldState | None = None) -> list[AuctionLot]:
+        """尚未售出的拍品（其他进程成交的拍品在本进程快照中可能仍在列）。"""
+        state = state or self.get_state()
+        initial = {self._lot_key(auction, lot.id): 1 for lot in auction.listings}
+        live = self._ledger.snapshot(state.world_id, initial)
+        return [lot for lot in auction.listings if live[self._lot_key(auction, lot.id)][0] > 0]
+
+    def reserve_shop_stock(
+        self,
+        shop: Shop,
+        item: ShopItem,
+        quantity: int,
+        expected_version: int | None = None,
+        state: WorldState | None = None,
+    ) -> tuple[int, int]:
+        """原子扣减商品库存，返回 (剩余库存, 新版本)。
+
+        expected_version 给出时按比较并交换执行：版本不符返回 409，客户端应刷新后重试；
+        不给出时只要库存足够即可成交（热门商品并发购买无需重试）。
+        """
+        state = state or self.get_state()
+        try:
+            return self._ledger.reserve(
+                state.world_id, self._shop_key(shop, item.id), quantity, item.stock, expected_version
+            )
+        except StockConflictError:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="库存已变化，请刷新后重试")
+        except OutOfStockError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="库存不足")
+
+    def release_shop_stock(self, shop: Shop, item: ShopItem, quantity: int, state: WorldState | None = None) -> None:
+        state = state or self.get_state()
+        self._ledger.release(state.world_id, self._shop_key(shop, item.id), quantity)
+
+    def reserve_auction_lot(self, auction: AuctionHouse, lot: AuctionLot, state: WorldState | None = None) -> None:
+        """拍品以库存 1 登记，只有一个买家能预留成功。"""
+        state = state or self.get_state()
+        try:
+            self._ledger.reserve(state.world_id, self._lot_key(auction, lot.id), 1, 1)
+        except OutOfStockError:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="拍品已售出")
+
+    def release_auction_lot(self, auction: AuctionHouse, lot: AuctionLot, state: WorldState | None = None) -> None:
+        state = state or self.get_state()
+        self._ledger.release(state.world_id, self._lot_key(auction, lot.id), 1)
+
+    def prune_stock(self) -> None:
+        """清理账本中其他世界遗留的条目（启动时调用）。"""
+        if self._store.has_state():
+            self._ledger.prune(self.get_state().world_id)
 
     # 购买与背包 ------------------------------------------------------------
     def get_inventory(self):
         return list(self.get_state().player.inventory)
 
-    def _add_inventory(self, item_id: str, name: str, category: str, quantity: int, description: str) -> None:
-        state = self.get_state()
-        # 若同 id 物品存在则叠加数量
-        for entry in state.player.inventory:
-            if entry.id == item_id:
-                entry.quantity += quantity
-                self._store.update_state(state)
-                return
-        # 否则新增条目
+    def _credit_purchase(
+        self,
+        player: PlayerState,
+        cost: int,
+        item_id: str,
+        name: str,
+        category: str,
+        quantity: int,
+        description: str,
+    ) -> PlayerState:
+        """返回扣费并入背包后的主角副本（不修改传入的 player）。"""
         from .world_state import InventoryEntry  # 局部导入避免循环
-        state.player.inventory.append(
-            InventoryEntry(
-                id=item_id,
-                name=name,
-                category=category,
-                quantity=quantity,
-                description=description,
+
+        if player.spirit_stones < cost:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="灵石不足，无法购买")
+
+        inventory = list(player.inventory)
+        # 若同 id 物品存在则叠加数量，否则新增条目
+        for pos, entry in enumerate(inventory):
+            if entry.id == item_id:
+                inventory[pos] = entry.model_copy(update={"quantity": entry.quantity + quantity})
+                break
+        else:
+            inventory.append(
+                InventoryEntry(
+                    id=item_id,
+                    name=name,
+                    category=category,
+                    quantity=quantity,
+                    description=description,
+                )
             )
+        return player.model_copy(update={"spirit_stones": player.spirit_stones - cost, "inventory": inventory})
+
+    def _commit_purchase(self, credit: Callable[[PlayerState], PlayerState], chronicle: ChronicleLog) -> None:
+        self._store.update(
+            lambda current: current.model_copy(
+                update={
+                    "player": credit(current.player),
+                    "chronicle_logs": self._prepend_chronicle(current, chronicle),
+                }
+            ),
+            sections=["chronicle_logs"],
         )
-        self._store.update_state(state)
 
     def purchase_from_shop(self, shop_id: str, item_id: str, quantity: int) -> int:
         if quantity <= 0:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="数量必须大于 0")
         state = self.get_state()
-        shop = self.get_shop(shop_id)
+        shop = self.get_shop(shop_id, state)
         item = next((x for x in shop.inventory if x.id == item_id), None)
         if not item:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="商品不存在")
-        if item.stock < quantity:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="库存不足")
         total_price = item.price * quantity
         if state.player.spirit_stones < total_price:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="灵石不足，无法购买")
-        # 扣费、减库存、入背包
-        state.player.spirit_stones -= total_price
-        item.stock -= quantity
-        self._add_inventory(item.id, item.name, item.category, quantity, item.description)
-        # 记录事件
+        self.reserve_shop_stock(shop, item, quantity, state=state)
         now = datetime.now(UTC)
         chronicle = ChronicleLog(
             id=f"shop-{now.strftime('%Y%m%d%H%M%S')}-{item.id}",
@@ -435,14 +1048,23 @@ class GameRepository:
             summary=f"在商铺购入 {quantity} × {item.name}，花费 {total_price} 灵石。",
             tags=["交易", "商铺"],
         )
-        state.chronicle_logs.insert(0, chronicle)
-        del state.chronicle_logs[self._max_chronicle_entries :]
-        self._store.update_state(state)
+        try:
+            self._commit_purchase(
+                lambda player: self._credit_purchase(
+                    player, total_price, item.id, item.name, item.category, quantity, item.description
+                ),
+                chronicle,
+            )
+        except Exception:
+            self.release_shop_stock(shop, item, quantity, state)
+            raise
+        # 同步本进程快照中的库存（预写日志）
+        self._store.apply(StockDelta(shop_id=shop_id, item_id=item.id, delta=-quantity))
         return total_price
 
     def buyout_auction_lot(self, auction_id: str, lot_id: str) -> int:
         state = self.get_state()
-        auction = next((a for a in state.auctions.values() if a.id == auction_id), None)
+        auction_key, auction = self.auction_by_id(auction_id, state) or (None, None)
         if not auction:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="未找到拍卖行")
         if auction.location_id != state.player.current_location:
@@ -455,11 +1077,7 @@ class GameRepository:
         price = lot.buyout_price
         if state.player.spirit_stones < price:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="灵石不足，无法买断")
-        # 扣费、移除拍品、入背包
-        state.player.spirit_stones -= price
-        auction.listings = [l for l in auction.listings if l.id != lot_id]
-        self._add_inventory(lot.id, lot.lot_name, lot.category, 1, lot.description)
-        # 记录事件
+        self.reserve_auction_lot(auction, lot, state)
         now = datetime.now(UTC)
         chronicle = ChronicleLog(
             id=f"auction-{now.strftime('%Y%m%d%H%M%S')}-{lot.id}",
@@ -468,9 +1086,18 @@ class GameRepository:
             summary=f"在拍卖行以 {price} 灵石一口价购得 {lot.lot_name}。",
             tags=["交易", "拍卖"],
         )
-        state.chronicle_logs.insert(0, chronicle)
-        del state.chronicle_logs[self._max_chronicle_entries :]
-        self._store.update_state(state)
+        try:
+            self._commit_purchase(
+                lambda player: self._credit_purchase(
+                    player, price, lot.id, lot.lot_name, lot.category, 1, lot.description
+                ),
+                chronicle,
+            )
+        except Exception:
+            self.release_auction_lot(auction, lot, state)
+            raise
+        # 同步本进程快照：移除拍品（预写日志）
+        self._store.apply(LotRemoved(auction_id=auction_key, lot_id=lot_id))
         return price
 
     # 升阶资格 ------------------------------------------------------------
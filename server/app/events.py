@@ -1,46 +1,371 @@
 from __future__ import annotations
 
 import asyncio
-from collections import defaultdict
-from typing import Any, Iterable, Set
+import contextlib
+import itertools
+import logging
+import os
+import secrets
+from collections import OrderedDict, defaultdict, deque
+from typing import Any, Callable, Iterable
 
 from fastapi import WebSocket
+from pydantic_core import to_json
+
+from .broker_transport import LocalTransport, UnixSocketTransport, transport_from_environment
+
+
+logger = logging.getLogger("lingyan.events")
+
+OVERFLOW_POLICIES = ("drop_oldest", "disconnect")
+# 默认保留重放缓冲的频道前缀（频道名等于前缀或以 "前缀:" 开头）
+REPLAY_CHANNELS = ("chronicles",)
+# 续传游标字段由 broker 统一下发，可重放频道上广播的载荷中不得自带
+_CURSOR_FIELDS = frozenset({"seq", "epoch"})
+
+
+def encode_event(payload: Any) -> bytes:
+    """把载荷（Pydantic 模型、dict 等）编码为 JSON 字节；bytes 视为已编码，原样返回。"""
+    if isinstance(payload, bytes):
+        return payload
+    return to_json(payload)
+
+
+class _ReplayBuffer:
+    """单个频道最近 size 条已发布消息（已带 seq 的文本帧），供断线重连补发。
+
+    epoch 标识这条序号流：进程重启、频道缓冲被淘汰重建后 epoch 改变，旧游标随之失效。
+    """
+
+    __slots__ = ("epoch", "seq", "frames")
+
+    def __init__(self, epoch: str, size: int) -> None:
+        self.epoch = epoch
+        self.seq = 0
+        self.frames: deque[tuple[int, str]] = deque(maxlen=size)
+
+    def append(self, data: bytes) -> str:
+        self.seq += 1
+        # 在已编码的 JSON 对象开头插入 seq，避免为每个序号重新编码载荷
+        head = b'{"seq":%d' % self.seq
+        body = head + (b"," + data[1:] if data[1:2] != b"}" else b"}")
+        text = body.decode("utf-8")
+        self.frames.append((self.seq, text))
+        return text
+
+    def since(self, seq: int) -> list[str] | None:
+        """返回 seq 之后的全部消息；游标超前或缺口已滚出缓冲时返回 None。"""
+        if seq > self.seq:
+            return None
+        oldest = self.frames[0][0] if self.frames else self.seq + 1
+        if seq < oldest - 1:
+            return None
+        return [text for n, text in self.frames if n > seq]
+
+
+def batch_frame(messages: list[str]) -> str:
+    """把多条已编码消息拼接为一个批量帧 {"type":"batch","events":[...]}，不重新编码。"""
+    return '{"type":"batch","events":[' + ",".join(messages) + "]}"
+
+
+class _Connection:
+    """单个 WebSocket 的出站队列与写协程：broadcast 只入队，发送在写协程中按序进行。
+
+    队列中是已编码的文本帧，同一条广播的所有连接共享同一个字符串对象。
+    batch 为 True（客户端选择接收批量帧）时，写协程在 batch_window 内或攒够 batch_max 条后
+    把积压的消息合并为一个批量帧发送；只有一条时仍按原格式发送。
+    """
+
+    def __init__(
+        self,
+        broker: "MultiChannelEventBroker",
+        channel: str,
+        websocket: WebSocket,
+        batch: bool = False,
+    ) -> None:
+        self.channel = channel
+        self.websocket = websocket
+        self.batch = batch
+        self._broker = broker
+        self._queue: deque[str] = deque()
+        self._ready = asyncio.Event()
+        self._full = asyncio.Event()
+        self._closed = False
+        self.task: asyncio.Task | None = None
+
+    def offer(self, message: str) -> bool:
+        """入队；队列已满时按溢出策略丢弃最旧消息或断开连接。返回连接是否仍然有效。"""
+        if self._closed:
+            return False
+        if len(self._queue) >= self._broker.queue_size:
+            if self._broker.overflow_policy == "disconnect":
+                self._broker._stats["overflow_disconnects"] += 1
+                self.abort()
+                return False
+            self._queue.popleft()
+            self._broker._stats["dropped"] += 1
+        self._queue.append(message)
+        self._ready.set()
+        if self.batch and len(self._queue) >= self._broker.batch_max:
+            self._full.set()
+        return True
+
+    def abort(self) -> None:
+        """停止发送并关闭连接（由写协程完成关闭，调用方不阻塞）。"""
+        self._closed = True
+        self._queue.clear()
+        self._ready.set()
+        self._full.set()
+
+    async def run(self) -> None:
+        timeout = self._broker.send_timeout
+        try:
+            while True:
+                await self._ready.wait()
+                if self._closed:
+                    break
+                if not self._queue:
+                    self._ready.clear()
+                    continue
+                if self.batch:
+                    message = await self._next_batch()
+                    if message is None:
+                        break
+                else:
+                    message = self._queue.popleft()
+                try:
+                    await asyncio.wait_for(self.websocket.send_text(message), timeout)
+                except asyncio.TimeoutError:
+                    self._broker._stats["send_timeouts"] += 1
+                    logger.info("websocket on %s timed out after %.1fs, disconnecting", self.channel, timeout)
+                    break
+                except Exception:
+                    break
+        finally:
+            self._closed = True
+            await self._broker._forget(self)
+            with contextlib.suppress(Exception):
+                await asyncio.wait_for(self.websocket.close(code=1013), timeout)
+
+    async def _next_batch(self) -> str | None:
+        """等待合并窗口（攒够 batch_max 条立即结束），取出至多 batch_max 条组成一帧。"""
+        broker = self._broker
+        if broker.batch_window > 0 and len(self._queue) < broker.batch_max:
+            self._full.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._full.wait(), broker.batch_window)
+        if self._closed:
+            return None
+        count = min(len(self._queue), broker.batch_max)
+        if count == 1:
+            return self._queue.popleft()
+        broker._stats["batches"] += 1
+        broker._stats["batched_events"] += count
+        return batch_frame([self._queue.popleft() for _ in range(count)])
 
 
 class MultiChannelEventBroker:
-    """管理多频道 WebSocket 连接并广播消息。"""
+    """管理多频道 WebSocket 连接并广播消息。
+
+    broadcast 经由可替换的传输层发布：默认进程内直接投递；多 worker 部署时使用
+    UnixSocketTransport，在各进程间转发后再投递给本进程持有的连接。
+
+    载荷在 broadcast 中只编码一次（跨进程转发时也不重新编码），各连接发送同一文本帧。
+
+    可重放频道（replay_channels）上的每条 JSON 对象消息在投递时获得该频道单调递增的 seq，
+    并保存在容量为 replay_size 的环形缓冲中（即使本进程暂无订阅者）；客户端重连时带上
+    since/epoch 即只补发缺失的消息，缺口已滚出缓冲或 epoch 不符时才回退为完整快照。
+    多 worker 部署下各进程按 hub 转发顺序独立编号，epoch 按进程区分，连到其他 worker 时回退快照。
+
+    投递只把消息放入各连接自己的有界队列并立即返回，由每个连接的写协程负责发送：
+    慢客户端只会拖慢自己；单条发送超过 send_timeout 即断开，队列满时按 overflow_policy
+    丢弃最旧消息（drop_oldest）或断开该连接（disconnect）。
+
+    连接时 batch=True 的客户端改为接收批量帧：在 batch_window 秒内（或攒够 batch_max 条）到达的消息
+    合并为一帧 {"type":"batch","events":[...]}，事件高峰时显著减少帧数与系统调用。
+    """
 
-    def __init__(self) -> None:
-        self._channels: dict[str, Set[WebSocket]] = defaultdict(set)
+    def __init__(
+        self,
+        transport: LocalTransport | UnixSocketTransport | None = None,
+        queue_size: int = 256,
+        send_timeout: float = 5.0,
+        overflow_policy: str = "drop_oldest",
+        replay_size: int = 128,
+        replay_channels: Iterable[str] = REPLAY_CHANNELS,
+        max_replay_buffers: int = 4096,
+        batch_window: float = 0.025,
+        batch_max: int = 32,
+    ) -> None:
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy {overflow_policy!r}")
+        self._channels: dict[str, dict[WebSocket, _Connection]] = defaultdict(dict)
         self._lock = asyncio.Lock()
+        self._transport = transport or LocalTransport()
+        self._transport.bind(self._deliver)
+        self.queue_size = max(1, queue_size)
+        self.send_timeout = send_timeout
+        self.overflow_policy = overflow_policy
+        self.replay_size = max(0, replay_size)
+        self._replay_channels = tuple(replay_channels)
+        self._max_replay_buffers = max(1, max_replay_buffers)
+        self._replay: OrderedDict[str, _ReplayBuffer] = OrderedDict()
+        self.batch_window = max(0.0, batch_window)
+        self.batch_max = max(1, batch_max)
+        self._epoch = secrets.token_hex(6)
+        self._buffer_ids = itertools.count(1)
+        self._stats = {
+            "dropped": 0,
+            "overflow_disconnects": 0,
+            "send_timeouts": 0,
+            "resumed": 0,
+            "replayed": 0,
+            "resume_fallbacks": 0,
+            "batches": 0,
+            "batched_events": 0,
+        }
+
+    @classmethod
+    def from_environment(cls) -> "MultiChannelEventBroker":
+        """EVENT_SEND_QUEUE（默认 256）、EVENT_SEND_TIMEOUT_S（默认 5）、EVENT_OVERFLOW_POLICY（默认 drop_oldest）、
+        EVENT_REPLAY_BUFFER（每频道重放条数，默认 128，0 关闭）、
+        EVENT_BATCH_WINDOW_MS（批量合并窗口，默认 25 毫秒）、EVENT_BATCH_MAX（每帧最多条数，默认 32）。"""
+        policy = os.environ.get("EVENT_OVERFLOW_POLICY", "drop_oldest").strip().lower()
+        if policy not in OVERFLOW_POLICIES:
+            logger.warning("unknown event overflow policy %s, using drop_oldest", policy)
+            policy = "drop_oldest"
+        return cls(
+            transport_from_environment(),
+            queue_size=int(os.environ.get("EVENT_SEND_QUEUE", "256")),
+            send_timeout=float(os.environ.get("EVENT_SEND_TIMEOUT_S", "5")),
+            overflow_policy=policy,
+            replay_size=int(os.environ.get("EVENT_REPLAY_BUFFER", "128")),
+            batch_window=float(os.environ.get("EVENT_BATCH_WINDOW_MS", "25")) / 1000,
+            batch_max=int(os.environ.get("EVENT_BATCH_MAX", "32")),
+        )
+
+    @property
+    def transport(self) -> LocalTransport | UnixSocketTransport:
+        return self._transport
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            **self._transport.stats(),
+            "channels": len(self._channels),
+            "connections": sum(len(c) for c in self._channels.values()),
+            "queued": sum(len(conn._queue) for c in self._channels.values() for conn in c.values()),
+            "replay_buffers": len(self._replay),
+            **self._stats,
+        }
+
+    async def start(self) -> None:
+        await self._transport.start()
+
+    async def close(self) -> None:
+        await self._transport.close()
+        async with self._lock:
+            connections = [conn for c in self._channels.values() for conn in c.values()]
+        for conn in connections:
+            conn.abort()
+
+    def replayable(self, channel: str) -> bool:
+        return self.replay_size > 0 and any(
+            channel == prefix or channel.startswith(prefix + ":") for prefix in self._replay_channels
+        )
 
     async def connect(
         self,
         channel: str,
         websocket: WebSocket,
         first_messages: Iterable[Any] | None = None,
-    ) -> None:
+        *,
+        since: int | None = None,
+        epoch: str | None = None,
+        snapshot: Callable[[int | None, str | None], Any] | None = None,
+        batch: bool = False,
+    ) -> bool:
+        """接入连接。first_messages 先于之后的广播发出；batch 为 True 时该连接接收批量帧。
+
+        可重放频道上若 since/epoch 与缓冲匹配，则只补发 since 之后的消息并返回 True；
+        否则发送 snapshot(seq, epoch) 的结果（seq/epoch 为当前游标，客户端据此续传）并返回 False。
+        补发或快照与登记连接在同一临界区内完成，期间到达的广播不会丢失或重复。
+        """
         await websocket.accept()
-        if first_messages:
-            for message in first_messages:
-                await websocket.send_json(message)
+        conn = _Connection(self, channel, websocket, batch=batch)
+        for message in first_messages or ():
+            conn.offer(encode_event(message).decode("utf-8"))
+        resumed = False
         async with self._lock:
-            self._channels[channel].add(websocket)
+            buffer = self._replay_buffer(channel) if self.replayable(channel) else None
+            missed = None
+            if buffer is not None and since is not None and epoch == buffer.epoch:
+                missed = buffer.since(since)
+            if missed is not None:
+                resumed = True
+                self._stats["resumed"] += 1
+                self._stats["replayed"] += len(missed)
+                for text in missed:
+                    conn.offer(text)
+            else:
+                if since is not None:
+                    self._stats["resume_fallbacks"] += 1
+                if snapshot is not None:
+                    cursor = (buffer.seq, buffer.epoch) if buffer is not None else (None, None)
+                    conn.offer(encode_event(snapshot(*cursor)).decode("utf-8"))
+            self._channels[channel][websocket] = conn
+        conn.task = asyncio.create_task(conn.run())
+        return resumed
+
+    def _replay_buffer(self, channel: str) -> _ReplayBuffer:
+        """取得（必要时创建）频道的重放缓冲；超过 max_replay_buffers 时淘汰最久未活动的频道。调用方持有锁。"""
+        buffer = self._replay.get(channel)
+        if buffer is None:
+            buffer = _ReplayBuffer(f"{self._epoch}-{next(self._buffer_ids)}", self.replay_size)
+            self._replay[channel] = buffer
+            while len(self._replay) > self._max_replay_buffers:
+                self._replay.popitem(last=False)
+        else:
+            self._replay.move_to_end(channel)
+        return buffer
 
     async def disconnect(self, channel: str, websocket: WebSocket) -> None:
         async with self._lock:
-            sockets = self._channels.get(channel)
-            if not sockets:
-                return
-            sockets.discard(websocket)
-            if not sockets:
+            conns = self._channels.get(channel)
+            conn = conns.pop(websocket, None) if conns else None
+            if conns is not None and not conns:
                 self._channels.pop(channel, None)
+        if conn is not None:
+            conn.abort()
 
     async def broadcast(self, channel: str, payload: Any) -> None:
+        """payload 可为 Pydantic 模型、JSON 兼容值或已编码的 bytes。
+
+        可重放频道上编码时剔除顶层 seq/epoch（如广播的快照模型），由投递时插入的 seq 为准；
+        已编码的 bytes 须自行保证不含这两个字段。
+        """
+        if isinstance(payload, bytes) or not self.replayable(channel):
+            data = encode_event(payload)
+        else:
+            data = to_json(payload, exclude=_CURSOR_FIELDS)
+        await self._transport.publish(channel, data)
+
+    async def _deliver(self, channel: str, data: bytes) -> None:
+        """投递给本进程内订阅该频道的连接（只入队，不等待发送）。"""
+        async with self._lock:
+            targets = list(self._channels.get(channel, {}).values())
+            if data[:1] == b"{" and self.replayable(channel):
+                text = self._replay_buffer(channel).append(data)
+            elif targets:
+                text = data.decode("utf-8")
+            else:
+                return
+        for conn in targets:
+            conn.offer(text)
+
+    async def _forget(self, conn: _Connection) -> None:
         async with self._lock:
-            targets = list(self._channels.get(channel, set()))
-        for websocket in targets:
-            try:
-                await websocket.send_json(payload)
-            except Exception:
-                await self.disconnect(channel, websocket)
+            conns = self._channels.get(conn.channel)
+            if conns is not None and conns.get(conn.websocket) is conn:
+                del conns[conn.websocket]
+                if not conns:
+                    self._channels.pop(conn.channel, None)
@@ -7,10 +7,14 @@ import os
 
 from .ai import GeminiClient
 from .prompts import INIT_WORLD_PROMPT
+from .spatial import SpatialIndex, check_tile_coverage, tile_bbox
 from .world_state import WorldState, WorldStateStore
 
 logger = logging.getLogger("lingyan.world.initializer")
 
+# 校验失败时错误信息中最多列出的问题区域数（总数照常报告）
+_MAX_REPORTED_ISSUES = 20
+
 
 class WorldInitializer:
     def __init__(self, store: WorldStateStore, gemini: GeminiClient) -> None:
@@ -26,6 +30,13 @@ class WorldInitializer:
             "on",
         }
 
+    # tile_grid 每轴允许的最大格数（下限固定为 2）
+    def tile_grid_max(self) -> int:
+        try:
+            return max(2, int(os.environ.get("MAP_TILE_GRID_MAX", "6")))
+        except ValueError:
+            return 6
+
     async def ensure_world_loaded(self) -> None:
         if self._store.has_state():
             return
@@ -114,71 +125,29 @@ class WorldInitializer:
             raise RuntimeError("缺少 tile_grid/tiles，AI 需完整生成可拼接地图配置")
         cols = int(grid.get("cols", 0))
         rows = int(grid.get("rows", 0))
-        if cols < 2 or rows < 2 or cols > 6 or rows > 6:
-            raise RuntimeError("tile_grid.cols/rows 必须在 2..6 范围内")
-
-        # 3) tiles 覆盖与不重叠校验
-        # 3.1 矩形严格重叠检测（边界接触不算重叠）
-        def _bbox(t):
-            b = t.get("bbox") or {}
-            return (
-                t.get("id", "<unknown>"),
-                float(b.get("x0", -1)),
-                float(b.get("y0", -1)),
-                float(b.get("x1", -1)),
-                float(b.get("y1", -1)),
-            )
-
-        rects = [_bbox(t) for t in tiles]
-        for idx_a in range(len(rects)):
-            id_a, ax0, ay0, ax1, ay1 = rects[idx_a]
-            if not (0.0 <= ax0 < ax1 <= 1.0 and 0.0 <= ay0 < ay1 <= 1.0):
-                raise RuntimeError(f"tile {id_a} 的 bbox 越界或无效")
-            for idx_b in range(idx_a + 1, len(rects)):
-                id_b, bx0, by0, bx1, by1 = rects[idx_b]
-                # 开区间重叠：边界重合不算
-                overlap_x = ax0 < bx1 and ax1 > bx0
-                overlap_y = ay0 < by1 and ay1 > by0
-                # 若仅在边或点接触（ax1==bx0 或 ay1==by0）不算重叠。
-                touch_x = ax1 == bx0 or bx1 == ax0
-                touch_y = ay1 == by0 or by1 == ay0
-                if overlap_x and overlap_y and not (touch_x or touch_y):
-                    raise RuntimeError(f"tiles 存在重叠区域：{id_a} 与 {id_b}")
-
-        # 3.2 采样覆盖校验（避免空白区域）。为避免边界双计，采用半开区间判断。
-        N = 24
-        eps = 1e-9
-        def _contains_half_open(t, x, y):
-            b = t.get("bbox") or {}
-            x0 = float(b.get("x0", -1))
-            y0 = float(b.get("y0", -1))
-            x1 = float(b.get("x1", -1))
-            y1 = float(b.get("y1", -1))
-            # 半开区间：左上包含，右下排除（避免边界双计）。
-            return (x0 - eps) <= x < (x1 - eps) and (y0 - eps) <= y < (y1 - eps)
-
-        for i in range(N + 1):
-            for j in range(N + 1):
-                # 将 1.0 轻微内缩，避免采样落在右/下边界造成无归属
-                x = i / N
-                y = j / N
-                if abs(x - 1.0) < eps:
-                    x = 1.0 - 2 * eps
-                if abs(y - 1.0) < eps:
-                    y = 1.0 - 2 * eps
-                hit = 0
-                for t in tiles:
-                    if _contains_half_open(t, x, y):
-                        hit += 1
-                        if hit > 1:
-                            # 由于半开区间策略，命中>1 仍然意味着实质重叠
-                            ids = [tt.get("id", "<unknown>") for tt in tiles if _contains_half_open(tt, x, y)]
-                            raise RuntimeError(f"tiles 存在重叠区域（采样点 {x:.3f},{y:.3f}）：{ids}")
-                if hit == 0:
-                    raise RuntimeError(f"tiles 未完全覆盖全图（采样点 {x:.3f},{y:.3f} 无归属）")
+        grid_max = self.tile_grid_max()
+        if cols < 2 or rows < 2 or cols > grid_max or rows > grid_max:
+            raise RuntimeError(f"tile_grid.cols/rows 必须在 2..{grid_max} 范围内")
+
+        # 3) tiles 覆盖与不重叠校验：坐标压缩 + 二维差分精确计算覆盖次数，一次报告全部问题区域
+        for t in tiles:
+            bbox = tile_bbox(t) if isinstance(t, dict) else None
+            if bbox is None or not (0.0 <= bbox[0] < bbox[2] <= 1.0 and 0.0 <= bbox[1] < bbox[3] <= 1.0):
+                tile_id = t.get("id", "<unknown>") if isinstance(t, dict) else "<unknown>"
+                raise RuntimeError(f"tile {tile_id} 的 bbox 越界或无效")
+        issues = check_tile_coverage(tiles)
+        if issues:
+            gaps = [i.describe() for i in issues if i.kind == "gap"]
+            overlaps = [i.describe() for i in issues if i.kind == "overlap"]
+            parts = []
+            if overlaps:
+                parts.append(f"tiles 存在 {len(overlaps)} 处重叠区域：" + "；".join(overlaps[:_MAX_REPORTED_ISSUES]))
+            if gaps:
+                parts.append(f"tiles 未完全覆盖全图，{len(gaps)} 处空白：" + "；".join(gaps[:_MAX_REPORTED_ISSUES]))
+            raise RuntimeError("；".join(parts))
 
         # 4) 每个节点必须落在某个 tile 中
+        spatial = SpatialIndex.from_map(state.map_state)
         for n in nodes:
-            inside = any(_contains_half_open(t, n.coords.x, n.coords.y) for t in tiles)
-            if not inside:
+            if spatial.tile_at(n.coords.x, n.coords.y) is None:
                 raise RuntimeError(f"节点 {n.id} 未落在任何 tile bbox 内")
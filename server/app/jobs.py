@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Iterable, TypeVar
+from uuid import uuid4
+
+logger = logging.getLogger("lingyan.jobs")
+
+ItemT = TypeVar("ItemT")
+ResultT = TypeVar("ResultT")
+
+
+class Job:
+    """后台任务的进度记录（供 /admin/jobs/{job_id} 查询）。"""
+
+    def __init__(self, kind: str) -> None:
+        self.id = uuid4().hex
+        self.kind = kind
+        self.status = "pending"
+        self.total = 0
+        self.processed = 0
+        self.changed = 0
+        self.failed = 0
+        self.error: str | None = None
+        self.created_at = time.time()
+        self.finished_at: float | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "total": self.total,
+            "processed": self.processed,
+            "changed": self.changed,
+            "failed": self.failed,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobRegistry:
+    """后台任务登记处：在事件循环中运行任务协程，阻塞的存储 IO 交给共享线程池。
+
+    - 只保留最近 ``history`` 个任务的进度，旧记录按创建顺序淘汰；
+    - run_batched 将条目按批次并发处理，每批结束后回调一次（用于合并通知）。
+    """
+
+    def __init__(self, workers: int = 8, history: int = 32) -> None:
+        self._workers = max(1, workers)
+        self._history = history
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._executor: ThreadPoolExecutor | None = None
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def start(self, kind: str, run: Callable[[Job], Awaitable[None]]) -> Job:
+        job = Job(kind)
+        self._jobs[job.id] = job
+        while len(self._jobs) > self._history:
+            oldest = next(iter(self._jobs.values()))
+            if not oldest.done:
+                break
+            self._jobs.popitem(last=False)
+        job._task = asyncio.get_running_loop().create_task(self._execute(job, run))
+        return job
+
+    async def wait(self, job: Job) -> None:
+        if job._task is not None:
+            await asyncio.shield(job._task)
+
+    async def run_in_pool(self, fn: Callable[..., ResultT], *args: Any) -> ResultT:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="admin-job")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def run_batched(
+        self,
+        job: Job,
+        items: Iterable[ItemT],
+        handle: Callable[[ItemT], Awaitable[ResultT | None]],
+        batch_size: int,
+        on_batch: Callable[[list[ResultT]], Awaitable[None]] | None = None,
+    ) -> None:
+        """按批处理条目：批内并发执行 handle，返回非 None 的结果视为有变更并交给 on_batch。"""
+        pending = list(items)
+        job.total = len(pending)
+        for start in range(0, len(pending), max(1, batch_size)):
+            batch = pending[start : start + batch_size]
+            outcomes = await asyncio.gather(*(handle(item) for item in batch), return_exceptions=True)
+            results: list[ResultT] = []
+            for item, outcome in zip(batch, outcomes):
+                if isinstance(outcome, BaseException):
+                    job.failed += 1
+                    logger.warning("job %s item %r failed: %s", job.id, item, outcome)
+                elif outcome is not None:
+                    results.append(outcome)
+            job.processed += len(batch)
+            job.changed += len(results)
+            if on_batch is not None and results:
+                await on_batch(results)
+
+    async def close(self) -> None:
+        for job in list(self._jobs.values()):
+            if job._task is not None and not job._task.done():
+                await asyncio.shield(job._task)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def _execute(self, job: Job, run: Callable[[Job], Awaitable[None]]) -> None:
+        job.status = "running"
+        try:
+            await run(job)
+        except Exception as exc:
+            logger.exception("job %s (%s) failed", job.id, job.kind)
+            job.status = "failed"
+            job.error = str(exc)
+        else:
+            job.status = "succeeded"
+        finally:
+            job.finished_at = time.time()
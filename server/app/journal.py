@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import TYPE_CHECKING, Annotated, Literal, Union
+
+from pydantic import BaseModel, Field, TypeAdapter
+
+# 变更的 apply 均为写时复制：返回新的 WorldState，只复制被改动路径上的对象，
+# 其余部分与旧快照共享，旧快照本身保持不变。
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .world_state import WorldState
+
+logger = logging.getLogger("lingyan.world.journal")
+
+
+class StockDelta(BaseModel):
+    """商铺商品库存变化（购买为负数）。"""
+
+    type: Literal["stock_delta"] = "stock_delta"
+    seq: int = 0
+    shop_id: str
+    item_id: str
+    delta: int
+
+    @property
+    def section(self) -> str:
+        return f"shops/{self.shop_id}"
+
+    def apply(self, state: WorldState) -> WorldState:
+        shop = state.shops.get(self.shop_id)
+        if shop is None or not any(x.id == self.item_id for x in shop.inventory):
+            return state
+        inventory = [
+            x.model_copy(update={"stock": max(0, x.stock + self.delta)}) if x.id == self.item_id else x
+            for x in shop.inventory
+        ]
+        shop = shop.model_copy(update={"inventory": inventory})
+        return state.model_copy(update={"shops": {**state.shops, self.shop_id: shop}})
+
+
+class LotRemoved(BaseModel):
+    """拍品下架（一口价成交）。"""
+
+    type: Literal["lot_removed"] = "lot_removed"
+    seq: int = 0
+    auction_id: str
+    lot_id: str
+
+    @property
+    def section(self) -> str:
+        return f"auctions/{self.auction_id}"
+
+    def apply(self, state: WorldState) -> WorldState:
+        auction = state.auctions.get(self.auction_id)
+        if auction is None:
+            return state
+        listings = [lot for lot in auction.listings if lot.id != self.lot_id]
+        auction = auction.model_copy(update={"listings": listings})
+        return state.model_copy(update={"auctions": {**state.auctions, self.auction_id: auction}})
+
+
+class NodeDiscovered(BaseModel):
+    """地图节点被发现。"""
+
+    type: Literal["node_discovered"] = "node_discovered"
+    seq: int = 0
+    node_id: str
+
+    @property
+    def section(self) -> str:
+        return "map"
+
+    def apply(self, state: WorldState) -> WorldState:
+        nodes = state.map_state.nodes
+        for pos, node in enumerate(nodes):
+            if node.id == self.node_id:
+                if node.discovered:
+                    return state
+                nodes = [*nodes[:pos], node.model_copy(update={"discovered": True}), *nodes[pos + 1 :]]
+                map_state = state.map_state.model_copy(update={"nodes": nodes})
+                return state.model_copy(update={"map_state": map_state})
+        return state
+
+
+WorldMutation = Annotated[Union[StockDelta, LotRemoved, NodeDiscovered], Field(discriminator="type")]
+_mutation_adapter: TypeAdapter[WorldMutation] = TypeAdapter(WorldMutation)
+
+
+class WorldJournal:
+    """世界变更预写日志（JSONL，每行一条带 seq 的类型化变更）。
+
+    - append 只把一行写入操作系统（不 fsync），成本与世界规模无关；
+    - fsync 为组提交：后台线程在 window 秒后对窗口内的全部追加做一次 fsync，
+      append 返回的 Future 在该次 fsync 之后完成。调用方（请求处理）等待 Future 后再确认，
+      事件循环线程不会因刷盘阻塞。代价：变更在 fsync 前已对其他读者可见，
+      此时崩溃会丢失尚未确认给任何客户端的变更；
+    - 启动时 read(after) 取出快照之后的变更重放；
+    - 快照落盘后 truncate(upto) 丢弃已折叠的前缀（临时文件 + rename）。
+    """
+
+    def __init__(self, path: Path, fsync: bool = True, window: float = 0.0) -> None:
+        self._path = path
+        self._fsync = fsync
+        self._window = window
+        self._lock = threading.Lock()
+        self._count: int | None = None
+        self._ready = False
+        self._fh = None
+        # 已写入、尚未 fsync 的追加所属批次；后台线程 fsync 后完成
+        self._unsynced: Future[None] | None = None
+        self._sync_wakeup = threading.Condition(self._lock)
+        self._sync_thread: threading.Thread | None = None
+        self._syncs = 0
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def append(self, mutation: BaseModel) -> Future[None] | None:
+        """追加一条变更；开启 fsync 时返回该行落盘后完成的 Future，否则返回 None。"""
+        line = mutation.model_dump_json().encode("utf-8") + b"\n"
+        with self._lock:
+            if not self._ready:
+                self._prepare_for_append()
+            if self._fh is None:
+                self._fh = open(self._path, "ab", buffering=0)
+            self._fh.write(line)
+            if self._count is not None:
+                self._count += 1
+            if not self._fsync:
+                return None
+            if self._unsynced is None:
+                self._unsynced = Future()
+                if self._sync_thread is None:
+                    self._sync_thread = threading.Thread(target=self._sync_loop, name="journal-sync", daemon=True)
+                    self._sync_thread.start()
+                self._sync_wakeup.notify()
+            return self._unsynced
+
+    def sync(self) -> None:
+        """立即 fsync 已追加的内容（关闭服务、测试）。"""
+        self._sync_once()
+
+    def syncs(self) -> int:
+        return self._syncs
+
+    def _sync_loop(self) -> None:
+        while True:
+            with self._lock:
+                while self._unsynced is None:
+                    self._sync_wakeup.wait()
+            # 等待窗口期，让更多追加共享这一次 fsync
+            if self._window > 0:
+                time.sleep(self._window)
+            self._sync_once()
+
+    def _sync_once(self) -> None:
+        # 在锁内复制文件描述符，fsync 在锁外进行，追加不会被刷盘阻塞
+        with self._lock:
+            done, self._unsynced = self._unsynced, None
+            fd = os.dup(self._fh.fileno()) if self._fh is not None and done is not None else None
+        if done is None:
+            return
+        try:
+            if fd is not None:
+                os.fsync(fd)
+        except OSError as exc:
+            logger.exception("journal fsync failed")
+            done.set_exception(exc)
+        else:
+            self._syncs += 1
+            done.set_result(None)
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def _close_handle_locked(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def read(self, after: int = 0) -> list[WorldMutation]:
+        with self._lock:
+            return [m for m in self._read_all() if m.seq > after]
+
+    def truncate(self, upto: int) -> None:
+        """丢弃 seq <= upto 的记录。"""
+        with self._lock:
+            keep = [m for m in self._read_all() if m.seq > upto]
+            # 保留的记录随新文件一同 fsync；旧句柄关闭，之后的追加写入新文件
+            self._close_handle_locked()
+            if not keep:
+                try:
+                    self._path.unlink()
+                except FileNotFoundError:
+                    pass
+                self._count = 0
+                self._ready = False
+                return
+            tmp = self._path.with_name(self._path.name + ".tmp")
+            with open(tmp, "wb") as fh:
+                for m in keep:
+                    fh.write(m.model_dump_json().encode("utf-8") + b"\n")
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp, self._path)
+            self._count = len(keep)
+
+    def size(self) -> int:
+        with self._lock:
+            if self._count is None:
+                self._count = len(self._read_all())
+            return self._count
+
+    def reset(self) -> None:
+        """日志文件已被外部删除（清空存档）时重置计数。"""
+        with self._lock:
+            self._close_handle_locked()
+            self._count = 0
+            self._ready = False
+
+    def _prepare_for_append(self) -> None:
+        """首次追加前创建目录，并为崩溃时被截断的末行补上换行，避免与新行粘连。"""
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(self._path, "rb+") as fh:
+                fh.seek(0, os.SEEK_END)
+                if fh.tell() > 0:
+                    fh.seek(-1, os.SEEK_END)
+                    if fh.read(1) != b"\n":
+                        fh.write(b"\n")
+        except FileNotFoundError:
+            pass
+        self._ready = True
+
+    def _read_all(self) -> list[WorldMutation]:
+        try:
+            raw = self._path.read_bytes()
+        except FileNotFoundError:
+            return []
+        items: list[WorldMutation] = []
+        for line in raw.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(_mutation_adapter.validate_json(line))
+            except Exception:
+                # 末行可能因崩溃被截断，忽略无法解析的行
+                continue
+        return items
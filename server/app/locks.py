@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+
+class _KeyedEntry:
+    __slots__ = ("lock", "users")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class KeyedLocks:
+    """按 key 串行化读-改-写区段的 asyncio 锁池。
+
+    - 每个 key（玩家 id、``shop:<id>``、``auction:<id>`` 等）独占一把锁，按需创建，
+      无持有者/等待者时立即回收；不同 key 之间永不争用（区别于固定条带的哈希冲突）。
+    - 记录获取次数、发生等待的次数与等待耗时，便于观察负载下的争用情况。
+    """
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._entries: dict[str, _KeyedEntry] = {}
+        self._acquisitions = 0
+        self._contended = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[None]:
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _KeyedEntry()
+        entry.users += 1
+        try:
+            if entry.lock.locked():
+                started = time.perf_counter()
+                await entry.lock.acquire()
+                waited = time.perf_counter() - started
+                self._contended += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            else:
+                await entry.lock.acquire()
+            self._acquisitions += 1
+            try:
+                yield
+            finally:
+                entry.lock.release()
+        finally:
+            entry.users -= 1
+            if entry.users == 0 and self._entries.get(key) is entry:
+                del self._entries[key]
+
+    def stats(self) -> dict[str, float | int | str]:
+        return {
+            "name": self._name,
+            "active_keys": len(self._entries),
+            "acquisitions": self._acquisitions,
+            "contended": self._contended,
+            "wait_total_ms": round(self._wait_total * 1000, 3),
+            "wait_max_ms": round(self._wait_max * 1000, 3),
+        }
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
+from concurrent.futures import Future
 from contextlib import asynccontextmanager
+import asyncio
+import json
 import logging
 from typing import List
 from datetime import UTC, datetime
@@ -10,13 +13,19 @@ import uuid
 import re
 
 from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect, Request, Response
-from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 
 from .ai import GeminiClient
 from .data import GameRepository, MemoryRepository, PlayerStore
-from .events import MultiChannelEventBroker
+from .events import MultiChannelEventBroker, encode_event
 from .initializer import WorldInitializer
+from .jobs import Job, JobRegistry
+from .journal import LotRemoved, StockDelta
+from .locks import KeyedLocks
+from .persistence import GroupCommitWriter
+from .player_sqlite import SqlitePlayerStore
+from .segments import CursorExpiredError
+from .stock import StockLedger
 from .schemas import (
     AscensionChallenge,
     AuctionHouseResponse,
@@ -29,6 +38,10 @@ from .schemas import (
     Companion,
     EventBroadcastRequest,
     MapNodeView,
+    MapPointResponse,
+    MapTileManifestResponse,
+    MapTileResponse,
+    MapViewportResponse,
     MapViewResponse,
     MemoryAppendRequest,
     MemoryRecord,
@@ -46,8 +59,10 @@ from .schemas import (
     WalletResponse,
     TravelRequest,
     TravelResponse,
+    TravelRouteRequest,
+    TravelRouteResponse,
 )
-from .world_state import WorldStateStore, PlayerState
+from .world_state import AuctionHouse, PlayerState, Shop, WorldStateStore
 from .prompts import INIT_PLAYER_PROMPT
 
 logger = logging.getLogger("lingyan.server")
@@ -78,22 +93,110 @@ def _load_env_from_file(env_path: Path) -> None:
         logging.getLogger("lingyan.server").debug(".env load skipped/failed", exc_info=True)
 
 
+def _cached_json(request: Request, cached: tuple[str, bytes]) -> Response:
+    """返回预序列化的 JSON 与 ETag；客户端携带匹配的 If-None-Match 时返回 304。"""
+    etag, body = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match 比较（弱比较，允许 W/ 前缀与逗号分隔的多个值）。"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+async def _committed(commit: Future[None] | None) -> None:
+    """等待组提交批次落盘后再响应：已确认给玩家的写入在崩溃后不会丢失。"""
+    if commit is not None:
+        await asyncio.wrap_future(commit)
+
+
+def _batch_requested(values: list[str] | None) -> bool:
+    """WebSocket 查询参数 batch=1/true/yes/on 表示客户端接收批量帧。"""
+    return bool(values) and values[-1].strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _open_player_store(server_dir: Path, writer: GroupCommitWriter) -> PlayerStore | SqlitePlayerStore:
+    """按 PLAYER_STORE_BACKEND 选择玩家存储后端：file（默认，开发用）或 sqlite。
+
+    首次启用 sqlite 且库为空时，自动从 players/ 目录结构导入现有玩家。
+    """
+    cache_size = int(os.environ.get("PLAYER_CACHE_SIZE", "1024"))
+    players_dir = server_dir / "players"
+    backend = os.environ.get("PLAYER_STORE_BACKEND", "file").strip().lower()
+    if backend != "sqlite":
+        return PlayerStore(players_dir, cache_size=cache_size, writer=writer)
+    db_path = Path(os.environ.get("PLAYER_DB_PATH") or server_dir / "players.sqlite3")
+    sqlite_store = SqlitePlayerStore(db_path, cache_size=cache_size)
+    if not sqlite_store.list_ids() and players_dir.exists():
+        migrated = sqlite_store.migrate_from_directory(PlayerStore(players_dir, cache_size=0))
+        if migrated:
+            logger.info("migrated %d players from %s into %s", migrated, players_dir, db_path)
+    return sqlite_store
+
+
 def create_app() -> FastAPI:
     # 优先加载 server/.env 以配置 GEMINI_API_KEY 等
     _load_env_from_file(Path(__file__).resolve().parent.parent / ".env")
-    store = WorldStateStore()
+    # 组提交窗口：窗口内对同一文件的多次保存只落盘一次
+    writer = GroupCommitWriter(window=float(os.environ.get("PERSIST_COMMIT_WINDOW_MS", "20")) / 1000.0)
+    store = WorldStateStore(writer=writer)
     gemini = GeminiClient.from_environment()
     initializer = WorldInitializer(store, gemini)
-    repository = GameRepository(store)
+    # 商铺库存与拍品的共享账本（SQLite，可被多个工作进程共用）
+    ledger = StockLedger(Path(os.environ.get("STOCK_LEDGER_PATH") or Path(__file__).resolve().parent.parent / "stock.sqlite3"))
+    repository = GameRepository(store, ledger)
     memory_repository = MemoryRepository()
-    broker = MultiChannelEventBroker()
-    players = PlayerStore(Path(__file__).resolve().parent.parent / "players")
+    broker = MultiChannelEventBroker.from_environment()
+    # 读-改-写区段按玩家 pid 串行化；世界库存由账本原子扣减，不再加商铺/拍卖行锁
+    player_locks = KeyedLocks("player")
+    players = _open_player_store(Path(__file__).resolve().parent.parent, writer)
+    # 管理类后台任务（如世界重建后的玩家迁移）：批内并发，存储 IO 在线程池执行
+    jobs = JobRegistry(workers=int(os.environ.get("ADMIN_JOB_WORKERS", "8")))
+    job_batch_size = int(os.environ.get("ADMIN_JOB_BATCH_SIZE", "64"))
+
+    compact_interval = float(os.environ.get("WORLD_COMPACT_INTERVAL_S", "30"))
+
+    async def _compact_world_periodically() -> None:
+        """后台压缩：定期把世界预写日志折叠进分段快照。"""
+        while True:
+            await asyncio.sleep(compact_interval)
+            if not store.journal_size():
+                continue
+            try:
+                await asyncio.to_thread(store.compact)
+            except Exception:
+                logger.exception("world journal compaction failed")
 
     @asynccontextmanager
     async def lifespan(app: FastAPI):
         # 在应用生命周期启动时确保世界数据已加载
         await initializer.ensure_world_loaded()
+        await asyncio.to_thread(repository.prune_stock)
+        await broker.start()
+        # 旧目录布局的玩家在后台迁移到分片目录；未迁移者在首次访问时单独迁移
+        migration = None
+        if isinstance(players, PlayerStore) and players.pending_migrations():
+            migration = asyncio.create_task(asyncio.to_thread(players.migrate_layout))
+        compactor = asyncio.create_task(_compact_world_periodically())
         yield
+        compactor.cancel()
+        await broker.close()
+        if migration is not None:
+            await migration
+        await jobs.close()
+        # 关闭前将世界变更日志折叠进快照，并排空组提交队列
+        await asyncio.to_thread(store.compact)
+        writer.flush()
+        ledger.close()
 
     app = FastAPI(title="LingYan TianJi API", version="0.4.0", lifespan=lifespan)
 
@@ -103,6 +206,10 @@ def create_app() -> FastAPI:
     app.state.gemini_client = gemini
     app.state.world_initializer = initializer
     app.state.player_store = players
+    app.state.persistence_writer = writer
+    app.state.player_locks = player_locks
+    app.state.jobs = jobs
+    app.state.stock_ledger = ledger
 
     # 重要：当 allow_credentials=True 时，CORS 不允许 "*"。否则浏览器会直接拦截并显示 status=null。
     # 这里改为基于正则放行本地开发来源（localhost/127.0.0.1 任意端口）。
@@ -128,6 +235,17 @@ def create_app() -> FastAPI:
             "hint": "若 available=false，请检查 .env 中 GEMINI_API_KEY、网络/地区与模型名是否受支持。",
         }
 
+    @app.get("/diagnose/storage")
+    async def diagnose_storage() -> dict:
+        return {
+            "player_cache": players.cache_info(),
+            "pending_layout_migrations": players.pending_migrations() if isinstance(players, PlayerStore) else 0,
+            "group_commit": writer.stats(),
+            "world_journal": store.journal_size(),
+            "locks": [player_locks.stats()],
+            "event_broker": broker.stats(),
+        }
+
     @app.get("/whoami")
     async def whoami(request: Request, response: Response) -> dict[str, str]:
         pid = request.cookies.get("player_id")
@@ -141,203 +259,212 @@ def create_app() -> FastAPI:
     async def health_check() -> dict[str, str]:
         return {"status": "ok", "message": "DaoCore 连接成功。"}
 
-    @app.get("/profile", response_model=PlayerProfile)
-    async def get_profile(request: Request, response: Response) -> PlayerProfile:
+    async def _initialize_player(pid: str) -> None:
+        """首次进入时生成玩家存档与“初试事件”；调用方须持有该玩家的 player_locks 并已确认存档不存在。"""
         players: PlayerStore = app.state.player_store
-        pid = request.cookies.get("player_id")
-        if not pid:
-            import uuid
-            pid = uuid.uuid4().hex
-            response.set_cookie("player_id", pid, httponly=True, samesite="lax")
-        if not players.exists(pid):
-            # 首次进入：完全由 AI 生成玩家数据（不同设备→使用 pid 作为签名引导差异化），并生成“初试事件”
-            gemini_client: GeminiClient = app.state.gemini_client
-            if not gemini_client.available:
-                raise HTTPException(status_code=503, detail="AI 未就绪，无法生成角色数据；请配置 .env/GEMINI_API_KEY 或访问 /diagnose/ai 排查。")
-
-            # 若世界在运行期被清空（如 /admin/purge?rebuild=false），尝试自动重建
-            try:
-                world = repository.get_state()
-            except RuntimeError:
-                ok = False
-                try:
-                    ok = await initializer.regenerate_world_via_ai()
-                except Exception as e:
-                    raise HTTPException(status_code=503, detail=f"世界未初始化，且自动重建失败：{e}")
-                if not ok:
-                    raise HTTPException(status_code=503, detail="世界未初始化，且自动重建失败：请使用 /admin/purge?rebuild=true 或检查 AI 配置")
-                world = repository.get_state()
-            node_ids = [n.id for n in world.map_state.nodes]
-            # 提供精简节点清单给 AI 选择合法起点
-            nodes_brief = "\n".join([f"- {n.id}" for n in world.map_state.nodes])
-            # 注意：INIT_PLAYER_PROMPT 内含大量 JSON 花括号，避免使用 str.format 造成 KeyError
-            prompt = (
-                INIT_PLAYER_PROMPT
-                .replace("{nodes_brief}", nodes_brief)
-                .replace("{seed_hint}", pid[:12])
-            )
+        # 首次进入：完全由 AI 生成玩家数据（不同设备→使用 pid 作为签名引导差异化），并生成“初试事件”
+        gemini_client: GeminiClient = app.state.gemini_client
+        if not gemini_client.available:
+            raise HTTPException(status_code=503, detail="AI 未就绪，无法生成角色数据；请配置 .env/GEMINI_API_KEY 或访问 /diagnose/ai 排查。")
 
-            # 生成并解析 PlayerState JSON
-            text = await gemini_client.generate_player_state_text(prompt)
-            if not text:
-                raise HTTPException(status_code=503, detail="AI 未返回玩家数据")
-
-            def _extract_json(s: str) -> str:
-                s = s.strip()
-                if s.startswith("{") and s.endswith("}"):
-                    return s
-                a, b = s.find("{"), s.rfind("}")
-                if a == -1 or b == -1:
-                    raise ValueError("AI 返回不含 JSON")
-                return s[a : b + 1]
-
-            import json as _json
+        # 若世界在运行期被清空（如 /admin/purge?rebuild=false），尝试自动重建
+        try:
+            world = repository.get_state()
+        except RuntimeError:
+            ok = False
             try:
-                parsed = _json.loads(_extract_json(text))
+                ok = await initializer.regenerate_world_via_ai()
             except Exception as e:
-                raise HTTPException(status_code=503, detail=f"玩家数据解析失败：{e}")
-
-            def _slug(s: str, prefix: str) -> str:
-                s = (s or "").strip()
-                base = re.sub(r"[^a-zA-Z0-9]+", "_", s).strip("_").lower() or prefix
-                return f"{prefix}_{base}"[:48]
-
-            def _ensure_int(x, default: int = 0) -> int:
-                try:
-                    if isinstance(x, bool):
-                        return default
-                    return int(x)
-                except Exception:
-                    return default
+                raise HTTPException(status_code=503, detail=f"世界未初始化，且自动重建失败：{e}")
+            if not ok:
+                raise HTTPException(status_code=503, detail="世界未初始化，且自动重建失败：请使用 /admin/purge?rebuild=true 或检查 AI 配置")
+            await asyncio.to_thread(repository.prune_stock)
+            world = repository.get_state()
+        node_ids = [n.id for n in world.map_state.nodes]
+        # 提供精简节点清单给 AI 选择合法起点
+        nodes_brief = "\n".join([f"- {n.id}" for n in world.map_state.nodes])
+        # 注意：INIT_PLAYER_PROMPT 内含大量 JSON 花括号，避免使用 str.format 造成 KeyError
+        prompt = (
+            INIT_PLAYER_PROMPT
+            .replace("{nodes_brief}", nodes_brief)
+            .replace("{seed_hint}", pid[:12])
+        )
 
-            def _normalize_player_state(data: dict, node_ids: list[str], pid: str) -> dict:
-                out: dict = {}
-                prof = data.get("profile") or {}
-                # 基本档案
-                name = prof.get("name") or "无名"
-                out_profile = {
-                    "id": prof.get("id") or f"p_{pid[:8]}",
-                    "name": name,
-                    "realm": str(prof.get("realm") or "凡人九品"),
-                    "guild": prof.get("guild") or "",
-                    "faction_reputation": prof.get("faction_reputation") or {},
-                    "attributes": prof.get("attributes") or {},
-                }
-                # techniques: 允许 dict{name: mastery}
-                tech = prof.get("techniques")
-                tech_list = []
-                if isinstance(tech, list):
-                    for t in tech:
-                        if not isinstance(t, dict):
-                            continue
-                        tname = t.get("name") or t.get("id") or "无名术"
-                        tech_list.append({
-                            "id": t.get("id") or _slug(tname, "tech"),
-                            "name": tname,
-                            "type": t.get("type") or "support",
-                            "mastery": _ensure_int(t.get("mastery"), 1),
-                            "synergies": t.get("synergies") or [],
-                        })
-                elif isinstance(tech, dict):
-                    for tname, lvl in tech.items():
-                        tech_list.append({
-                            "id": _slug(str(tname), "tech"),
-                            "name": str(tname),
-                            "type": "support",
-                            "mastery": _ensure_int(lvl, 1),
-                            "synergies": [],
-                        })
-                out_profile["techniques"] = tech_list
-                out_profile["achievements"] = prof.get("achievements") or []
-                ap = prof.get("ascension_progress") or {}
-                out_profile["ascension_progress"] = {
-                    "stage": ap.get("stage") or str(prof.get("realm") or "凡人九品"),
-                    "score": _ensure_int(ap.get("score"), 0),
-                    "next_milestone": ap.get("next_milestone") or "炼气一阶",
-                }
-                out["profile"] = out_profile
-
-                # 位置
-                loc = data.get("current_location")
-                if isinstance(loc, dict):
-                    loc = loc.get("id")
-                if not isinstance(loc, str) or not loc:
-                    loc = node_ids[0] if node_ids else ""
-                out["current_location"] = loc
-
-                # 资源、血量
-                out["spirit_stones"] = _ensure_int(data.get("spirit_stones"), 20)
-                out["blood_percent"] = _ensure_int(data.get("blood_percent"), 100)
-
-                # 背包
-                inv = data.get("inventory") or []
-                inv_list = []
-                if isinstance(inv, list):
-                    for it in inv:
-                        if not isinstance(it, dict):
-                            continue
-                        iname = it.get("name") or "无名物"
-                        cat = it.get("category") or it.get("type") or "杂物"
-                        inv_list.append({
-                            "id": it.get("id") or _slug(iname, "item"),
-                            "name": iname,
-                            "category": str(cat),
-                            "quantity": _ensure_int(it.get("quantity"), 1),
-                            "description": str(it.get("description") or ""),
-                        })
-                out["inventory"] = inv_list
-                return out
+        # 生成并解析 PlayerState JSON
+        text = await gemini_client.generate_player_state_text(prompt)
+        if not text:
+            raise HTTPException(status_code=503, detail="AI 未返回玩家数据")
+
+        def _extract_json(s: str) -> str:
+            s = s.strip()
+            if s.startswith("{") and s.endswith("}"):
+                return s
+            a, b = s.find("{"), s.rfind("}")
+            if a == -1 or b == -1:
+                raise ValueError("AI 返回不含 JSON")
+            return s[a : b + 1]
+
+        import json as _json
+        try:
+            parsed = _json.loads(_extract_json(text))
+        except Exception as e:
+            raise HTTPException(status_code=503, detail=f"玩家数据解析失败：{e}")
+
+        def _slug(s: str, prefix: str) -> str:
+            s = (s or "").strip()
+            base = re.sub(r"[^a-zA-Z0-9]+", "_", s).strip("_").lower() or prefix
+            return f"{prefix}_{base}"[:48]
 
+        def _ensure_int(x, default: int = 0) -> int:
             try:
-                normalized = _normalize_player_state(parsed, node_ids, pid)
-                pstate = PlayerState.model_validate(normalized)
-            except Exception as e:
-                raise HTTPException(status_code=503, detail=f"玩家数据解析失败：{e}")
+                if isinstance(x, bool):
+                    return default
+                return int(x)
+            except Exception:
+                return default
+
+        def _normalize_player_state(data: dict, node_ids: list[str], pid: str) -> dict:
+            out: dict = {}
+            prof = data.get("profile") or {}
+            # 基本档案
+            name = prof.get("name") or "无名"
+            out_profile = {
+                "id": prof.get("id") or f"p_{pid[:8]}",
+                "name": name,
+                "realm": str(prof.get("realm") or "凡人九品"),
+                "guild": prof.get("guild") or "",
+                "faction_reputation": prof.get("faction_reputation") or {},
+                "attributes": prof.get("attributes") or {},
+            }
+            # techniques: 允许 dict{name: mastery}
+            tech = prof.get("techniques")
+            tech_list = []
+            if isinstance(tech, list):
+                for t in tech:
+                    if not isinstance(t, dict):
+                        continue
+                    tname = t.get("name") or t.get("id") or "无名术"
+                    tech_list.append({
+                        "id": t.get("id") or _slug(tname, "tech"),
+                        "name": tname,
+                        "type": t.get("type") or "support",
+                        "mastery": _ensure_int(t.get("mastery"), 1),
+                        "synergies": t.get("synergies") or [],
+                    })
+            elif isinstance(tech, dict):
+                for tname, lvl in tech.items():
+                    tech_list.append({
+                        "id": _slug(str(tname), "tech"),
+                        "name": str(tname),
+                        "type": "support",
+                        "mastery": _ensure_int(lvl, 1),
+                        "synergies": [],
+                    })
+            out_profile["techniques"] = tech_list
+            out_profile["achievements"] = prof.get("achievements") or []
+            ap = prof.get("ascension_progress") or {}
+            out_profile["ascension_progress"] = {
+                "stage": ap.get("stage") or str(prof.get("realm") or "凡人九品"),
+                "score": _ensure_int(ap.get("score"), 0),
+                "next_milestone": ap.get("next_milestone") or "炼气一阶",
+            }
+            out["profile"] = out_profile
+
+            # 位置
+            loc = data.get("current_location")
+            if isinstance(loc, dict):
+                loc = loc.get("id")
+            if not isinstance(loc, str) or not loc:
+                loc = node_ids[0] if node_ids else ""
+            out["current_location"] = loc
+
+            # 资源、血量
+            out["spirit_stones"] = _ensure_int(data.get("spirit_stones"), 20)
+            out["blood_percent"] = _ensure_int(data.get("blood_percent"), 100)
+
+            # 背包
+            inv = data.get("inventory") or []
+            inv_list = []
+            if isinstance(inv, list):
+                for it in inv:
+                    if not isinstance(it, dict):
+                        continue
+                    iname = it.get("name") or "无名物"
+                    cat = it.get("category") or it.get("type") or "杂物"
+                    inv_list.append({
+                        "id": it.get("id") or _slug(iname, "item"),
+                        "name": iname,
+                        "category": str(cat),
+                        "quantity": _ensure_int(it.get("quantity"), 1),
+                        "description": str(it.get("description") or ""),
+                    })
+            out["inventory"] = inv_list
+            return out
 
-            # 兜底：若 current_location 非法，则回退为首个已知节点
-            if not pstate.current_location or pstate.current_location not in node_ids:
-                pstate.current_location = node_ids[0] if node_ids else world.player.current_location
+        try:
+            normalized = _normalize_player_state(parsed, node_ids, pid)
+            pstate = PlayerState.model_validate(normalized)
+        except Exception as e:
+            raise HTTPException(status_code=503, detail=f"玩家数据解析失败：{e}")
 
-            # 保存到独立玩家存档
-            players.save(pid, pstate)
+        # 兜底：若 current_location 非法，则回退为首个已知节点
+        if not pstate.current_location or repository.node(pstate.current_location) is None:
+            pstate.current_location = node_ids[0] if node_ids else world.player.current_location
 
-            # 生成“初试事件”，写入世界编年史并广播（标签含“初试事件”）
-            try:
-                loc = next((n for n in world.map_state.nodes if n.id == pstate.current_location), None)
-                location_name = loc.name if loc else pstate.current_location
-                summary = await gemini_client.generate_initial_event_summary(
-                    player_name=pstate.profile.name,
-                    realm=pstate.profile.realm,
-                    guild=pstate.profile.guild,
-                    location_name=location_name,
-                    seed_hint=pid,
-                )
-            except Exception:
-                summary = None
-            from datetime import UTC, datetime as _dt
-            if not summary:
-                summary = (
-                    f"命轮初启。{pstate.profile.name} 出身凡俗（{pstate.profile.realm}，{pstate.profile.guild}），"
-                    f"初临 {location_name}。此时机缘若隐，风物有兆，心念所向，尚需自择其途。汝当如何抉择？"
-                )
-            ev = ChronicleLog(
-                id=f"init-{_dt.now(UTC).strftime('%Y%m%d%H%M%S')}-{pid[:6]}",
-                title=f"命轮初启 · {pstate.profile.name}",
-                timestamp=_dt.now(UTC),
-                summary=summary,
-                tags=["初试事件", location_name],
+        # 保存到独立玩家存档
+        await _committed(players.save(pid, pstate))
+
+        # 生成“初试事件”，写入世界编年史并广播（标签含“初试事件”）
+        try:
+            loc = repository.node(pstate.current_location)
+            location_name = loc.name if loc else pstate.current_location
+            summary = await gemini_client.generate_initial_event_summary(
+                player_name=pstate.profile.name,
+                realm=pstate.profile.realm,
+                guild=pstate.profile.guild,
+                location_name=location_name,
+                seed_hint=pid,
             )
-            # 写入玩家独立日志并仅向该玩家频道广播
-            players.append_log(pid, ev)
-            # 同步写入对话记录，作为系统开场消息（玩家气泡可忽略显示）
-            init_cmd = CommandResult(
-                id=f"cmdinit-{_dt.now(UTC).strftime('%Y%m%d%H%M%S')}-{pid[:6]}",
-                content="",
-                feedback=summary,
-                created_at=_dt.now(UTC),
+        except Exception:
+            summary = None
+        from datetime import UTC, datetime as _dt
+        if not summary:
+            summary = (
+                f"命轮初启。{pstate.profile.name} 出身凡俗（{pstate.profile.realm}，{pstate.profile.guild}），"
+                f"初临 {location_name}。此时机缘若隐，风物有兆，心念所向，尚需自择其途。汝当如何抉择？"
             )
-            players.append_command(pid, init_cmd)
-            await broker.broadcast(f"chronicles:{pid}", jsonable_encoder(ChronicleStreamUpdate(log=ev)))
+        ev = ChronicleLog(
+            id=f"init-{_dt.now(UTC).strftime('%Y%m%d%H%M%S')}-{pid[:6]}",
+            title=f"命轮初启 · {pstate.profile.name}",
+            timestamp=_dt.now(UTC),
+            summary=summary,
+            tags=["初试事件", location_name],
+        )
+        # 写入玩家独立日志并仅向该玩家频道广播
+        players.append_log(pid, ev)
+        # 同步写入对话记录，作为系统开场消息（玩家气泡可忽略显示）
+        init_cmd = CommandResult(
+            id=f"cmdinit-{_dt.now(UTC).strftime('%Y%m%d%H%M%S')}-{pid[:6]}",
+            content="",
+            feedback=summary,
+            created_at=_dt.now(UTC),
+        )
+        players.append_command(pid, init_cmd)
+        await broker.broadcast(f"chronicles:{pid}", ChronicleStreamUpdate(log=ev))
+
+    @app.get("/profile", response_model=PlayerProfile)
+    async def get_profile(request: Request, response: Response) -> PlayerProfile:
+        players: PlayerStore = app.state.player_store
+        pid = request.cookies.get("player_id")
+        if not pid:
+            import uuid
+            pid = uuid.uuid4().hex
+            response.set_cookie("player_id", pid, httponly=True, samesite="lax")
+        if not players.exists(pid):
+            # 与其他读-改-写路径共用玩家锁；并发的首次请求只生成一次，后到者在锁内复查后直接读取
+            async with player_locks.hold(pid):
+                if not players.exists(pid):
+                    await _initialize_player(pid)
         return players.load(pid).profile
 
     @app.get("/companions", response_model=List[Companion])
@@ -357,19 +484,35 @@ def create_app() -> FastAPI:
         return repository.list_pill_recipes()
 
     @app.get("/chronicles", response_model=List[ChronicleLog])
-    async def list_chronicles(request: Request) -> List[ChronicleLog]:
+    async def list_chronicles(
+        request: Request,
+        before: int | None = Query(None, description="游标：返回 cursor 小于该值（更早）的记录"),
+        after: int | None = Query(None, description="游标：返回 cursor 大于该值（更新）的记录"),
+        limit: int | None = Query(None, ge=1, le=256, description="返回条数上限"),
+    ) -> List[ChronicleLog]:
         players: PlayerStore = app.state.player_store
         pid = request.cookies.get("player_id")
         if pid and players.exists(pid):
-            return players.list_logs(pid)
+            try:
+                return players.list_logs(pid, limit=limit, before=before, after=after)
+            except CursorExpiredError:
+                raise HTTPException(status_code=410, detail="游标已失效，请重新加载最新记录")
         return []
 
     @app.get("/commands/history", response_model=List[CommandResult])
-    async def list_command_history(request: Request) -> List[CommandResult]:
+    async def list_command_history(
+        request: Request,
+        before: int | None = Query(None, description="游标：返回 cursor 小于该值（更早）的记录"),
+        after: int | None = Query(None, description="游标：返回 cursor 大于该值（更新）的记录"),
+        limit: int | None = Query(None, ge=1, le=200, description="返回条数上限"),
+    ) -> List[CommandResult]:
         players: PlayerStore = app.state.player_store
         pid = request.cookies.get("player_id")
         if pid and players.exists(pid):
-            return players.list_commands(pid)
+            try:
+                return players.list_commands(pid, limit=limit, before=before, after=after)
+            except CursorExpiredError:
+                raise HTTPException(status_code=410, detail="游标已失效，请重新加载最新记录")
         return []
 
     @app.get("/location/current", response_model=MapNodeView)
@@ -383,15 +526,70 @@ def create_app() -> FastAPI:
         if not players.exists(pid):
             raise HTTPException(status_code=400, detail="未初始化玩家，请先访问 /profile")
         pstate = players.load(pid)
-        node = next((n for n in repository.get_state().map_state.nodes if n.id == pstate.current_location), None)
+        node = repository.node(pstate.current_location)
         if not node:
             raise HTTPException(status_code=404, detail="未知地点")
         return MapNodeView(**node.model_dump())
 
     @app.get("/map", response_model=MapViewResponse)
+    async def fetch_map(request: Request) -> Response:
+        # 视图按地图版本缓存并预序列化；客户端携带 If-None-Match 命中时返回 304
+        return _cached_json(request, repository.get_map_view_encoded())
+
+    @app.get("/map/tiles", response_model=MapTileManifestResponse)
+    async def fetch_map_manifest(request: Request) -> Response:
+        return _cached_json(request, repository.get_map_manifest_encoded())
+
+    @app.get("/map/tiles/{tile_id}", response_model=MapTileResponse)
+    async def fetch_map_tile(request: Request, tile_id: str) -> Response:
+        cached = repository.get_map_tile_encoded(tile_id)
+        if cached is None:
+            raise HTTPException(status_code=404, detail="未找到地图分块")
+        return _cached_json(request, cached)
+
+    # 空间查询只返回已发现节点，与 /map 一致
+    @app.get("/map/at", response_model=MapPointResponse)
+    async def map_at(
+        x: float = Query(..., ge=0.0, le=1.0),
+        y: float = Query(..., ge=0.0, le=1.0),
+    ) -> MapPointResponse:
+        world = repository.get_state()
+        spatial = repository.spatial()
+        tile_id = spatial.tile_at(x, y)
+        areas = [pos for tid, pos in spatial.areas_at(x, y) if tid == tile_id]
+
+        def _discovered(node_id: str) -> bool:
+            node = repository.node(node_id, world)
+            return node is not None and node.discovered
+
+        nearest = spatial.nearest_node(x, y, accept=_discovered)
+        node = repository.node(nearest[0], world) if nearest else None
+        return MapPointResponse(
+            x=x,
+            y=y,
+            tile_id=tile_id,
+            area_indices=areas,
+            nearest_node=MapNodeView(**node.model_dump()) if node else None,
+            distance=nearest[1] if nearest else None,
+        )
 
-    async def fetch_map() -> MapViewResponse:
-        return MapViewResponse(**repository.get_map_view())
+    @app.get("/map/viewport", response_model=MapViewportResponse)
+    async def map_viewport(
+        x0: float = Query(0.0, ge=0.0, le=1.0),
+        y0: float = Query(0.0, ge=0.0, le=1.0),
+        x1: float = Query(1.0, ge=0.0, le=1.0),
+        y1: float = Query(1.0, ge=0.0, le=1.0),
+    ) -> MapViewportResponse:
+        if x1 < x0 or y1 < y0:
+            raise HTTPException(status_code=400, detail="视口范围无效")
+        world = repository.get_state()
+        spatial = repository.spatial()
+        nodes = []
+        for node_id in spatial.nodes_in(x0, y0, x1, y1):
+            node = repository.node(node_id, world)
+            if node is not None and node.discovered:
+                nodes.append(MapNodeView(**node.model_dump()))
+        return MapViewportResponse(tile_ids=spatial.tiles_in(x0, y0, x1, y1), nodes=nodes)
 
     @app.post("/travel", response_model=TravelResponse)
     async def travel(req: Request, resp: Response, request: TravelRequest) -> TravelResponse:
@@ -403,18 +601,65 @@ def create_app() -> FastAPI:
             resp.set_cookie("player_id", pid, httponly=True, samesite="lax")
         if not players.exists(pid):
             raise HTTPException(status_code=400, detail="未初始化玩家，请先访问 /profile")
-        pstate = players.load(pid)
-        world = repository.get_state()
-        target = next((n for n in world.map_state.nodes if n.id == request.location_id), None)
-        if not target:
-            raise HTTPException(status_code=404, detail="未知地点")
-        current_node = next((n for n in world.map_state.nodes if n.id == pstate.current_location), None)
-        if current_node and request.location_id not in current_node.connections:
-            raise HTTPException(status_code=400, detail="无法直接前往该地点")
-        pstate.current_location = request.location_id
-        players.save(pid, pstate)
+        async with player_locks.hold(pid):
+            pstate = players.load(pid)
+            target = repository.node(request.location_id)
+            if not target:
+                raise HTTPException(status_code=404, detail="未知地点")
+            current_node = repository.node(pstate.current_location)
+            if current_node and request.location_id not in repository.neighbors(current_node.id):
+                raise HTTPException(status_code=400, detail="无法直接前往该地点")
+            pstate.current_location = request.location_id
+            await _committed(players.save(pid, pstate))
         return TravelResponse(profile=pstate.profile, current_location=pstate.current_location)
 
+    @app.post("/travel/route", response_model=TravelRouteResponse)
+    async def travel_route(req: Request, resp: Response, request: TravelRouteRequest) -> TravelRouteResponse:
+        """多跳移动：按预计算的最短路径一次到达目标，整段移动只做一次玩家保存。"""
+        players: PlayerStore = app.state.player_store
+        pid = req.cookies.get("player_id")
+        if not pid:
+            import uuid
+            pid = uuid.uuid4().hex
+            resp.set_cookie("player_id", pid, httponly=True, samesite="lax")
+        if not players.exists(pid):
+            raise HTTPException(status_code=400, detail="未初始化玩家，请先访问 /profile")
+        async with player_locks.hold(pid):
+            pstate = players.load(pid)
+            if repository.node(request.location_id) is None:
+                raise HTTPException(status_code=404, detail="未知地点")
+            if repository.node(pstate.current_location) is None:
+                # 与 /travel 一致：当前位置已不在地图上时允许直接前往
+                path = [pstate.current_location, request.location_id]
+            else:
+                path = repository.route(pstate.current_location, request.location_id)
+                if path is None:
+                    raise HTTPException(status_code=400, detail="无法抵达该地点")
+            if len(path) > 1:
+                pstate.current_location = request.location_id
+                await _committed(players.save(pid, pstate))
+        return TravelRouteResponse(
+            profile=pstate.profile,
+            current_location=pstate.current_location,
+            path=path,
+            hops=len(path) - 1,
+        )
+
+    # 共享账本为多进程共用的 SQLite（busy_timeout 5s），争用时可能等待写锁；
+    # 读写一律放到线程中执行，避免阻塞事件循环。
+    async def _shop_response(shop: Shop) -> ShopResponse:
+        """以共享账本中的实时库存与版本覆盖快照中的库存。"""
+        live = await asyncio.to_thread(repository.shop_stock, shop)
+        payload = shop.model_dump()
+        for item in payload["inventory"]:
+            item["stock"], item["version"] = live[item["id"]]
+        return ShopResponse(**payload)
+
+    async def _auction_response(auction: AuctionHouse) -> AuctionHouseResponse:
+        payload = auction.model_dump()
+        payload["listings"] = [lot.model_dump() for lot in await asyncio.to_thread(repository.open_lots, auction)]
+        return AuctionHouseResponse(**payload)
+
     @app.get("/shops/current", response_model=List[ShopResponse])
     async def shops_at_location(request: Request, response: Response) -> List[ShopResponse]:
         players: PlayerStore = app.state.player_store
@@ -426,13 +671,13 @@ def create_app() -> FastAPI:
         if not players.exists(pid):
             raise HTTPException(status_code=400, detail="未初始化玩家，请先访问 /profile")
         pstate = players.load(pid)
-        shops = [s for s in repository.get_state().shops.values() if s.location_id == pstate.current_location]
-        return [ShopResponse(**shop.model_dump()) for shop in shops]
+        shops = repository.shops_at(pstate.current_location)
+        return [await _shop_response(shop) for shop in shops]
 
     @app.get("/shops/{shop_id}", response_model=ShopResponse)
     async def shop_detail(shop_id: str) -> ShopResponse:
         shop = repository.get_shop(shop_id)
-        return ShopResponse(**shop.model_dump())
+        return await _shop_response(shop)
 
     @app.post("/shops/{shop_id}/purchase", response_model=ShopPurchaseResponse, status_code=201)
     async def shop_purchase(request: Request, response: Response, shop_id: str, payload: ShopPurchaseRequest) -> ShopPurchaseResponse:
@@ -444,39 +689,55 @@ def create_app() -> FastAPI:
             response.set_cookie("player_id", pid, httponly=True, samesite="lax")
         if not players.exists(pid):
             raise HTTPException(status_code=400, detail="未初始化玩家，请先访问 /profile")
-        pstate = players.load(pid)
-        world = repository.get_state()
-        shop = world.shops.get(shop_id)
-        if not shop:
-            raise HTTPException(status_code=404, detail="未找到商铺")
-        if shop.location_id != pstate.current_location:
-            raise HTTPException(status_code=403, detail="需要前往商铺所在地")
-        item = next((x for x in shop.inventory if x.id == payload.item_id), None)
-        if not item:
-            raise HTTPException(status_code=404, detail="商品不存在")
-        if item.stock < payload.quantity:
-            raise HTTPException(status_code=400, detail="库存不足")
-        total = item.price * payload.quantity
-        if pstate.spirit_stones < total:
-            raise HTTPException(status_code=403, detail="灵石不足，无法购买")
-        pstate.spirit_stones -= total
-        item.stock -= payload.quantity
-        merged = False
-        for ent in pstate.inventory:
-            if ent.id == item.id:
-                ent.quantity += payload.quantity
-                merged = True
-                break
-        if not merged:
-            from .world_state import InventoryEntry
-            pstate.inventory.append(InventoryEntry(id=item.id, name=item.name, category=item.category, quantity=payload.quantity, description=item.description))
-        players.save(pid, pstate)
-        now = datetime.now(UTC)
-        ev = ChronicleLog(id=f"shop-{now.strftime('%Y%m%d%H%M%S')}-{item.id}", title=f"购入 · {item.name}", timestamp=now, summary=f"玩家({pid[:6]})在商铺购入 {payload.quantity} × {item.name}，花费 {total} 灵石。", tags=["交易", "商铺"]) 
-        players.append_log(pid, ev)
-        await broker.broadcast(f"chronicles:{pid}", jsonable_encoder(ChronicleStreamUpdate(log=ev)))
+        # 库存由共享账本原子扣减（可带期望版本做比较并交换），无需商铺级锁
+        async with player_locks.hold(pid):
+            pstate = players.load(pid)
+            world = repository.get_state()
+            shop = world.shops.get(shop_id)
+            if not shop:
+                raise HTTPException(status_code=404, detail="未找到商铺")
+            if shop.location_id != pstate.current_location:
+                raise HTTPException(status_code=403, detail="需要前往商铺所在地")
+            item = next((x for x in shop.inventory if x.id == payload.item_id), None)
+            if not item:
+                raise HTTPException(status_code=404, detail="商品不存在")
+            total = item.price * payload.quantity
+            if pstate.spirit_stones < total:
+                raise HTTPException(status_code=403, detail="灵石不足，无法购买")
+            remaining, version = await asyncio.to_thread(
+                repository.reserve_shop_stock, shop, item, payload.quantity, payload.expected_version, world
+            )
+            pstate.spirit_stones -= total
+            merged = False
+            for ent in pstate.inventory:
+                if ent.id == item.id:
+                    ent.quantity += payload.quantity
+                    merged = True
+                    break
+            if not merged:
+                from .world_state import InventoryEntry
+                pstate.inventory.append(InventoryEntry(id=item.id, name=item.name, category=item.category, quantity=payload.quantity, description=item.description))
+            try:
+                await _committed(players.save(pid, pstate))
+            except Exception:
+                # 只有本玩家的存档写入失败才会到这里（同批次其他文件的失败不影响）；
+                # 存储已丢弃该玩家的缓存状态，归还预留后玩家不会保留未落盘的购买
+                await asyncio.to_thread(repository.release_shop_stock, shop, item, payload.quantity, world)
+                raise
+            # 同步本进程世界快照中的库存（预写日志组提交，商铺片段由后台压缩落盘）
+            await _committed(store.apply(StockDelta(shop_id=shop_id, item_id=item.id, delta=-payload.quantity)))
+            now = datetime.now(UTC)
+            ev = ChronicleLog(id=f"shop-{now.strftime('%Y%m%d%H%M%S')}-{item.id}", title=f"购入 · {item.name}", timestamp=now, summary=f"玩家({pid[:6]})在商铺购入 {payload.quantity} × {item.name}，花费 {total} 灵石。", tags=["交易", "商铺"]) 
+            players.append_log(pid, ev)
+        await broker.broadcast(f"chronicles:{pid}", ChronicleStreamUpdate(log=ev))
         inv = [InventoryEntryResponse(**i.model_dump()) for i in pstate.inventory]
-        return ShopPurchaseResponse(spent=total, profile=pstate.profile, inventory=inv)
+        return ShopPurchaseResponse(
+            spent=total,
+            profile=pstate.profile,
+            inventory=inv,
+            remaining_stock=remaining,
+            stock_version=version,
+        )
 
     @app.get("/auctions/current", response_model=AuctionHouseResponse | None)
     async def auction_at_location(request: Request, response: Response) -> AuctionHouseResponse | None:
@@ -487,12 +748,14 @@ def create_app() -> FastAPI:
             pid = uuid.uuid4().hex
             response.set_cookie("player_id", pid, httponly=True, samesite="lax")
         if not players.exists(pid):
-            players.create_from_world(pid, store.state)
+            async with player_locks.hold(pid):
+                if not players.exists(pid):
+                    players.create_from_world(pid, store.state)
         pstate = players.load(pid)
-        auction = next((a for a in repository.get_state().auctions.values() if a.location_id == pstate.current_location), None)
-        if auction is None:
+        auctions = repository.auctions_at(pstate.current_location)
+        if not auctions:
             return None
-        return AuctionHouseResponse(**auction.model_dump())
+        return await _auction_response(auctions[0])
 
     @app.post("/auctions/{auction_id}/buy", response_model=AuctionBuyResponse, status_code=201)
     async def auction_buy(request: Request, response: Response, auction_id: str, payload: AuctionBuyRequest) -> AuctionBuyResponse:
@@ -504,30 +767,39 @@ def create_app() -> FastAPI:
             response.set_cookie("player_id", pid, httponly=True, samesite="lax")
         if not players.exists(pid):
             raise HTTPException(status_code=400, detail="未初始化玩家，请先访问 /profile")
-        pstate = players.load(pid)
-        world = repository.get_state()
-        auction = next((a for a in world.auctions.values() if a.id == auction_id), None)
-        if not auction:
-            raise HTTPException(status_code=404, detail="未找到拍卖行")
-        if auction.location_id != pstate.current_location:
-            raise HTTPException(status_code=403, detail="需要前往拍卖行所在地")
-        lot = next((l for l in auction.listings if l.id == payload.lot_id), None)
-        if not lot:
-            raise HTTPException(status_code=404, detail="未找到拍品")
-        if lot.buyout_price is None:
-            raise HTTPException(status_code=400, detail="该拍品不支持一口价")
-        price = lot.buyout_price
-        if pstate.spirit_stones < price:
-            raise HTTPException(status_code=403, detail="灵石不足，无法买断")
-        pstate.spirit_stones -= price
-        auction.listings = [l for l in auction.listings if l.id != payload.lot_id]
-        from .world_state import InventoryEntry
-        pstate.inventory.append(InventoryEntry(id=lot.id, name=lot.lot_name, category=lot.category, quantity=1, description=lot.description))
-        players.save(pid, pstate)
-        now = datetime.now(UTC)
-        ev = ChronicleLog(id=f"auction-{now.strftime('%Y%m%d%H%M%S')}-{lot.id}", title=f"拍卖成交 · {lot.lot_name}", timestamp=now, summary=f"玩家({pid[:6]})在拍卖行以 {price} 灵石一口价购得 {lot.lot_name}。", tags=["交易", "拍卖"]) 
-        players.append_log(pid, ev)
-        await broker.broadcast(f"chronicles:{pid}", jsonable_encoder(ChronicleStreamUpdate(log=ev)))
+        async with player_locks.hold(pid):
+            pstate = players.load(pid)
+            world = repository.get_state()
+            auction_key, auction = repository.auction_by_id(auction_id, world) or (None, None)
+            if not auction:
+                raise HTTPException(status_code=404, detail="未找到拍卖行")
+            if auction.location_id != pstate.current_location:
+                raise HTTPException(status_code=403, detail="需要前往拍卖行所在地")
+            lot = next((l for l in auction.listings if l.id == payload.lot_id), None)
+            if not lot:
+                raise HTTPException(status_code=404, detail="未找到拍品")
+            if lot.buyout_price is None:
+                raise HTTPException(status_code=400, detail="该拍品不支持一口价")
+            price = lot.buyout_price
+            if pstate.spirit_stones < price:
+                raise HTTPException(status_code=403, detail="灵石不足，无法买断")
+            # 拍品以库存 1 登记在共享账本中，并发买断只有一人成功
+            await asyncio.to_thread(repository.reserve_auction_lot, auction, lot, world)
+            pstate.spirit_stones -= price
+            from .world_state import InventoryEntry
+            pstate.inventory.append(InventoryEntry(id=lot.id, name=lot.lot_name, category=lot.category, quantity=1, description=lot.description))
+            try:
+                await _committed(players.save(pid, pstate))
+            except Exception:
+                # 只有本玩家的存档写入失败才会到这里（同批次其他文件的失败不影响）；
+                # 存储已丢弃该玩家的缓存状态，归还预留后玩家不会保留未落盘的购买
+                await asyncio.to_thread(repository.release_auction_lot, auction, lot, world)
+                raise
+            await _committed(store.apply(LotRemoved(auction_id=auction_key, lot_id=payload.lot_id)))
+            now = datetime.now(UTC)
+            ev = ChronicleLog(id=f"auction-{now.strftime('%Y%m%d%H%M%S')}-{lot.id}", title=f"拍卖成交 · {lot.lot_name}", timestamp=now, summary=f"玩家({pid[:6]})在拍卖行以 {price} 灵石一口价购得 {lot.lot_name}。", tags=["交易", "拍卖"]) 
+            players.append_log(pid, ev)
+        await broker.broadcast(f"chronicles:{pid}", ChronicleStreamUpdate(log=ev))
         inv = [InventoryEntryResponse(**i.model_dump()) for i in pstate.inventory]
         return AuctionBuyResponse(spent=price, profile=pstate.profile, inventory=inv)
 
@@ -549,103 +821,105 @@ def create_app() -> FastAPI:
                 import uuid
                 pid = uuid.uuid4().hex
                 response.set_cookie("player_id", pid, httponly=True, samesite="lax")
-            if not players.exists(pid):
-                # 若玩家尚未初始化，这里自动初始化一次，避免首次发送指令仍提示未就绪
-                world = repository.get_state()
-                node_ids = [n.id for n in world.map_state.nodes]
-                nodes_brief = "\n".join([f"- {n.id}" for n in world.map_state.nodes])
-                prompt = (INIT_PLAYER_PROMPT
-                          .replace("{nodes_brief}", nodes_brief)
-                          .replace("{seed_hint}", pid[:12]))
-                text = await gemini_client.generate_player_state_text(prompt)
-                if not text:
-                    raise HTTPException(status_code=503, detail="AI 未返回玩家数据，无法初始化玩家")
-                def _extract_json(s: str) -> str:
-                    s = s.strip()
-                    if s.startswith("{") and s.endswith("}"):
-                        return s
-                    a, b = s.find("{"), s.rfind("}")
-                    if a == -1 or b == -1:
-                        raise ValueError("AI 返回不含 JSON")
-                    return s[a : b + 1]
-                import json as _json
-                try:
-                    parsed = _json.loads(_extract_json(text))
-                except Exception as e:
-                    raise HTTPException(status_code=503, detail=f"玩家数据解析失败：{e}")
-                # 复用 /profile 的归一化逻辑（内联最关键部分）
-                def _slug(s: str, prefix: str) -> str:
-                    base = re.sub(r"[^a-zA-Z0-9]+", "_", (s or "").strip()).strip("_").lower() or prefix
-                    return f"{prefix}_{base}"[:48]
-                def _ensure_int(x, default: int = 0) -> int:
+            # 持有玩家锁完成首次初始化，避免并发请求重复生成同一玩家
+            async with player_locks.hold(pid):
+                if not players.exists(pid):
+                    # 若玩家尚未初始化，这里自动初始化一次，避免首次发送指令仍提示未就绪
+                    world = repository.get_state()
+                    node_ids = [n.id for n in world.map_state.nodes]
+                    nodes_brief = "\n".join([f"- {n.id}" for n in world.map_state.nodes])
+                    prompt = (INIT_PLAYER_PROMPT
+                              .replace("{nodes_brief}", nodes_brief)
+                              .replace("{seed_hint}", pid[:12]))
+                    text = await gemini_client.generate_player_state_text(prompt)
+                    if not text:
+                        raise HTTPException(status_code=503, detail="AI 未返回玩家数据，无法初始化玩家")
+                    def _extract_json(s: str) -> str:
+                        s = s.strip()
+                        if s.startswith("{") and s.endswith("}"):
+                            return s
+                        a, b = s.find("{"), s.rfind("}")
+                        if a == -1 or b == -1:
+                            raise ValueError("AI 返回不含 JSON")
+                        return s[a : b + 1]
+                    import json as _json
                     try:
-                        if isinstance(x, bool):
+                        parsed = _json.loads(_extract_json(text))
+                    except Exception as e:
+                        raise HTTPException(status_code=503, detail=f"玩家数据解析失败：{e}")
+                    # 复用 /profile 的归一化逻辑（内联最关键部分）
+                    def _slug(s: str, prefix: str) -> str:
+                        base = re.sub(r"[^a-zA-Z0-9]+", "_", (s or "").strip()).strip("_").lower() or prefix
+                        return f"{prefix}_{base}"[:48]
+                    def _ensure_int(x, default: int = 0) -> int:
+                        try:
+                            if isinstance(x, bool):
+                                return default
+                            return int(x)
+                        except Exception:
                             return default
-                        return int(x)
-                    except Exception:
-                        return default
-                realm_raw = str((parsed.get("profile") or {}).get("realm") or "凡人")
-                realm = "凡人" if "凡人" in realm_raw else realm_raw
-                prof = parsed.get("profile") or {}
-                norm = {
-                    "profile": {
-                        "id": prof.get("id") or f"p_{pid[:8]}",
-                        "name": prof.get("name") or "无名",
-                        "realm": realm,
-                        "guild": prof.get("guild") or "",
-                        "faction_reputation": prof.get("faction_reputation") or {},
-                        "attributes": prof.get("attributes") or {},
-                        "techniques": [],
-                        "achievements": prof.get("achievements") or [],
-                        "ascension_progress": {
-                            "stage": (prof.get("ascension_progress") or {}).get("stage") or realm,
-                            "score": _ensure_int((prof.get("ascension_progress") or {}).get("score"), 0),
-                            "next_milestone": (prof.get("ascension_progress") or {}).get("next_milestone") or "炼气一阶",
+                    realm_raw = str((parsed.get("profile") or {}).get("realm") or "凡人")
+                    realm = "凡人" if "凡人" in realm_raw else realm_raw
+                    prof = parsed.get("profile") or {}
+                    norm = {
+                        "profile": {
+                            "id": prof.get("id") or f"p_{pid[:8]}",
+                            "name": prof.get("name") or "无名",
+                            "realm": realm,
+                            "guild": prof.get("guild") or "",
+                            "faction_reputation": prof.get("faction_reputation") or {},
+                            "attributes": prof.get("attributes") or {},
+                            "techniques": [],
+                            "achievements": prof.get("achievements") or [],
+                            "ascension_progress": {
+                                "stage": (prof.get("ascension_progress") or {}).get("stage") or realm,
+                                "score": _ensure_int((prof.get("ascension_progress") or {}).get("score"), 0),
+                                "next_milestone": (prof.get("ascension_progress") or {}).get("next_milestone") or "炼气一阶",
+                            },
                         },
-                    },
-                    "current_location": parsed.get("current_location") if isinstance(parsed.get("current_location"), str) else (parsed.get("current_location") or {}).get("id") or (node_ids[0] if node_ids else ""),
-                    "spirit_stones": _ensure_int(parsed.get("spirit_stones"), 20),
-                    "inventory": [],
-                    "blood_percent": _ensure_int(parsed.get("blood_percent"), 100),
-                }
-                # techniques 兼容
-                tech = prof.get("techniques")
-                if isinstance(tech, list):
-                    for t in tech:
-                        if isinstance(t, dict):
-                            tname = t.get("name") or t.get("id") or "无名术"
+                        "current_location": parsed.get("current_location") if isinstance(parsed.get("current_location"), str) else (parsed.get("current_location") or {}).get("id") or (node_ids[0] if node_ids else ""),
+                        "spirit_stones": _ensure_int(parsed.get("spirit_stones"), 20),
+                        "inventory": [],
+                        "blood_percent": _ensure_int(parsed.get("blood_percent"), 100),
+                    }
+                    # techniques 兼容
+                    tech = prof.get("techniques")
+                    if isinstance(tech, list):
+                        for t in tech:
+                            if isinstance(t, dict):
+                                tname = t.get("name") or t.get("id") or "无名术"
+                                norm["profile"]["techniques"].append({
+                                    "id": t.get("id") or _slug(tname, "tech"),
+                                    "name": tname,
+                                    "type": t.get("type") or "support",
+                                    "mastery": _ensure_int(t.get("mastery"), 1),
+                                    "synergies": t.get("synergies") or [],
+                                })
+                    elif isinstance(tech, dict):
+                        for tname, lvl in tech.items():
                             norm["profile"]["techniques"].append({
-                                "id": t.get("id") or _slug(tname, "tech"),
-                                "name": tname,
-                                "type": t.get("type") or "support",
-                                "mastery": _ensure_int(t.get("mastery"), 1),
-                                "synergies": t.get("synergies") or [],
+                                "id": _slug(str(tname), "tech"),
+                                "name": str(tname),
+                                "type": "support",
+                                "mastery": _ensure_int(lvl, 1),
+                                "synergies": [],
                             })
-                elif isinstance(tech, dict):
-                    for tname, lvl in tech.items():
-                        norm["profile"]["techniques"].append({
-                            "id": _slug(str(tname), "tech"),
-                            "name": str(tname),
-                            "type": "support",
-                            "mastery": _ensure_int(lvl, 1),
-                            "synergies": [],
+                    # inventory 兼容
+                    inv = parsed.get("inventory") or []
+                    for it in inv if isinstance(inv, list) else []:
+                        if not isinstance(it, dict):
+                            continue
+                        iname = it.get("name") or "无名物"
+                        cat = it.get("category") or it.get("type") or "杂物"
+                        norm["inventory"].append({
+                            "id": it.get("id") or _slug(iname, "item"),
+                            "name": iname,
+                            "category": str(cat),
+                            "quantity": _ensure_int(it.get("quantity"), 1),
+                            "description": str(it.get("description") or ""),
                         })
-                # inventory 兼容
-                inv = parsed.get("inventory") or []
-                for it in inv if isinstance(inv, list) else []:
-                    if not isinstance(it, dict):
-                        continue
-                    iname = it.get("name") or "无名物"
-                    cat = it.get("category") or it.get("type") or "杂物"
-                    norm["inventory"].append({
-                        "id": it.get("id") or _slug(iname, "item"),
-                        "name": iname,
-                        "category": str(cat),
-                        "quantity": _ensure_int(it.get("quantity"), 1),
-                        "description": str(it.get("description") or ""),
-                    })
-                pstate = PlayerState.model_validate(norm)
-                players.save(pid, pstate)
+                    pstate = PlayerState.model_validate(norm)
+                    await _committed(players.save(pid, pstate))
             # 使用玩家个人指令历史
             history = players.list_commands(pid)
             recent = history[:3]
@@ -715,11 +989,12 @@ def create_app() -> FastAPI:
             summary=feedback,
             tags=["指令", pstate.current_location],
         )
-        players.append_command(pid, command)
-        players.append_log(pid, chronicle)
+        async with player_locks.hold(pid):
+            players.append_command(pid, command)
+            players.append_log(pid, chronicle)
         await broker.broadcast(
             f"chronicles:{pid}",
-            jsonable_encoder(ChronicleStreamUpdate(log=chronicle)),
+            ChronicleStreamUpdate(log=chronicle),
         )
         logger.info("command for %s handled", pid[:6])
         return CommandResponse(result=command, emitted_log=chronicle)
@@ -797,12 +1072,68 @@ def create_app() -> FastAPI:
         return {"status": "ok"}
 
     # 管理接口：重置世界状态与游玩数据（开发/调试用途）
+    async def _relocate_players(job: Job) -> None:
+        """世界重建后将位于失效节点的玩家安置到新世界起点，并通知“世界重铸”。
+
+        每名玩家在其玩家锁（与请求处理共用的 player_locks）内、于线程池中完成读-改-写与日志追加；
+        线程内只读取存储返回的独立副本并以 model_copy 生成新状态，不修改任何共享对象。
+        通知在每批结束后并发推送；载荷只编码一次，各玩家的帧仅替换其中的事件 id 字段。
+        """
+        nodes = repository.get_state().map_state.nodes
+        if not nodes:
+            return
+        # 在事件循环上取不可变快照，线程池中不再访问可能被重建的索引
+        node_ids = frozenset(repository.index().node_pos)
+        start_id = nodes[0].id
+        now = datetime.now(UTC)
+        stamp = now.strftime("%Y%m%d%H%M%S")
+        notice = ChronicleLog(
+            id=f"world-{stamp}",
+            title="世界重铸",
+            timestamp=now,
+            summary="天机改换，山河重绘。你被安置于新世界的起点，请继续探索。",
+            tags=["系统", "世界重置"],
+        )
+
+        def relocate(pid: str) -> tuple[str, str] | None:
+            pstate = players.load(pid)
+            if pstate.current_location in node_ids:
+                return None
+            commit = players.save(pid, pstate.model_copy(update={"current_location": start_id}))
+            if commit is not None:
+                commit.result()
+            event_id = f"world-{stamp}-{pid[:6]}"
+            players.append_log(pid, notice.model_copy(update={"id": event_id}))
+            return pid, event_id
+
+        async def handle(pid: str) -> tuple[str, str] | None:
+            async with player_locks.hold(pid):
+                return await jobs.run_in_pool(relocate, pid)
+
+        # 以通知自身的 id 字段为界切分已编码的载荷，推送时拼入各玩家的事件 id
+        encoded = encode_event(ChronicleStreamUpdate(log=notice))
+        head, tail = encoded.split(b'"id":' + json.dumps(notice.id).encode("utf-8"), 1)
+
+        async def notify(relocated: list[tuple[str, str]]) -> None:
+            await asyncio.gather(
+                *(
+                    broker.broadcast(
+                        f"chronicles:{pid}",
+                        head + b'"id":' + json.dumps(event_id).encode("utf-8") + tail,
+                    )
+                    for pid, event_id in relocated
+                ),
+                return_exceptions=True,
+            )
+
+        await jobs.run_batched(job, players.list_ids(), handle, batch_size=job_batch_size, on_batch=notify)
+
     @app.post("/admin/reset", status_code=202)
     async def admin_reset(scope: str = Query("world", pattern="^(world|players|all)$")) -> dict[str, str | list[str]]:
         """重置功能增强版。
 
         scope:
-          - world: 仅重建世界（AI 生成），并尝试迁移现有玩家至新世界首个节点；
+          - world: 仅重建世界（AI 生成），并以后台任务将现有玩家迁移至新世界首个节点（返回 job_id）；
           - players: 仅清空所有玩家存档；
           - all: 同时重建世界并清空所有玩家存档。
         """
@@ -824,30 +1155,15 @@ def create_app() -> FastAPI:
                     detail="无法通过 Gemini 重建世界，请检查 API Key/地区支持/模型配置。",
                 )
             changed.append("world_regenerated")
+            # 新世界的 world_id 不同：清理账本中旧世界的库存与拍品条目
+            await asyncio.to_thread(repository.prune_stock)
             memory_repository.clear()
 
-            # 2.1 迁移存量玩家到新世界（仅当未清空玩家时）
+            # 2.1 迁移存量玩家到新世界（仅当未清空玩家时）：后台任务分批并行，进度见 /admin/jobs/{job_id}
             if scope == "world":
-                node_ids = [n.id for n in repository.get_state().map_state.nodes]
-                for pid in players.list_ids():
-                    try:
-                        pstate = players.load(pid)
-                        if pstate.current_location not in node_ids and node_ids:
-                            pstate.current_location = node_ids[0]
-                            players.save(pid, pstate)
-                            # 通知该玩家：世界已重铸
-                            now = datetime.now(UTC)
-                            ev = ChronicleLog(
-                                id=f"world-{now.strftime('%Y%m%d%H%M%S')}-{pid[:6]}",
-                                title="世界重铸",
-                                timestamp=now,
-                                summary="天机改换，山河重绘。你被安置于新世界的起点，请继续探索。",
-                                tags=["系统", "世界重置"],
-                            )
-                            players.append_log(pid, ev)
-                            await broker.broadcast(f"chronicles:{pid}", jsonable_encoder(ChronicleStreamUpdate(log=ev)))
-                    except Exception:
-                        continue
+                job = jobs.start("relocate_players", _relocate_players)
+                changed.append("players_relocating")
+                return {"status": "ok", "changed": changed, "job_id": job.id}
 
         return {"status": "ok", "changed": changed}
 
@@ -878,8 +1194,7 @@ def create_app() -> FastAPI:
         memory_repository.clear()
         try:
             # 广播空快照到通用频道（已连接的客户端可能无法收到私有频道）
-            empty = jsonable_encoder(ChronicleStreamSnapshot(logs=[]))
-            await broker.broadcast("chronicles", empty)
+            await broker.broadcast("chronicles", ChronicleStreamSnapshot(logs=[]))
         except Exception:
             pass
         if rebuild:
@@ -889,6 +1204,7 @@ def create_app() -> FastAPI:
                 raise HTTPException(status_code=503, detail=f"世界重建失败：{e}")
             if not ok:
                 raise HTTPException(status_code=503, detail="无法通过 Gemini 重建世界")
+            await asyncio.to_thread(repository.prune_stock)
             changed.append("world_regenerated")
         return {"status": "ok", "changed": changed}
 
@@ -906,8 +1222,7 @@ def create_app() -> FastAPI:
         players.delete_player(pid)
         # 推送空快照，刷新前端时间线
         try:
-            snapshot = jsonable_encoder(ChronicleStreamSnapshot(logs=[]))
-            await broker.broadcast(f"chronicles:{pid}", snapshot)
+            await broker.broadcast(f"chronicles:{pid}", ChronicleStreamSnapshot(logs=[]))
         except Exception:
             pass
         # 同时清除客户端 cookie，避免使用已被删除的身份继续访问
@@ -922,10 +1237,21 @@ def create_app() -> FastAPI:
     async def admin_reset_player_get(request: Request, response: Response) -> dict[str, str]:
         return await admin_reset_player(request, response)
 
+    @app.get("/admin/jobs/{job_id}")
+    async def admin_job_status(job_id: str) -> dict:
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="任务不存在或已过期")
+        return job.snapshot()
+
     @app.websocket("/ws/chronicles")
     async def chronicle_stream(websocket: WebSocket) -> None:
         # 根据 cookie 或查询参数选择玩家私有频道；若均无则退化为全局空快照
         pid = websocket.cookies.get("player_id") if hasattr(websocket, "cookies") else None
+        snapshot_limit: int | None = None
+        since: int | None = None
+        epoch: str | None = None
+        batch = False
         try:
             # 允许 ws://.../ws/chronicles?pid=<id>
             qp = websocket.scope.get("query_string", b"").decode() if hasattr(websocket, "scope") else ""
@@ -933,19 +1259,28 @@ def create_app() -> FastAPI:
             params = parse_qs(qp)
             if not pid and params.get("pid"):
                 pid = params.get("pid")[0]
+            # 可选 ?limit=N：首屏仅下发最新 N 条，更早记录由 /chronicles?before= 分页补齐
+            if params.get("limit"):
+                snapshot_limit = max(1, int(params.get("limit")[0]))
+            # 可选 ?since=<seq>&epoch=<epoch>：断线重连时只补发错过的更新，无法续传时才下发完整快照
+            if params.get("since") and params.get("epoch"):
+                since = int(params.get("since")[0])
+                epoch = params.get("epoch")[0]
+            # 可选 ?batch=1：事件高峰时接收合并后的 {"type":"batch","events":[...]} 帧
+            batch = _batch_requested(params.get("batch"))
         except Exception:
             pass
         channel = f"chronicles:{pid}" if pid else "chronicles"
-        # 构造该玩家的时间线快照
-        try:
-            if pid:
-                logs = players.list_logs(pid)
-            else:
+
+        # 构造该玩家的时间线快照（仅在无法续传时读取存档）
+        def snapshot(seq: int | None, cursor_epoch: str | None) -> ChronicleStreamSnapshot:
+            try:
+                logs = players.list_logs(pid, limit=snapshot_limit) if pid else []
+            except Exception:
                 logs = []
-        except Exception:
-            logs = []
-        snapshot_message = jsonable_encoder(ChronicleStreamSnapshot(logs=logs))
-        await broker.connect(channel, websocket, [snapshot_message])
+            return ChronicleStreamSnapshot(logs=logs, seq=seq, epoch=cursor_epoch)
+
+        await broker.connect(channel, websocket, since=since, epoch=epoch, snapshot=snapshot, batch=batch)
         try:
             while True:
                 await websocket.receive_text()
@@ -957,7 +1292,8 @@ def create_app() -> FastAPI:
 
     @app.websocket("/ws/events/{channel}")
     async def generic_event_stream(channel: str, websocket: WebSocket) -> None:
-        await broker.connect(channel, websocket)
+        batch = _batch_requested(websocket.query_params.getlist("batch"))
+        await broker.connect(channel, websocket, batch=batch)
         try:
             while True:
                 await websocket.receive_text()
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Iterable
+
+logger = logging.getLogger("lingyan.persistence")
+
+
+def _fsync_dir(directory: Path) -> None:
+    """rename 之后同步目录项，保证新文件名在崩溃后可见（非 POSIX 平台忽略）。"""
+    if os.name != "posix":
+        return
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: Path, data: bytes, *, fsync: bool = True, sync_dir: bool = True) -> None:
+    """原子写文件：写临时文件并 fsync，再 rename 覆盖目标。
+
+    崩溃时目标文件要么保持旧内容、要么为完整新内容，不会出现写到一半的文档。
+    """
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+            if fsync:
+                fh.flush()
+                os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        raise
+    if fsync and sync_dir:
+        _fsync_dir(path.parent)
+
+
+def _all_of(futures: list[Future[None]]) -> Future[None]:
+    """合并多个 Future：全部成功后完成，任一失败则以首个异常结束。"""
+    if len(futures) == 1:
+        return futures[0]
+    combined: Future[None] = Future()
+    if not futures:
+        combined.set_result(None)
+        return combined
+    lock = threading.Lock()
+    remaining = [len(futures)]
+
+    def _done(fut: Future[None]) -> None:
+        exc = fut.exception()
+        with lock:
+            if combined.done():
+                return
+            remaining[0] -= 1
+            if exc is not None:
+                combined.set_exception(exc)
+            elif remaining[0] == 0:
+                combined.set_result(None)
+
+    for fut in futures:
+        fut.add_done_callback(_done)
+    return combined
+
+
+class GroupCommitWriter:
+    """组提交持久化：短时间窗口内的多次保存合并为一次原子写。
+
+    - submit 登记待写内容并返回该路径的 Future，后台线程在窗口结束后统一落盘，
+      文件与目录 fsync 完成后 Future 才完成；结果按路径区分，只有写入失败的路径以 OSError 结束，
+      同批次中已落盘的其他路径不受影响。调用方须等待 Future 后再向客户端确认，
+      多个请求共享同一次 fsync 而不是各自落盘。
+    - 同一路径在窗口内多次提交只写最后一版，并移到批次末尾：批次按最后提交顺序写入，
+      调用方可依赖“先写片段、后写清单”的顺序。目录 fsync 按目录合并。
+    - 落盘前/落盘中的内容可通过 peek 读取，保证读己之写。
+    - flush 同步排空队列（用于关闭服务、测试）；进程退出时自动 close。
+    """
+
+    def __init__(self, window: float = 0.02, fsync: bool = True) -> None:
+        self._window = window
+        self._fsync = fsync
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._pending: dict[Path, bytes] = {}
+        self._inflight: dict[Path, bytes] = {}
+        # 各待写路径的等待者；窗口内重复提交同一路径共享一个 Future（以最后一版的写入结果为准）
+        self._waiters: dict[Path, Future[None]] = {}
+        self._thread: threading.Thread | None = None
+        self._closed = False
+        self._submitted = 0
+        self._coalesced = 0
+        self._written = 0
+        self._batches = 0
+        atexit.register(self.close)
+
+    @property
+    def window(self) -> float:
+        return self._window
+
+    def submit(self, path: Path, data: bytes) -> Future[None]:
+        """登记一次保存，返回该路径落盘后完成的 Future。"""
+        return self.submit_many([(path, data)])
+
+    def submit_many(self, items: Iterable[tuple[Path, bytes]]) -> Future[None]:
+        """按顺序登记多次保存，保证进入同一批次；返回的 Future 在全部路径落盘后完成。"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("writer closed")
+            futures: dict[Path, Future[None]] = {}
+            for path, data in items:
+                # 先删除再插入：重复提交的路径移到批次末尾，保持最后提交的顺序
+                if self._pending.pop(path, None) is not None:
+                    self._coalesced += 1
+                self._pending[path] = data
+                self._submitted += 1
+                waiter = self._waiters.get(path)
+                if waiter is None:
+                    waiter = self._waiters[path] = Future()
+                futures[path] = waiter
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return _all_of(list(futures.values()))
+
+    def peek(self, path: Path) -> bytes | None:
+        """返回尚未落盘（排队或写入中）的最新内容。"""
+        with self._cond:
+            data = self._pending.get(path)
+            if data is None:
+                data = self._inflight.get(path)
+            return data
+
+    def is_pending(self, path: Path) -> bool:
+        with self._cond:
+            return path in self._pending or path in self._inflight
+
+    def discard(self, path: Path | None = None, *, under: Path | None = None) -> None:
+        """撤销待写内容（删除玩家/清空存档时调用）；会等待正在进行的批次完成。"""
+        with self._write_lock, self._cond:
+            targets: list[Path] = []
+            if path is not None and path in self._pending:
+                targets.append(path)
+            if under is not None:
+                targets.extend(p for p in self._pending if p.is_relative_to(under) and p != path)
+            released = []
+            for p in targets:
+                del self._pending[p]
+                released.append(self._waiters.pop(p))
+        # 被撤销的保存立即完成，避免等待者悬挂
+        for waiter in released:
+            waiter.set_result(None)
+
+    def flush(self) -> None:
+        self._drain()
+
+    def close(self) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self._drain()
+
+    def stats(self) -> dict[str, int]:
+        with self._cond:
+            return {
+                "submitted": self._submitted,
+                "coalesced": self._coalesced,
+                "written": self._written,
+                "batches": self._batches,
+                "pending": len(self._pending),
+            }
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            # 等待窗口期，收集更多保存请求后一并提交
+            time.sleep(self._window)
+            self._drain()
+
+    def _drain(self) -> None:
+        with self._write_lock:
+            with self._cond:
+                batch = self._pending
+                waiters = self._waiters
+                self._pending = {}
+                self._waiters = {}
+                self._inflight = batch
+            directories: set[Path] = set()
+            written = 0
+            failed: dict[Path, OSError] = {}
+            for path, data in batch.items():
+                try:
+                    atomic_write(path, data, fsync=self._fsync, sync_dir=False)
+                    directories.add(path.parent)
+                    written += 1
+                except Exception as exc:
+                    logger.exception("persist %s failed", path)
+                    error = OSError(f"persist failed: {path}")
+                    error.__cause__ = exc
+                    failed[path] = error
+            if self._fsync:
+                for directory in directories:
+                    _fsync_dir(directory)
+            with self._cond:
+                self._inflight = {}
+                if batch:
+                    self._written += written
+                    self._batches += 1
+            for path, waiter in waiters.items():
+                error = failed.get(path)
+                if error is not None:
+                    waiter.set_exception(error)
+                else:
+                    waiter.set_result(None)
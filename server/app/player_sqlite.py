@@ -0,0 +1,344 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import random as _random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from .data import GameRepository, PlayerStore, StateCache
+from .schemas import ChronicleLog, CommandResult
+from .segments import CursorExpiredError
+from .world_state import PlayerState, WorldState
+
+logger = logging.getLogger("lingyan.players.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS player_state (
+    pid TEXT PRIMARY KEY,
+    current_location TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_player_state_location ON player_state(current_location);
+
+CREATE TABLE IF NOT EXISTS player_logs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    pid TEXT NOT NULL,
+    entry_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_player_logs_pid ON player_logs(pid, seq);
+CREATE INDEX IF NOT EXISTS idx_player_logs_entry ON player_logs(pid, entry_id);
+
+CREATE TABLE IF NOT EXISTS player_commands (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    pid TEXT NOT NULL,
+    entry_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_player_commands_pid ON player_commands(pid, seq);
+CREATE INDEX IF NOT EXISTS idx_player_commands_entry ON player_commands(pid, entry_id);
+
+-- 截断水位：各玩家在各历史表中被截断删除的最大 seq，用于判定 after 游标是否已失效
+CREATE TABLE IF NOT EXISTS history_trim (
+    tbl TEXT NOT NULL,
+    pid TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (tbl, pid)
+);
+"""
+
+
+class SqlitePlayerStore:
+    """基于单个 SQLite 数据库（WAL 模式）的玩家存储后端。
+
+    - 与 PlayerStore 保持相同接口（exists/load/save/append_log/list_commands 等），可由
+      PLAYER_STORE_BACKEND=sqlite 切换；文件后端仍用于本地开发。
+    - player_state.current_location 建索引，同域查询走索引而非扫描。
+    - 编年史/指令历史为独立表，按 (pid, seq) 索引，追加与截断在同一事务内完成；
+      自增 seq 即分页游标（记录的 cursor 字段）。
+    - 缓存以行版本号作为有效性标记，其他进程写入后版本号变化即失效。
+    """
+
+    def __init__(self, db_path: Path, cache_size: int = 1024) -> None:
+        self._path = db_path
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(_SCHEMA)
+        self._cache = StateCache(cache_size)
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _write(self, statements: list[tuple[str, tuple]]) -> list[tuple]:
+        """在单个 IMMEDIATE 事务中执行多条写语句，返回最后一条语句的结果行（RETURNING）。"""
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            rows: list[tuple] = []
+            try:
+                for sql, params in statements:
+                    rows = cur.execute(sql, params).fetchall()
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+            cur.execute("COMMIT")
+            return rows
+
+    def _query(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # ===== 玩家状态 =====
+    def exists(self, player_id: str) -> bool:
+        return bool(self._query("SELECT 1 FROM player_state WHERE pid = ?", (player_id,)))
+
+    def load(self, player_id: str) -> PlayerState:
+        """读取玩家状态；缓存版本与库内一致时不回传、不解析 data 列。"""
+        cached_version = self._cache.peek_stamp(player_id)
+        rows = self._query(
+            "SELECT version, CASE WHEN version = ? THEN NULL ELSE data END FROM player_state WHERE pid = ?",
+            (cached_version, player_id),
+        )
+        if not rows:
+            self._cache.drop(player_id)
+            raise FileNotFoundError(f"player {player_id} not found")
+        version, data = rows[0]
+        cached = self._cache.get(player_id, version)
+        if cached is not None:
+            return cached
+        if data is None:  # 缓存条目恰在两次访问之间被淘汰
+            data = self._query("SELECT data FROM player_state WHERE pid = ?", (player_id,))[0][0]
+        state = PlayerState.model_validate_json(data)
+        self._cache.put(player_id, version, state)
+        return state
+
+    def save(self, player_id: str, state: PlayerState) -> None:
+        """事务在返回前已提交，无需等待（与 PlayerStore.save 返回 None 的情形一致）。"""
+        serialized = state.model_dump_json()
+        try:
+            rows = self._write(
+                [
+                    (
+                        "INSERT INTO player_state (pid, current_location, version, updated_at, data) "
+                        "VALUES (?, ?, 1, ?, ?) "
+                        "ON CONFLICT(pid) DO UPDATE SET current_location = excluded.current_location, "
+                        "version = player_state.version + 1, updated_at = excluded.updated_at, data = excluded.data "
+                        "RETURNING version",
+                        (player_id, state.current_location, time.time(), serialized),
+                    )
+                ]
+            )
+            version = rows[0][0]
+        except Exception:
+            self._cache.drop(player_id)
+            raise
+        self._cache.put(player_id, version, state)
+
+    def create_from_world(self, player_id: str, world: WorldState) -> PlayerState:
+        template = world.player
+        nodes = world.map_state.nodes
+        start_id = nodes[_random.randrange(0, len(nodes))].id if nodes else template.current_location
+        new_state = PlayerState(
+            profile=template.profile.model_copy(deep=True),
+            current_location=start_id,
+            spirit_stones=template.spirit_stones,
+            inventory=[entry.model_copy(deep=True) for entry in template.inventory],
+            blood_percent=template.blood_percent,
+        )
+        self.save(player_id, new_state)
+        return new_state
+
+    def cache_info(self) -> dict[str, int]:
+        return self._cache.info()
+
+    # ===== 玩家个人编年史 / 指令历史 =====
+    def list_logs(
+        self,
+        player_id: str,
+        limit: int | None = None,
+        before: int | None = None,
+        after: int | None = None,
+    ) -> list[ChronicleLog]:
+        rows = self._window("player_logs", player_id, GameRepository._max_chronicle_entries, limit, before, after)
+        return [ChronicleLog.model_validate_json(data).model_copy(update={"cursor": seq}) for seq, data in rows]
+
+    def append_log(self, player_id: str, event: ChronicleLog) -> None:
+        self._append(
+            "player_logs", player_id, event.id, event.model_dump_json(exclude={"cursor"}), GameRepository._max_chronicle_entries
+        )
+
+    def list_commands(
+        self,
+        player_id: str,
+        limit: int | None = None,
+        before: int | None = None,
+        after: int | None = None,
+    ) -> list[CommandResult]:
+        rows = self._window("player_commands", player_id, GameRepository._max_commands, limit, before, after)
+        return [CommandResult.model_validate_json(data).model_copy(update={"cursor": seq}) for seq, data in rows]
+
+    def append_command(self, player_id: str, cmd: CommandResult) -> None:
+        self._append(
+            "player_commands", player_id, cmd.id, cmd.model_dump_json(exclude={"cursor"}), GameRepository._max_commands
+        )
+
+    def _window(
+        self,
+        table: str,
+        player_id: str,
+        cap: int,
+        limit: int | None,
+        before: int | None,
+        after: int | None,
+    ) -> list[tuple[int, str]]:
+        """按 seq 游标读取窗口（新→旧），返回 (seq, data)；语义与 SegmentLog.window 一致。"""
+        limit = cap if limit is None else max(0, min(limit, cap))
+        if limit == 0:
+            return []
+        clauses = ["pid = ?"]
+        params: list = [player_id]
+        if before is not None:
+            clauses.append("seq < ?")
+            params.append(before)
+        if after is not None:
+            # 只有被截断的记录比游标更新时才有缺失；游标本身不必仍在（after=0 表示从头读取）
+            trimmed = self._query("SELECT seq FROM history_trim WHERE tbl = ? AND pid = ?", (table, player_id))
+            if trimmed and trimmed[0][0] > after:
+                raise CursorExpiredError(after)
+            clauses.append("seq > ?")
+            params.append(after)
+        order = "ASC" if after is not None else "DESC"
+        rows = self._query(
+            f"SELECT seq, data FROM {table} WHERE {' AND '.join(clauses)} ORDER BY seq {order} LIMIT ?",
+            (*params, limit),
+        )
+        if after is not None:
+            rows.reverse()
+        return rows
+
+    def _append(self, table: str, player_id: str, entry_id: str, data: str, keep: int) -> None:
+        self._write(
+            [
+                (f"INSERT INTO {table} (pid, entry_id, data) VALUES (?, ?, ?)", (player_id, entry_id, data)),
+                # 先记录将被截断的最大 seq（无需截断时不写）
+                (
+                    f"INSERT INTO history_trim (tbl, pid, seq) "
+                    f"SELECT ?, pid, seq FROM {table} WHERE pid = ? ORDER BY seq DESC LIMIT 1 OFFSET ? "
+                    "ON CONFLICT(tbl, pid) DO UPDATE SET seq = excluded.seq",
+                    (table, player_id, keep),
+                ),
+                # 截断：删除超出保留条数的旧记录（走 (pid, seq) 索引）
+                (
+                    f"DELETE FROM {table} WHERE pid = ? AND seq <= "
+                    f"(SELECT seq FROM {table} WHERE pid = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                    (player_id, player_id, keep),
+                ),
+            ]
+        )
+
+    # ===== 查询与管理 =====
+    def list_players_at(self, location_id: str, exclude_pid: str | None = None) -> list[tuple[str, PlayerState]]:
+        rows = self._query("SELECT pid FROM player_state WHERE current_location = ?", (location_id,))
+        players: list[tuple[str, PlayerState]] = []
+        for (pid,) in rows:
+            if exclude_pid and pid == exclude_pid:
+                continue
+            try:
+                players.append((pid, self.load(pid)))
+            except Exception:
+                continue
+        return players
+
+    def list_ids(self) -> list[str]:
+        return [pid for (pid,) in self._query("SELECT pid FROM player_state")]
+
+    def delete_player(self, player_id: str) -> None:
+        self._cache.drop(player_id)
+        self._write(
+            [
+                ("DELETE FROM player_state WHERE pid = ?", (player_id,)),
+                ("DELETE FROM player_logs WHERE pid = ?", (player_id,)),
+                ("DELETE FROM player_commands WHERE pid = ?", (player_id,)),
+                ("DELETE FROM history_trim WHERE pid = ?", (player_id,)),
+            ]
+        )
+
+    def clear_all(self) -> None:
+        self._cache.clear()
+        self._write(
+            [
+                ("DELETE FROM player_state", ()),
+                ("DELETE FROM player_logs", ()),
+                ("DELETE FROM player_commands", ()),
+                ("DELETE FROM history_trim", ()),
+            ]
+        )
+
+    # ===== 迁移 =====
+    def migrate_from_directory(self, source: PlayerStore) -> int:
+        """从文件后端导入全部玩家（状态 + 编年史 + 指令历史），返回迁移人数。
+
+        每名玩家在单个事务内写入；已存在的同 id 玩家会被覆盖。
+        """
+        migrated = 0
+        for pid in source.list_ids():
+            try:
+                state = source.load(pid)
+                logs = source.list_logs(pid)
+                commands = source.list_commands(pid)
+            except Exception:
+                logger.warning("skip player %s during migration", pid, exc_info=True)
+                continue
+            statements: list[tuple[str, tuple]] = [
+                (
+                    "INSERT OR REPLACE INTO player_state (pid, current_location, version, updated_at, data) "
+                    "VALUES (?, ?, 1, ?, ?)",
+                    (pid, state.current_location, time.time(), state.model_dump_json()),
+                ),
+                ("DELETE FROM player_logs WHERE pid = ?", (pid,)),
+                ("DELETE FROM player_commands WHERE pid = ?", (pid,)),
+                ("DELETE FROM history_trim WHERE pid = ?", (pid,)),
+            ]
+            # 文件后端按新→旧返回，入库按旧→新以保持 seq 递增即时间顺序
+            for ev in reversed(logs):
+                statements.append(
+                    ("INSERT INTO player_logs (pid, entry_id, data) VALUES (?, ?, ?)", (pid, ev.id, ev.model_dump_json(exclude={"cursor"})))
+                )
+            for cmd in reversed(commands):
+                statements.append(
+                    ("INSERT INTO player_commands (pid, entry_id, data) VALUES (?, ?, ?)", (pid, cmd.id, cmd.model_dump_json(exclude={"cursor"})))
+                )
+            self._write(statements)
+            self._cache.drop(pid)
+            migrated += 1
+        return migrated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="将 players/ 目录结构迁移到 SQLite 玩家库")
+    server_dir = Path(__file__).resolve().parent.parent
+    parser.add_argument("--players", type=Path, default=server_dir / "players", help="文件后端根目录")
+    parser.add_argument("--db", type=Path, default=server_dir / "players.sqlite3", help="目标 SQLite 文件")
+    args = parser.parse_args()
+    target = SqlitePlayerStore(args.db)
+    count = target.migrate_from_directory(PlayerStore(args.players))
+    target.close()
+    print(f"migrated {count} players -> {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import threading
+from collections import deque
+from typing import Mapping
+
+
+class RouteTable:
+    """地图最短路径表（按跳数，与 /travel 的单步移动一致）。
+
+    每个起点的广度优先搜索树在首次查询时计算并缓存，此后同一起点到任意终点的
+    路径只需沿前驱回溯；表随 WorldIndex 一同在地图结构变化（世界替换）时重建。
+    连接按有向边处理，指向不存在节点的连接被忽略。
+    """
+
+    def __init__(self, adjacency: Mapping[str, frozenset[str]]) -> None:
+        self._adjacency = adjacency
+        self._trees: dict[str, dict[str, str | None]] = {}
+        self._lock = threading.Lock()
+
+    def path(self, source: str, target: str) -> list[str] | None:
+        """返回从 source 到 target 的节点序列（含两端）；不可达或节点不存在时返回 None。"""
+        if source not in self._adjacency or target not in self._adjacency:
+            return None
+        parents = self._tree(source)
+        if target not in parents:
+            return None
+        hops = [target]
+        while (prev := parents[hops[-1]]) is not None:
+            hops.append(prev)
+        hops.reverse()
+        return hops
+
+    def distance(self, source: str, target: str) -> int | None:
+        hops = self.path(source, target)
+        return None if hops is None else len(hops) - 1
+
+    def _tree(self, source: str) -> dict[str, str | None]:
+        tree = self._trees.get(source)
+        if tree is not None:
+            return tree
+        parents: dict[str, str | None] = {source: None}
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            # 排序保证等长路径中的选择与集合迭代顺序无关
+            for nxt in sorted(self._adjacency.get(node, ())):
+                if nxt not in parents and nxt in self._adjacency:
+                    parents[nxt] = node
+                    queue.append(nxt)
+        with self._lock:
+            return self._trees.setdefault(source, parents)
@@ -83,6 +83,8 @@ class ChronicleLog(BaseModel):
     timestamp: datetime
     summary: str
     tags: List[str]
+    # 玩家编年史中的分页游标（单调递增，见 /chronicles 的 before/after），未入库时为空
+    cursor: int | None = None
 
 
 class CommandRequest(BaseModel):
@@ -94,6 +96,8 @@ class CommandResult(BaseModel):
     content: str
     feedback: str
     created_at: datetime
+    # 玩家历史中的分页游标（单调递增，见 /commands/history 的 before/after），未入库时为空
+    cursor: int | None = None
 
 
 class CommandResponse(BaseModel):
@@ -104,6 +108,9 @@ class CommandResponse(BaseModel):
 class ChronicleStreamSnapshot(BaseModel):
     type: Literal["snapshot"] = "snapshot"
     logs: List[ChronicleLog]
+    # 续传游标：重连时以 ?since=<seq>&epoch=<epoch> 只补发之后的更新（之后每条更新帧都带 seq）
+    seq: int | None = None
+    epoch: str | None = None
 
 
 class ChronicleStreamUpdate(BaseModel):
@@ -150,6 +157,41 @@ class MapViewResponse(BaseModel):
     edges: List[Dict[str, str]]
 
 
+class MapTileSummary(BaseModel):
+    id: str
+    bbox: Dict[str, float]
+    node_count: int
+
+
+class MapTileManifestResponse(BaseModel):
+    # 全局样式（不含 tiles），tiles 仅列出范围，详情按需请求 /map/tiles/{tile_id}
+    style: Dict[str, Any]
+    tiles: List[MapTileSummary]
+
+
+class MapTileResponse(BaseModel):
+    tile: Dict[str, Any]
+    nodes: List[MapNodeView]
+    edges: List[Dict[str, str]]
+    # 跨越 tile 边界的边在外侧的端点
+    boundary_nodes: List[MapNodeView]
+
+
+class MapPointResponse(BaseModel):
+    x: float
+    y: float
+    tile_id: str | None = None
+    # 所在 tile 内包含该点的区域多边形下标（style.extras.tiles[].areas）
+    area_indices: List[int] = Field(default_factory=list)
+    nearest_node: MapNodeView | None = None
+    distance: float | None = None
+
+
+class MapViewportResponse(BaseModel):
+    tile_ids: List[str]
+    nodes: List[MapNodeView]
+
+
 class TravelRequest(BaseModel):
     location_id: str = Field(..., min_length=1)
 
@@ -159,6 +201,15 @@ class TravelResponse(BaseModel):
     current_location: str
 
 
+class TravelRouteRequest(BaseModel):
+    location_id: str = Field(..., min_length=1)
+
+
+class TravelRouteResponse(TravelResponse):
+    path: List[str]
+    hops: int
+
+
 class ShopItemResponse(BaseModel):
     id: str
     name: str
@@ -167,6 +218,8 @@ class ShopItemResponse(BaseModel):
     price: int
     stock: int
     description: str
+    # 库存版本（共享账本），购买时作为 expected_version 可实现比较并交换
+    version: int = 0
 
 
 class ShopResponse(BaseModel):
@@ -186,11 +239,15 @@ class InventoryEntryResponse(BaseModel):
 class ShopPurchaseRequest(BaseModel):
     item_id: str = Field(..., min_length=1)
     quantity: int = Field(..., ge=1, le=99)
+    # 可选：客户端看到的库存版本，不一致时返回 409
+    expected_version: int | None = None
 
 class ShopPurchaseResponse(BaseModel):
     spent: int
     profile: PlayerProfile
     inventory: List[InventoryEntryResponse]
+    remaining_stock: int | None = None
+    stock_version: int | None = None
 
 
 class AuctionLotResponse(BaseModel):
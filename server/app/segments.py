@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from itertools import islice
+from pathlib import Path
+from typing import Iterator
+
+
+_CURSOR_PREFIX = '{"cursor":'
+
+
+class CursorExpiredError(LookupError):
+    """after 游标指向的记录已被压缩淘汰，其后的记录可能已缺失；客户端应重新加载最新一页。"""
+
+
+def record_cursor(line: str) -> int | None:
+    """提取一行记录的游标；append 写入的行以 cursor 开头，走快速路径避免完整解析。"""
+    if line.startswith(_CURSOR_PREFIX):
+        end = line.find(",", len(_CURSOR_PREFIX))
+        try:
+            return int(line[len(_CURSOR_PREFIX) : end if end != -1 else None].rstrip("}"))
+        except ValueError:
+            pass
+    try:
+        value = json.loads(line).get("cursor")
+    except Exception:
+        return None
+    return value if isinstance(value, int) else None
+
+
+def with_cursor(line: str, cursor: int) -> str:
+    """在已编码的 JSON 对象行首插入 cursor 字段（行本身不得含 cursor）。"""
+    body = line[1:].lstrip()
+    return f"{_CURSOR_PREFIX}{cursor}" + ("}" if body.startswith("}") else "," + body)
+
+
+class _FileStats:
+    """按段文件路径缓存的整数（行数、尾行 cursor），有界 LRU；淘汰后下次访问时从文件重新统计。"""
+
+    def __init__(self, capacity: int) -> None:
+        self._capacity = max(1, capacity)
+        self._lock = threading.Lock()
+        self._values: OrderedDict[Path, int] = OrderedDict()
+
+    def get(self, path: Path) -> int | None:
+        with self._lock:
+            value = self._values.get(path)
+            if value is not None:
+                self._values.move_to_end(path)
+            return value
+
+    def put(self, path: Path, value: int) -> None:
+        with self._lock:
+            self._values[path] = value
+            self._values.move_to_end(path)
+            while len(self._values) > self._capacity:
+                self._values.popitem(last=False)
+
+    def pop(self, path: Path) -> None:
+        with self._lock:
+            self._values.pop(path, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+class SegmentLog:
+    """追加式 JSONL 段文件存储（玩家编年史、指令历史）。
+
+    - 每条记录占一行，按时间旧→新追加，单次写入成本与历史长度无关；
+    - 每行带单调递增的 cursor（文件内从 1 开始连续编号）作为分页游标，不依赖记录 id 的唯一性；
+    - 读取从文件尾部按块倒序扫描，只解析需要的最新 N 行；
+    - 行数超过 ``max_entries * compact_factor`` 时触发压缩，仅保留最新 ``max_entries`` 行；
+    - 兼容旧版整文件 JSON 数组（新→旧顺序），首次访问时透明迁移。
+    """
+
+    _block_size = 8192
+
+    def __init__(self, max_entries: int, compact_factor: int = 2, cache_size: int = 1024) -> None:
+        self._max_entries = max_entries
+        self._compact_at = max(max_entries + 1, max_entries * compact_factor)
+        # 各段文件的行数缓存：首次追加时统计一次，之后随追加/压缩增量维护；按活跃文件数有界
+        self._line_counts = _FileStats(cache_size)
+        # 各段文件最新一行的 cursor；首次访问时从尾行读取（旧版无 cursor 的文件先补编号）
+        self._last_cursor = _FileStats(cache_size)
+
+    @property
+    def max_entries(self) -> int:
+        return self._max_entries
+
+    # ===== 写路径 =====
+    def append(self, path: Path, line: str) -> int:
+        """追加一条记录（不含 cursor 字段的 JSON 对象），返回分配的 cursor。"""
+        count = self._line_counts.get(path)
+        if count is None:
+            count = self._prepare_for_append(path)
+        cursor = self._tail_cursor(path) + 1
+        with path.open("a", encoding="utf-8") as fh:
+            fh.write(with_cursor(line, cursor))
+            fh.write("\n")
+        self._last_cursor.put(path, cursor)
+        count += 1
+        self._line_counts.put(path, count)
+        if count > self._compact_at:
+            self.compact(path)
+        return cursor
+
+    def compact(self, path: Path) -> None:
+        """仅保留最新 max_entries 行，通过临时文件 + rename 原子替换。"""
+        if not path.exists():
+            self._line_counts.pop(path)
+            return
+        keep = list(self.iter_lines(path))[: self._max_entries]
+        keep.reverse()
+        self._rewrite(path, keep)
+        self._line_counts.put(path, len(keep))
+
+    def forget(self, path: Path) -> None:
+        """丢弃行数与游标缓存（文件被外部删除时调用）。"""
+        self._line_counts.pop(path)
+        self._last_cursor.pop(path)
+
+    def clear(self) -> None:
+        self._line_counts.clear()
+        self._last_cursor.clear()
+
+    # ===== 读路径 =====
+    def window(
+        self,
+        path: Path,
+        limit: int | None = None,
+        *,
+        before: int | None = None,
+        after: int | None = None,
+    ) -> list[str]:
+        """游标分页读取（新→旧），游标为记录的 cursor。
+
+        - before：只返回 cursor 更小（更旧）的行；
+        - after：只返回 cursor 更大（更新）的行，取紧邻游标的 limit 条；游标不小于最新记录时返回空，
+          游标之后的记录有被淘汰的（保留窗口中最旧的 cursor 大于 after + 1）时抛出 CursorExpiredError；
+        - 只扫描保留窗口内的行（文件中尚未压缩掉的更旧行视为已淘汰，与 SQLite 后端的截断语义一致），
+          越过 after 游标或凑满 limit 即停止。
+        """
+        limit = self._max_entries if limit is None else max(0, min(limit, self._max_entries))
+        if limit == 0:
+            return []
+        newest = self._tail_cursor(path)
+        if after is not None:
+            if after >= newest:
+                return []
+            # cursor 在文件内连续编号：游标之后的记录多于保留条数即有缺失，无需扫描
+            if newest - after > self._max_entries:
+                raise CursorExpiredError(after)
+        out: list[str] = []
+        oldest: int | None = None
+        for line in islice(self.iter_lines(path), self._max_entries):
+            cursor = record_cursor(line)
+            if cursor is None:
+                continue
+            if after is not None and cursor <= after:
+                break
+            oldest = cursor
+            if before is not None and cursor >= before:
+                continue
+            out.append(line)
+            if after is None and len(out) >= limit:
+                break
+        else:
+            # 扫完保留窗口仍未越过游标：最旧的保留记录须紧接游标，否则中间的记录已被压缩掉
+            if after is not None and oldest is not None and oldest > after + 1:
+                raise CursorExpiredError(after)
+        return out[-limit:]
+
+    def iter_lines(self, path: Path) -> Iterator[str]:
+        """从文件尾部按块倒序产出非空行（新→旧），不读取用不到的头部。"""
+        try:
+            fh = path.open("rb")
+        except FileNotFoundError:
+            return
+        with fh:
+            fh.seek(0, os.SEEK_END)
+            pos = fh.tell()
+            pending = b""
+            while pos > 0:
+                step = min(self._block_size, pos)
+                pos -= step
+                fh.seek(pos)
+                chunk = fh.read(step) + pending
+                parts = chunk.split(b"\n")
+                # 首段可能是被块边界截断的行，留待下一轮拼接
+                pending = parts[0]
+                for raw in reversed(parts[1:]):
+                    if raw.strip():
+                        yield raw.decode("utf-8", errors="replace")
+            if pending.strip():
+                yield pending.decode("utf-8", errors="replace")
+
+    # ===== 迁移 =====
+    def migrate_legacy(self, legacy_path: Path, path: Path) -> None:
+        """将旧版 JSON 数组文件（新→旧）转换为 JSONL 段文件（旧→新）。"""
+        if path.exists() or not legacy_path.exists():
+            return
+        try:
+            raw = json.loads(legacy_path.read_text(encoding="utf-8"))
+        except Exception:
+            raw = []
+        items = raw if isinstance(raw, list) else []
+        lines = [json.dumps(item, ensure_ascii=False, separators=(",", ":")) for item in reversed(items[: self._max_entries])]
+        self._rewrite(path, lines)
+        self._line_counts.put(path, len(lines))
+        try:
+            legacy_path.unlink()
+        except Exception:
+            pass
+
+    # ===== 内部工具 =====
+    def _tail_cursor(self, path: Path) -> int:
+        """最新一行的 cursor（空文件为 0）；尾行没有 cursor 的旧版文件先整体补编号。"""
+        cursor = self._last_cursor.get(path)
+        if cursor is not None:
+            return cursor
+        tail = next(self.iter_lines(path), None)
+        if tail is None:
+            cursor = 0
+        else:
+            cursor = record_cursor(tail)
+            if cursor is None:
+                lines = list(self.iter_lines(path))
+                lines.reverse()
+                self._rewrite(path, [with_cursor(line, n) for n, line in enumerate(lines, 1)])
+                cursor = len(lines)
+        self._last_cursor.put(path, cursor)
+        return cursor
+
+    def _prepare_for_append(self, path: Path) -> int:
+        """统计现有行数；若上次写入被中断导致末尾缺少换行，则补齐，避免与新行粘连。"""
+        try:
+            with path.open("rb") as fh:
+                count = 0
+                last = b""
+                for block in iter(lambda: fh.read(1 << 16), b""):
+                    count += block.count(b"\n")
+                    last = block[-1:]
+        except FileNotFoundError:
+            return 0
+        if last and last != b"\n":
+            with path.open("ab") as fh:
+                fh.write(b"\n")
+            count += 1
+        return count
+
+    @staticmethod
+    def _rewrite(path: Path, lines: list[str]) -> None:
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as fh:
+            for line in lines:
+                fh.write(line)
+                fh.write("\n")
+        os.replace(tmp, path)
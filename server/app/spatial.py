@@ -0,0 +1,308 @@
+from __future__ import annotations
+
+import math
+from typing import Any, Callable, Iterable, Iterator
+
+# 地图坐标归一化在 [0,1]×[0,1]；网格每轴单元数随对象数量取 ceil(sqrt(n))，并限制上限
+_MAX_CELLS = 64
+
+
+def tile_bbox(tile: dict[str, Any]) -> tuple[float, float, float, float] | None:
+    b = tile.get("bbox") or {}
+    try:
+        return float(b["x0"]), float(b["y0"]), float(b["x1"]), float(b["y1"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _polygon(area: Any) -> list[tuple[float, float]]:
+    points = area.get("points") if isinstance(area, dict) else None
+    out: list[tuple[float, float]] = []
+    for p in points or ():
+        try:
+            out.append((float(p["x"]), float(p["y"])))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return out
+
+
+def _point_in_polygon(x: float, y: float, polygon: list[tuple[float, float]]) -> bool:
+    """射线法判断点是否在多边形内（边界上的点视为在内）。"""
+    inside = False
+    j = len(polygon) - 1
+    for i, (xi, yi) in enumerate(polygon):
+        xj, yj = polygon[j]
+        if (yi > y) != (yj > y):
+            cross = (xj - xi) * (y - yi) / (yj - yi) + xi
+            if x == cross:
+                return True
+            if x < cross:
+                inside = not inside
+        elif yi == yj == y and min(xi, xj) <= x <= max(xi, xj):
+            return True
+        j = i
+    return inside
+
+
+class SpatialIndex:
+    """地图节点与 tile 的均匀网格索引。
+
+    - tile_at / tiles_at：点所在的 tile（半开区间 [x0,x1)×[y0,y1)，地图右/下边缘归属最后一格）；
+    - areas_at：点所在 tile 内包含该点的区域多边形（style.extras.tiles[].areas 的下标）；
+    - nodes_in：视口矩形（闭区间）内的节点；
+    - nearest_node：距离某点最近的节点，按网格环逐层向外搜索。
+    查询只访问相关网格单元，成本与地图规模近似无关；索引随 WorldIndex 在世界替换时重建。
+    """
+
+    def __init__(self, nodes: Iterable[tuple[str, float, float]], tiles: Iterable[dict[str, Any]] = ()) -> None:
+        self._nodes = [(node_id, float(x), float(y)) for node_id, x, y in nodes]
+        self._tiles: list[tuple[str, float, float, float, float]] = []
+        self._areas: list[list[tuple[int, tuple[float, float, float, float], list[tuple[float, float]]]]] = []
+        for tile in tiles:
+            if not isinstance(tile, dict):
+                continue
+            bbox = tile_bbox(tile)
+            if bbox is None:
+                continue
+            self._tiles.append((str(tile.get("id", "<unknown>")), *bbox))
+            areas = []
+            for pos, area in enumerate(tile.get("areas") or ()):
+                polygon = _polygon(area)
+                if len(polygon) >= 3:
+                    xs = [p[0] for p in polygon]
+                    ys = [p[1] for p in polygon]
+                    areas.append((pos, (min(xs), min(ys), max(xs), max(ys)), polygon))
+            self._areas.append(areas)
+
+        count = max(len(self._nodes), len(self._tiles), 1)
+        self._cells = max(1, min(_MAX_CELLS, math.ceil(math.sqrt(count))))
+        self._node_cells: dict[tuple[int, int], list[int]] = {}
+        for pos, (_, x, y) in enumerate(self._nodes):
+            self._node_cells.setdefault(self._cell(x, y), []).append(pos)
+        self._tile_cells: dict[tuple[int, int], list[int]] = {}
+        for pos, (_, x0, y0, x1, y1) in enumerate(self._tiles):
+            for key in self._cells_covering(x0, y0, x1, y1):
+                self._tile_cells.setdefault(key, []).append(pos)
+
+    @classmethod
+    def from_map(cls, map_state: Any) -> "SpatialIndex":
+        extras = getattr(map_state.style, "extras", None) or {}
+        tiles = extras.get("tiles") if isinstance(extras, dict) else None
+        return cls(
+            ((n.id, n.coords.x, n.coords.y) for n in map_state.nodes),
+            tiles if isinstance(tiles, list) else (),
+        )
+
+    @property
+    def cells(self) -> int:
+        return self._cells
+
+    # ===== tile / 区域 =====
+    def tiles_at(self, x: float, y: float) -> list[str]:
+        return [self._tiles[pos][0] for pos in self._tiles_at(x, y)]
+
+    def tile_at(self, x: float, y: float) -> str | None:
+        found = self._tiles_at(x, y)
+        return self._tiles[found[0]][0] if found else None
+
+    def areas_at(self, x: float, y: float) -> list[tuple[str, int]]:
+        """返回 (tile id, 区域下标) 列表。"""
+        hits: list[tuple[str, int]] = []
+        for pos in self._tiles_at(x, y):
+            for area_pos, (ax0, ay0, ax1, ay1), polygon in self._areas[pos]:
+                if ax0 <= x <= ax1 and ay0 <= y <= ay1 and _point_in_polygon(x, y, polygon):
+                    hits.append((self._tiles[pos][0], area_pos))
+        return hits
+
+    def tiles_in(self, x0: float, y0: float, x1: float, y1: float) -> list[str]:
+        """与视口矩形相交（面积非零）的 tile。"""
+        seen: set[int] = set()
+        out: list[str] = []
+        for key in self._cells_covering(x0, y0, x1, y1):
+            for pos in self._tile_cells.get(key, ()):
+                if pos in seen:
+                    continue
+                seen.add(pos)
+                tile_id, tx0, ty0, tx1, ty1 = self._tiles[pos]
+                if tx0 < x1 and tx1 > x0 and ty0 < y1 and ty1 > y0:
+                    out.append(tile_id)
+        return out
+
+    # ===== 节点 =====
+    def nodes_in(self, x0: float, y0: float, x1: float, y1: float) -> list[str]:
+        out: list[str] = []
+        for key in self._cells_covering(x0, y0, x1, y1):
+            for pos in self._node_cells.get(key, ()):
+                node_id, x, y = self._nodes[pos]
+                if x0 <= x <= x1 and y0 <= y <= y1:
+                    out.append(node_id)
+        return out
+
+    def nearest_node(
+        self, x: float, y: float, accept: Callable[[str], bool] | None = None
+    ) -> tuple[str, float] | None:
+        """返回 (节点 id, 距离)；accept 可过滤候选（如仅已发现节点）。"""
+        cx, cy = self._cell(x, y)
+        size = 1.0 / self._cells
+        best: tuple[str, float] | None = None
+        for ring in range(self._cells + 1):
+            for key in self._ring(cx, cy, ring):
+                for pos in self._node_cells.get(key, ()):
+                    node_id, nx, ny = self._nodes[pos]
+                    if accept is not None and not accept(node_id):
+                        continue
+                    dist = math.hypot(nx - x, ny - y)
+                    if best is None or dist < best[1] or (dist == best[1] and node_id < best[0]):
+                        best = (node_id, dist)
+            # 尚未扫描的单元距查询点至少 ring 个单元宽
+            if best is not None and best[1] <= ring * size:
+                break
+        return best
+
+    # ===== 网格 =====
+    def _axis(self, value: float) -> int:
+        return min(self._cells - 1, max(0, int(value * self._cells)))
+
+    def _cell(self, x: float, y: float) -> tuple[int, int]:
+        return self._axis(x), self._axis(y)
+
+    def _cells_covering(self, x0: float, y0: float, x1: float, y1: float) -> Iterator[tuple[int, int]]:
+        if x1 < x0 or y1 < y0:
+            return
+        for i in range(self._axis(x0), self._axis(x1) + 1):
+            for j in range(self._axis(y0), self._axis(y1) + 1):
+                yield i, j
+
+    def _ring(self, cx: int, cy: int, ring: int) -> Iterator[tuple[int, int]]:
+        if ring == 0:
+            yield cx, cy
+            return
+        lo, hi = -ring, ring
+        for d in range(lo, hi + 1):
+            yield cx + d, cy + lo
+            yield cx + d, cy + hi
+        for d in range(lo + 1, hi):
+            yield cx + lo, cy + d
+            yield cx + hi, cy + d
+
+    def _tiles_at(self, x: float, y: float) -> list[int]:
+        found: list[int] = []
+        for pos in self._tile_cells.get(self._cell(x, y), ()):
+            _, x0, y0, x1, y1 = self._tiles[pos]
+            in_x = x0 <= x < x1 or (x == x1 and x1 >= 1.0)
+            in_y = y0 <= y < y1 or (y == y1 and y1 >= 1.0)
+            if in_x and in_y:
+                found.append(pos)
+        return found
+
+
+class CoverageIssue:
+    """tile 拼接问题区域：kind 为 "gap"（无 tile 覆盖）或 "overlap"（多个 tile 重叠）。"""
+
+    __slots__ = ("kind", "x0", "y0", "x1", "y1", "tile_ids")
+
+    def __init__(self, kind: str, x0: float, y0: float, x1: float, y1: float, tile_ids: list[str]) -> None:
+        self.kind = kind
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+        self.tile_ids = tile_ids
+
+    def describe(self) -> str:
+        region = f"[{self.x0:.4f},{self.x1:.4f})×[{self.y0:.4f},{self.y1:.4f})"
+        if self.kind == "gap":
+            return f"{region} 无归属"
+        return f"{region} 重叠：{self.tile_ids}"
+
+    def __repr__(self) -> str:
+        return f"CoverageIssue({self.kind!r}, {self.x0}, {self.y0}, {self.x1}, {self.y1}, {self.tile_ids!r})"
+
+
+def _snap(values: Iterable[float], eps: float) -> list[float]:
+    """排序去重，并把相距不超过 eps 的坐标合并为同一条边（容忍 0.333333/0.333334 之类的舍入）。"""
+    out: list[float] = []
+    for v in sorted(values):
+        if not out or v - out[-1] > eps:
+            out.append(v)
+    return out
+
+
+def _locate(axis: list[float], value: float, eps: float) -> int:
+    lo, hi = 0, len(axis) - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if axis[mid] <= value + eps:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def check_tile_coverage(tiles: Iterable[dict[str, Any]], eps: float = 1e-5) -> list[CoverageIssue]:
+    """精确校验 tiles 是否恰好铺满 [0,1]×[0,1]，一次返回全部空隙与重叠区域。
+
+    坐标压缩后在压缩网格上做二维差分累加得到每个单元的覆盖次数，成本为
+    O(T·log T + X·Y)（X、Y 为不同边坐标数；规则网格下约为 cols×rows），
+    不依赖采样；相邻的同类问题单元按行合并为矩形。bbox 无效的 tile 由调用方先行校验。
+    """
+    rects: list[tuple[str, float, float, float, float]] = []
+    for tile in tiles:
+        bbox = tile_bbox(tile) if isinstance(tile, dict) else None
+        if bbox is None:
+            continue
+        x0, y0, x1, y1 = (min(1.0, max(0.0, v)) for v in bbox)
+        if x1 - x0 > eps and y1 - y0 > eps:
+            rects.append((str(tile.get("id", "<unknown>")), x0, y0, x1, y1))
+
+    xs = _snap([0.0, 1.0, *(r[1] for r in rects), *(r[3] for r in rects)], eps)
+    ys = _snap([0.0, 1.0, *(r[2] for r in rects), *(r[4] for r in rects)], eps)
+    nx, ny = len(xs) - 1, len(ys) - 1
+    diff = [[0] * (nx + 1) for _ in range(ny + 1)]
+    spans: list[tuple[int, int, int, int]] = []
+    for _, x0, y0, x1, y1 in rects:
+        i0, i1 = _locate(xs, x0, eps), _locate(xs, x1, eps)
+        j0, j1 = _locate(ys, y0, eps), _locate(ys, y1, eps)
+        spans.append((i0, j0, i1, j1))
+        diff[j0][i0] += 1
+        diff[j0][i1] -= 1
+        diff[j1][i0] -= 1
+        diff[j1][i1] += 1
+
+    # 二维前缀和：count[j][i] 为压缩单元 [xs[i],xs[i+1])×[ys[j],ys[j+1]) 的覆盖次数
+    issues: list[CoverageIssue] = []
+    above = [0] * (nx + 1)
+    for j in range(ny):
+        row_sum = 0
+        run_kind: str | None = None
+        run_start = 0
+        for i in range(nx + 1):
+            if i < nx:
+                row_sum += diff[j][i]
+                above[i] += row_sum
+                count = above[i]
+                kind = "gap" if count == 0 else "overlap" if count > 1 else None
+            else:
+                kind = None
+            if kind != run_kind:
+                if run_kind is not None:
+                    issues.append(_issue(run_kind, xs, ys, run_start, i, j, spans, rects))
+                run_kind, run_start = kind, i
+    return issues
+
+
+def _issue(
+    kind: str,
+    xs: list[float],
+    ys: list[float],
+    i0: int,
+    i1: int,
+    j: int,
+    spans: list[tuple[int, int, int, int]],
+    rects: list[tuple[str, float, float, float, float]],
+) -> CoverageIssue:
+    tile_ids: list[str] = []
+    if kind == "overlap":
+        tile_ids = [
+            rects[pos][0]
+            for pos, (a0, b0, a1, b1) in enumerate(spans)
+            if a0 < i1 and a1 > i0 and b0 <= j < b1
+        ]
+    return CoverageIssue(kind, xs[i0], ys[j], xs[i1], ys[j + 1], tile_ids)
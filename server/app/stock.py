@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Mapping
+
+logger = logging.getLogger("lingyan.stock")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stock_items (
+    world TEXT NOT NULL,
+    key TEXT NOT NULL,
+    stock INTEGER NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (world, key)
+) WITHOUT ROWID;
+"""
+
+
+class StockError(RuntimeError):
+    """预留失败；stock/version 为失败时库中的当前值。"""
+
+    def __init__(self, key: str, stock: int, version: int) -> None:
+        super().__init__(f"{key}: stock={stock} version={version}")
+        self.key = key
+        self.stock = stock
+        self.version = version
+
+
+class OutOfStockError(StockError):
+    pass
+
+
+class StockConflictError(StockError):
+    """调用方给出的 expected_version 与库中版本不一致（其他买家已先行成交）。"""
+
+
+class StockLedger:
+    """商铺库存与拍品的共享账本（SQLite，WAL 模式，可跨进程）。
+
+    - 每个条目一行 (world, key) -> (stock, version)，首次访问时以世界快照中的库存播种；
+    - reserve 为单条条件 UPDATE：``stock >= 数量``（可选再加 ``version = 期望版本``）成立才扣减并递增版本，
+      由 SQLite 行级原子性保证不超卖、无丢失更新，热门商品无需任何进程内锁或重试；
+    - release 用于后续步骤失败时的补偿（归还预留）；
+    - world 为世界标识，世界重建后旧世界的行自然失效，由 prune 清理。
+    db_path 为 None 时使用进程内存库（测试与单进程开发）。
+    """
+
+    def __init__(self, db_path: Path | None = None) -> None:
+        self._path = db_path
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    @property
+    def path(self) -> Path | None:
+        return self._path
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # 首次使用时才打开数据库，未发生交易的进程不会创建文件
+        if self._conn is None:
+            if self._path is None:
+                conn = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+            else:
+                self._path.parent.mkdir(parents=True, exist_ok=True)
+                conn = sqlite3.connect(str(self._path), check_same_thread=False, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _seed(self, conn: sqlite3.Connection, world: str, initial: Mapping[str, int]) -> None:
+        conn.executemany(
+            "INSERT OR IGNORE INTO stock_items (world, key, stock, version) VALUES (?, ?, ?, 0)",
+            [(world, key, max(0, stock)) for key, stock in initial.items()],
+        )
+
+    def snapshot(self, world: str, initial: Mapping[str, int]) -> dict[str, tuple[int, int]]:
+        """返回各条目的 (库存, 版本)；尚未登记的条目以 initial 中的库存播种。"""
+        if not initial:
+            return {}
+        with self._lock:
+            conn = self._connect()
+            self._seed(conn, world, initial)
+            keys = list(initial)
+            rows: list[tuple] = []
+            # SQLite 默认变量上限 999，分批查询
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                marks = ",".join("?" * len(chunk))
+                rows += conn.execute(
+                    f"SELECT key, stock, version FROM stock_items WHERE world = ? AND key IN ({marks})",
+                    (world, *chunk),
+                ).fetchall()
+        return {key: (stock, version) for key, stock, version in rows}
+
+    def reserve(
+        self,
+        world: str,
+        key: str,
+        quantity: int,
+        initial: int,
+        expected_version: int | None = None,
+    ) -> tuple[int, int]:
+        """扣减 quantity，返回扣减后的 (库存, 版本)；库存不足或版本不符时抛出对应异常。"""
+        sql = (
+            "UPDATE stock_items SET stock = stock - ?, version = version + 1 "
+            "WHERE world = ? AND key = ? AND stock >= ?"
+        )
+        params: tuple = (quantity, world, key, quantity)
+        if expected_version is not None:
+            sql += " AND version = ?"
+            params += (expected_version,)
+        with self._lock:
+            conn = self._connect()
+            self._seed(conn, world, {key: initial})
+            row = conn.execute(sql + " RETURNING stock, version", params).fetchone()
+            if row is not None:
+                return row[0], row[1]
+            stock, version = conn.execute(
+                "SELECT stock, version FROM stock_items WHERE world = ? AND key = ?", (world, key)
+            ).fetchone()
+        if expected_version is not None and version != expected_version:
+            raise StockConflictError(key, stock, version)
+        raise OutOfStockError(key, stock, version)
+
+    def release(self, world: str, key: str, quantity: int) -> tuple[int, int]:
+        """归还预留（补偿失败的交易），返回归还后的 (库存, 版本)。"""
+        with self._lock:
+            row = self._connect().execute(
+                "UPDATE stock_items SET stock = stock + ?, version = version + 1 "
+                "WHERE world = ? AND key = ? RETURNING stock, version",
+                (quantity, world, key),
+            ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0], row[1]
+
+    def prune(self, world: str) -> int:
+        """删除其他世界遗留的条目，返回删除行数。"""
+        with self._lock:
+            cur = self._connect().execute("DELETE FROM stock_items WHERE world != ?", (world,))
+            removed = cur.rowcount
+        if removed:
+            logger.info("pruned %d stock rows from previous worlds", removed)
+        return removed
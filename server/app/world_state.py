@@ -1,13 +1,20 @@
 from __future__ import annotations
 
-import json
+import hashlib
+import logging
+from concurrent.futures import Future
 from datetime import UTC, datetime
+import shutil
 from pathlib import Path
 from threading import Lock
-from typing import Dict, List, Any
+from typing import Any, Callable, Dict, Iterable, List
+from urllib.parse import quote
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
+from .codec import StateCodec, decode_state, decode_value, get_codec
+from .journal import WorldJournal, WorldMutation
+from .persistence import GroupCommitWriter, atomic_write
 from .schemas import (
     AscensionChallenge,
     ChronicleLog,
@@ -18,6 +25,8 @@ from .schemas import (
     SecretRealm,
 )
 
+logger = logging.getLogger("lingyan.world.store")
+
 
 class Coordinates(BaseModel):
     x: float = Field(ge=0.0, le=1.0)
@@ -119,64 +128,341 @@ class WorldState(BaseModel):
     shops: Dict[str, Shop]
     auctions: Dict[str, AuctionHouse]
     last_updated: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    # 世界标识：缺省时按内容摘要生成（同一份存档每次加载结果相同，重建的世界得到新标识），
+    # 首次保存后随 meta 片段持久化；共享库存账本以此区分不同世界
+    world_id: str = ""
+
+    @model_validator(mode="after")
+    def _assign_world_id(self) -> "WorldState":
+        if not self.world_id:
+            body = self.model_dump_json(exclude={"last_updated", "world_id"}).encode("utf-8")
+            self.world_id = hashlib.blake2b(body, digest_size=12).hexdigest()
+        return self
+
+
+# 分段存储中的目录型片段（按 id 一个文件）与整体片段
+_KEYED_SECTIONS = ("shops", "auctions")
+_CATALOG_SECTIONS = (
+    "companions",
+    "secret_realms",
+    "ascension_challenges",
+    "pill_recipes",
+    "chronicle_logs",
+    "command_history",
+)
 
 
 class WorldStateStore:
-    def __init__(self, storage_path: Path | None = None) -> None:
+    """世界状态存储（分段持久化）。
+
+    - 世界拆分为独立落盘的片段：meta（主角模板、更新时间、商铺/拍卖行清单）、map、
+      shops/<id>、auctions/<id> 以及各目录列表（companions、pill_recipes 等），
+      存于存档文件旁的 ``<name>.d/`` 目录，每个片段一个文件。
+    - update_state(state, sections=[...]) 只重新序列化并写入指定片段（外加很小的 meta），
+      一次购买只写对应商铺，成本与世界规模无关；未指定 sections 时整体写入。
+    - 旧版单文件存档（world_state.json）仍可读取；首次写入时转换为分段目录，旧文件保留不动，
+      分段目录存在时以分段目录为准。
+    - 落盘统一走原子写（临时文件 + fsync + rename）；提供 writer 时交由组提交线程，
+      短时间内的多次保存只写最后一版，处理请求的协程不再同步等待磁盘。
+    - 库存、拍品、地图发现等世界变更经 apply 写入预写日志（journal.jsonl，追加 + 组提交 fsync），
+      启动时重放；compact 定期把日志折叠进片段快照并截断日志。
+    - 存档格式由 codec 决定（默认紧凑 JSON，见 STATE_CODEC）；读取时按文件头自动识别。
+    """
+
+    def __init__(
+        self,
+        storage_path: Path | None = None,
+        writer: GroupCommitWriter | None = None,
+        codec: StateCodec | None = None,
+        journal_fsync: bool = True,
+    ) -> None:
         default_path = Path(__file__).resolve().parent.parent / "world_state.json"
         self._path = storage_path or default_path
+        self._dir = self._path.with_name(self._path.stem + ".d")
         self._lock = Lock()
+        self._writer = writer
+        self._codec = codec or get_codec()
+        # 日志 fsync 复用组提交窗口：窗口内的变更共享一次刷盘
+        self._journal = WorldJournal(
+            self._dir / "journal.jsonl",
+            fsync=journal_fsync,
+            window=writer.window if writer is not None else 0.0,
+        )
         self._state: WorldState | None = None
-
-        if self._path.exists():
-            self._state = WorldState.model_validate_json(
-                self._path.read_text(encoding="utf-8")
-            )
+        # 已落盘的片段名；None 表示分段目录尚未建立（首次写入需整体写）
+        self._written: set[str] | None = None
+        self._dirty: set[str] = set()
+        # 最近一条变更的序号；各片段文件记录写入时已包含的序号，重放时据此跳过已折叠的变更
+        self._seq = 0
+        # 世界整体替换（初始化/重建/清空）时递增，派生索引据此判断是否需要重建
+        self._generation = 0
+        # 地图数据版本：地图片段变化（节点发现、世界替换）时递增，用于地图视图缓存
+        self._map_version = 0
+        section_seq: dict[str, int] = {}
+
+        if self._section_path("meta").exists():
+            self._state, section_seq = self._load_sections()
+            self._written = set(section_seq)
+        elif self._path.exists():
+            self._state = decode_state(self._path.read_bytes(), WorldState)
+        self._seq = max(section_seq.values(), default=0)
+        self._replay_journal(section_seq)
 
     @property
     def path(self) -> Path:
         return self._path
 
+    @property
+    def sections_dir(self) -> Path:
+        return self._dir
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def map_version(self) -> int:
+        return self._map_version
+
     def has_state(self) -> bool:
         return self._state is not None
 
     @property
     def state(self) -> WorldState:
-        if not self._state:
+        """当前世界快照。快照发布后不再被修改，读者无需加锁，可在整个请求内持有同一引用。"""
+        state = self._state
+        if not state:
             raise RuntimeError("World state not initialised")
-        return self._state
+        return state
 
     def set_state(self, state: WorldState) -> None:
+        """替换整个世界（初始化/重建），全部片段重写，并清理已不存在的商铺/拍卖行文件。
+
+        新片段携带当前序号，日志中此前的变更在重放时一律跳过。
+        """
         with self._lock:
-            self._state = state
-            serialized = json.dumps(
-                state.model_dump(mode="json"),
-                ensure_ascii=False,
-                indent=2,
-            )
-            self._path.write_text(serialized, encoding="utf-8")
-
-    def update_state(self, state: WorldState) -> None:
-        state.last_updated = datetime.now(UTC)
-        self.set_state(state)
-
-    def save(self) -> None:
-        if not self._state:
-            return
+            self._replace_locked(state)
+
+    def update(self, change: Callable[[WorldState], WorldState], sections: Iterable[str] | None = None) -> WorldState:
+        """写时复制更新：以当前快照构造新版本（结构共享未改动部分）并原子发布。
+
+        change 不得修改传入的快照；sections 指定新版本中改动过的片段（如 ``shops/<id>``），
+        缺省视为世界结构变化，整体写入。写者之间由锁串行，读者始终看到完整的某一版本。
+        """
+        with self._lock:
+            new_state = change(self.state).model_copy(update={"last_updated": datetime.now(UTC)})
+            if sections is None or self._written is None:
+                self._replace_locked(new_state)
+            else:
+                self._state = new_state
+                self._mark_dirty_locked(sections)
+                self._save_locked(new_state)
+            return new_state
+
+    def update_state(self, state: WorldState, sections: Iterable[str] | None = None) -> None:
+        """发布调用方已构造好的新版本（不得是原地修改过的当前快照），语义同 update。"""
+        self.update(lambda _current: state, sections)
+
+    def apply(self, mutation: WorldMutation) -> Future[None] | None:
+        """记录并应用一条世界变更：先追加到预写日志，再发布应用变更后的新快照。
+
+        返回日志 fsync 后完成的 Future（组提交，见 WorldJournal），确认给客户端前须等待；
+        新快照立即发布。对应片段只标记为脏，由 compact（后台压缩）或下一次保存写入快照。
+        """
+        with self._lock:
+            base = self.state
+            mutation.seq = self._seq + 1
+            commit = self._journal.append(mutation)
+            self._seq = mutation.seq
+            self._state = mutation.apply(base)
+            self._mark_dirty_locked((mutation.section,))
+            return commit
+
+    def mark_dirty(self, *sections: str) -> None:
+        with self._lock:
+            self._mark_dirty_locked(sections)
+
+    def save(self) -> int:
+        """写入标记为脏的片段（meta 总是随之写入），返回快照已包含的变更序号。"""
         with self._lock:
-            serialized = json.dumps(
-                self._state.model_dump(mode="json"),
-                ensure_ascii=False,
-                indent=2,
-            )
-            self._path.write_text(serialized, encoding="utf-8")
+            state = self._state
+            if state is not None:
+                if self._written is None:
+                    self._replace_locked(state)
+                else:
+                    self._save_locked(state)
+            return self._seq
+
+    def _replace_locked(self, state: WorldState) -> None:
+        sections = self.section_names(state)
+        self._state = state
+        self._generation += 1
+        self._map_version += 1
+        self._dirty.clear()
+        encoded = self._encode_sections(state, sections)
+        self._persist(encoded, stale=(self._written or set()) - set(sections))
+
+    def _mark_dirty_locked(self, sections: Iterable[str]) -> None:
+        for name in sections:
+            self._dirty.add(name)
+            if name == "map":
+                self._map_version += 1
+
+    def _save_locked(self, state: WorldState) -> None:
+        dirty = self._dirty
+        self._dirty = set()
+        dirty.add("meta")
+        self._persist(self._encode_sections(state, sorted(dirty)))
+
+    def compact(self) -> None:
+        """将预写日志折叠进分段快照：写入脏片段并等待落盘后，截断已包含的日志前缀。"""
+        if self._state is None or not self._journal.size():
+            return
+        upto = self.save()
+        self.flush()
+        self._journal.truncate(upto)
+
+    def journal_size(self) -> int:
+        return self._journal.size()
+
+    def flush(self) -> None:
+        """等待所有已提交的保存与日志追加落盘（关闭服务时调用）。"""
+        self._journal.sync()
+        if self._writer is not None:
+            self._writer.flush()
 
     def clear(self) -> None:
-        """清空当前世界状态并删除存档文件。"""
+        """清空当前世界状态并删除存档（分段目录、预写日志与旧版单文件）。"""
         with self._lock:
             self._state = None
+            self._generation += 1
+            self._written = None
+            self._dirty.clear()
+            if self._writer is not None:
+                self._writer.discard(self._path, under=self._dir)
             try:
+                if self._dir.exists():
+                    shutil.rmtree(self._dir)
                 if self._path.exists():
                     self._path.unlink()
             except Exception:
                 pass
+            self._journal.reset()
+
+    def _replay_journal(self, section_seq: dict[str, int]) -> None:
+        """启动时重放快照之后的变更；片段已包含的变更（seq 不大于片段序号）跳过。"""
+        mutations = self._journal.read()
+        if not mutations:
+            return
+        self._seq = max(self._seq, mutations[-1].seq)
+        if self._state is None:
+            return
+        replayed = 0
+        for mutation in mutations:
+            if mutation.seq > section_seq.get(mutation.section, 0):
+                self._state = mutation.apply(self._state)
+                self._dirty.add(mutation.section)
+                replayed += 1
+        if replayed:
+            logger.info("replayed %d world mutations from journal", replayed)
+
+    # ===== 片段编解码 =====
+    @staticmethod
+    def section_names(state: WorldState) -> list[str]:
+        names = ["meta", "map", *_CATALOG_SECTIONS]
+        names += [f"shops/{sid}" for sid in state.shops]
+        names += [f"auctions/{aid}" for aid in state.auctions]
+        return names
+
+    def _section_path(self, name: str) -> Path:
+        kind, _, key = name.partition("/")
+        if key:
+            return self._dir / kind / f"{quote(key, safe='')}.json"
+        return self._dir / f"{kind}.json"
+
+    @staticmethod
+    def _section_value(state: WorldState, name: str) -> Any:
+        kind, _, key = name.partition("/")
+        if kind == "meta":
+            return {
+                "player": state.player,
+                "last_updated": state.last_updated,
+                "world_id": state.world_id,
+                "shops": list(state.shops),
+                "auctions": list(state.auctions),
+            }
+        if kind == "map":
+            return state.map_state
+        if kind in _KEYED_SECTIONS:
+            return getattr(state, kind).get(key)
+        return getattr(state, kind)
+
+    def _encode_sections(self, state: WorldState, names: Iterable[str]) -> dict[str, bytes | None]:
+        """在锁内序列化，保证片段内容与所附序号一致；值为 None 表示对应商铺/拍卖行已被移除。"""
+        encoded: dict[str, bytes | None] = {}
+        for name in names:
+            value = self._section_value(state, name)
+            encoded[name] = None if value is None else self._codec.dump({"seq": self._seq, "data": value})
+        return encoded
+
+    def _read_section(self, name: str) -> tuple[int, Any]:
+        value = decode_value(self._section_path(name).read_bytes())
+        # 未附带序号的片段（早期格式）视为 0
+        if isinstance(value, dict) and value.keys() == {"seq", "data"}:
+            return value["seq"], value["data"]
+        return 0, value
+
+    def _load_sections(self) -> tuple[WorldState, dict[str, int]]:
+        """读取全部片段，返回世界状态与各片段的序号。"""
+        seqs: dict[str, int] = {}
+
+        def read(name: str) -> Any:
+            seqs[name], data = self._read_section(name)
+            return data
+
+        meta = read("meta")
+        raw: dict[str, Any] = {
+            "player": meta["player"],
+            "last_updated": meta["last_updated"],
+            "world_id": meta.get("world_id", ""),
+            "map_state": read("map"),
+        }
+        for name in _CATALOG_SECTIONS:
+            raw[name] = read(name)
+        # 以 meta 中的清单为准，忽略目录中残留的旧文件；清单先于片段落盘而崩溃时跳过缺失片段
+        for kind in _KEYED_SECTIONS:
+            raw[kind] = {}
+            for key in meta[kind]:
+                try:
+                    raw[kind][key] = read(f"{kind}/{key}")
+                except FileNotFoundError:
+                    logger.warning("world section %s/%s missing, skipped", kind, key)
+        return WorldState.model_validate(raw), seqs
+
+    def _persist(self, encoded: dict[str, bytes | None], stale: Iterable[str] = ()) -> None:
+        if self._written is None:
+            for kind in _KEYED_SECTIONS:
+                (self._dir / kind).mkdir(parents=True, exist_ok=True)
+            self._written = set()
+        removed = set(stale) | {name for name, data in encoded.items() if data is None}
+        # meta 最后提交：同一批次内先写片段，再写引用它们的清单
+        items = [
+            (self._section_path(name), encoded[name])
+            for name in sorted(encoded, key=lambda n: n == "meta")
+            if encoded[name] is not None
+        ]
+        if self._writer is not None:
+            self._writer.submit_many(items)
+        else:
+            for path, data in items:
+                atomic_write(path, data)
+        self._written.update(name for name, data in encoded.items() if data is not None)
+        for name in removed:
+            path = self._section_path(name)
+            if self._writer is not None:
+                self._writer.discard(path)
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            self._written.discard(name)
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import asyncio
+import tempfile
+from datetime import UTC, datetime
+from pathlib import Path
+
+from pydantic_core import from_json
+
+from app.broker_transport import UnixSocketTransport
+
+
+def test_unix_transport_fans_out_across_workers_and_reelects_hub() -> None:
+    async def scenario(path: Path) -> None:
+        received: dict[str, list[tuple[str, bytes]]] = {"a": [], "b": []}
+
+        def sink(name: str):
+            async def deliver(channel: str, data: bytes) -> None:
+                received[name].append((channel, data))
+
+            return deliver
+
+        a, b = UnixSocketTransport(path, reconnect_delay=0.05), UnixSocketTransport(path, reconnect_delay=0.05)
+        a.bind(sink("a"))
+        b.bind(sink("b"))
+        await a.start()
+        await b.start()
+        assert a.is_hub and not b.is_hub
+
+        # 载荷按已编码字节原样转发
+        await b.publish("chronicles:p1", b'{"type":"chronicle_update","n":1}')
+        for _ in range(100):
+            if received["a"] and received["b"]:
+                break
+            await asyncio.sleep(0.01)
+        assert received["a"] == received["b"] == [("chronicles:p1", b'{"type":"chronicle_update","n":1}')]
+
+        # hub 所在 worker 退出后，其余 worker 重新选出 hub 并继续工作
+        await a.close()
+        for _ in range(200):
+            if b.is_hub and b.stats()["connected"]:
+                break
+            await asyncio.sleep(0.01)
+        assert b.is_hub
+        await b.publish("alerts", b'{"n":2}')
+        for _ in range(100):
+            if len(received["b"]) == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert received["b"][-1] == ("alerts", b'{"n":2}')
+        await b.close()
+
+    # Unix 套接字路径长度有限，使用短的临时目录
+    with tempfile.TemporaryDirectory(prefix="lyev") as tmp:
+        asyncio.run(scenario(Path(tmp) / "hub.sock"))
+
+
+class _FakeSocket:
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.sent: list[str] = []
+        self.closed = False
+
+    async def accept(self) -> None:
+        return None
+
+    async def send_text(self, message: str) -> None:
+        await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    def messages(self) -> list[object]:
+        return [from_json(text) for text in self.sent]
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed = True
+
+
+def test_broadcast_is_decoupled_from_slow_clients() -> None:
+    from app.events import MultiChannelEventBroker
+
+    async def scenario() -> None:
+        broker = MultiChannelEventBroker(queue_size=4, send_timeout=0.2)
+        fast, slow = _FakeSocket(), _FakeSocket(delay=10)
+        await broker.connect("alerts", fast, [{"n": "snapshot"}])
+        await broker.connect("alerts", slow)
+        await asyncio.sleep(0.01)  # 快照已发出
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for n in range(10):
+            await broker.broadcast("alerts", {"n": n})
+        assert loop.time() - started < 0.1  # 只入队，不等待发送
+        for _ in range(100):
+            if slow.closed and len(fast.sent) >= 5:
+                break
+            await asyncio.sleep(0.01)
+        # 快客户端收到快照及队列容量内最新的消息，慢客户端超时后被断开
+        assert fast.messages()[0] == {"n": "snapshot"}
+        assert fast.messages()[-1] == {"n": 9}
+        assert slow.closed and broker.stats()["connections"] == 1
+        assert broker.stats()["send_timeouts"] == 1
+
+        # disconnect 策略：队列溢出时直接断开
+        strict = MultiChannelEventBroker(queue_size=2, overflow_policy="disconnect")
+        stuck = _FakeSocket(delay=10)
+        await strict.connect("alerts", stuck)
+        for n in range(5):
+            await strict.broadcast("alerts", {"n": n})
+        for _ in range(100):
+            if stuck.closed:
+                break
+            await asyncio.sleep(0.01)
+        assert stuck.closed and strict.stats()["overflow_disconnects"] == 1
+        await broker.close()
+
+    asyncio.run(scenario())
+
+
+def test_broadcast_encodes_payload_once_for_all_subscribers() -> None:
+    from app.events import MultiChannelEventBroker
+    from app.schemas import ChronicleLog, ChronicleStreamUpdate
+
+    async def scenario() -> None:
+        broker = MultiChannelEventBroker()
+        sockets = [_FakeSocket() for _ in range(3)]
+        for ws in sockets:
+            await broker.connect("chronicles:p1", ws)
+        update = ChronicleStreamUpdate(log=ChronicleLog(id="e1", title="t", timestamp=datetime(2024, 1, 1, tzinfo=UTC), summary="s", tags=[]))
+        await broker.broadcast("chronicles:p1", update)
+        for _ in range(100):
+            if all(ws.sent for ws in sockets):
+                break
+            await asyncio.sleep(0.01)
+        # 所有连接发送的是同一个已编码字符串对象
+        first = sockets[0].sent[0]
+        assert all(ws.sent[0] is first for ws in sockets)
+        assert from_json(first) == {"seq": 1, **update.model_dump(mode="json")}
+        await broker.close()
+
+    asyncio.run(scenario())
+
+
+def test_chronicle_stream_resumes_from_sequence() -> None:
+    from app.events import MultiChannelEventBroker
+
+    def snapshot(seq: int | None, epoch: str | None) -> dict:
+        return {"type": "snapshot", "logs": [], "seq": seq, "epoch": epoch}
+
+    async def drain(ws: _FakeSocket, count: int) -> list:
+        for _ in range(100):
+            if len(ws.sent) >= count:
+                break
+            await asyncio.sleep(0.01)
+        return ws.messages()
+
+    async def scenario() -> None:
+        broker = MultiChannelEventBroker(replay_size=3)
+        first = _FakeSocket()
+        assert not await broker.connect("chronicles:p1", first, snapshot=snapshot)
+        await broker.broadcast("chronicles:p1", {"type": "chronicle_update", "n": 1})
+        messages = await drain(first, 2)
+        cursor = messages[0]
+        assert cursor["seq"] == 0 and messages[1] == {"seq": 1, "type": "chronicle_update", "n": 1}
+        await broker.disconnect("chronicles:p1", first)
+
+        # 断线期间的更新仍进入缓冲，重连只补发缺失部分
+        await broker.broadcast("chronicles:p1", {"type": "chronicle_update", "n": 2})
+        await broker.broadcast("chronicles:p1", {"type": "chronicle_update", "n": 3})
+        again = _FakeSocket()
+        assert await broker.connect("chronicles:p1", again, since=1, epoch=cursor["epoch"], snapshot=snapshot)
+        assert [m["n"] for m in await drain(again, 2)] == [2, 3]
+
+        # 缺口滚出缓冲或 epoch 不符时回退为完整快照
+        for n in range(4, 8):
+            await broker.broadcast("chronicles:p1", {"type": "chronicle_update", "n": n})
+        late = _FakeSocket()
+        assert not await broker.connect("chronicles:p1", late, since=1, epoch=cursor["epoch"], snapshot=snapshot)
+        assert (await drain(late, 1))[0] == {"type": "snapshot", "logs": [], "seq": 7, "epoch": cursor["epoch"]}
+        stranger = _FakeSocket()
+        assert not await broker.connect("chronicles:p1", stranger, since=7, epoch="other", snapshot=snapshot)
+        assert broker.stats()["resume_fallbacks"] == 2
+        await broker.close()
+
+    asyncio.run(scenario())
+
+
+def test_batching_connections_coalesce_bursts() -> None:
+    from app.events import MultiChannelEventBroker
+
+    async def scenario() -> None:
+        broker = MultiChannelEventBroker(batch_window=0.05, batch_max=4)
+        plain, batched = _FakeSocket(), _FakeSocket()
+        await broker.connect("alerts", plain)
+        await broker.connect("alerts", batched, batch=True)
+        for n in range(6):
+            await broker.broadcast("alerts", {"n": n})
+        for _ in range(100):
+            if len(plain.sent) == 6 and len(batched.sent) == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert [m["n"] for m in plain.messages()] == list(range(6))
+        # 攒够 batch_max 条立即成帧，其余在窗口结束时成帧
+        frames = batched.messages()
+        assert [f["type"] for f in frames] == ["batch", "batch"]
+        assert [e["n"] for f in frames for e in f["events"]] == list(range(6))
+        assert len(frames[0]["events"]) == 4
+
+        # 窗口内只有一条时仍按原格式发送
+        await broker.broadcast("alerts", {"n": 6})
+        for _ in range(100):
+            if len(batched.sent) == 3:
+                break
+            await asyncio.sleep(0.01)
+        assert batched.messages()[-1] == {"n": 6}
+        await broker.close()
+
+    asyncio.run(scenario())
+
+
+def test_broadcast_snapshot_keeps_broker_sequence() -> None:
+    from app.events import MultiChannelEventBroker
+    from app.schemas import ChronicleStreamSnapshot
+
+    async def scenario() -> None:
+        broker = MultiChannelEventBroker()
+        first = _FakeSocket()
+
+        def snapshot(seq: int | None, epoch: str | None) -> ChronicleStreamSnapshot:
+            return ChronicleStreamSnapshot(logs=[], seq=seq, epoch=epoch)
+
+        await broker.connect("chronicles:p1", first, snapshot=snapshot)
+        # 广播的快照模型自带 seq/epoch=None，编码时剔除，以 broker 插入的 seq 为准
+        await broker.broadcast("chronicles:p1", ChronicleStreamSnapshot(logs=[]))
+        for _ in range(100):
+            if len(first.sent) == 2:
+                break
+            await asyncio.sleep(0.01)
+        cursor, pushed = first.messages()
+        assert pushed == {"seq": 1, "type": "snapshot", "logs": []}
+        assert first.sent[1].count('"seq"') == 1
+        await broker.disconnect("chronicles:p1", first)
+
+        await broker.broadcast("chronicles:p1", {"type": "chronicle_update", "n": 2})
+        again = _FakeSocket()
+        assert await broker.connect(
+            "chronicles:p1", again, since=pushed["seq"], epoch=cursor["epoch"], snapshot=snapshot
+        )
+        for _ in range(100):
+            if again.sent:
+                break
+            await asyncio.sleep(0.01)
+        assert again.messages() == [{"seq": 2, "type": "chronicle_update", "n": 2}]
+        await broker.close()
+
+    asyncio.run(scenario())
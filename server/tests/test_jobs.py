@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+
+from app.jobs import JobRegistry
+
+
+def test_run_batched_reports_progress_and_coalesces_batches() -> None:
+    registry = JobRegistry(workers=4)
+    batches: list[list[int]] = []
+    threads: set[str] = set()
+
+    def work(i: int) -> int | None:
+        threads.add(threading.current_thread().name)
+        if i == 3:
+            raise ValueError("boom")
+        return i if i % 2 == 0 else None
+
+    async def handle(i: int) -> int | None:
+        return await registry.run_in_pool(work, i)
+
+    async def on_batch(results: list[int]) -> None:
+        batches.append(sorted(results))
+
+    async def scenario() -> dict:
+        job = registry.start("demo", lambda job: registry.run_batched(job, range(10), handle, 4, on_batch))
+        await registry.wait(job)
+        await registry.close()
+        return registry.get(job.id).snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot["status"] == "succeeded"
+    assert (snapshot["total"], snapshot["processed"], snapshot["changed"], snapshot["failed"]) == (10, 10, 5, 1)
+    assert batches == [[0, 2], [4, 6], [8]]
+    assert all(name.startswith("admin-job") for name in threads)
+
+
+def test_failed_job_records_error() -> None:
+    registry = JobRegistry(workers=1)
+
+    async def explode(job) -> None:
+        raise RuntimeError("world missing")
+
+    async def scenario() -> dict:
+        job = registry.start("demo", explode)
+        await registry.wait(job)
+        return job.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot["status"] == "failed"
+    assert snapshot["error"] == "world missing"
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import asyncio
+
+from app.locks import KeyedLocks
+
+
+def test_same_key_serializes_and_records_wait() -> None:
+    locks = KeyedLocks("player")
+    order: list[str] = []
+
+    async def worker(name: str) -> None:
+        async with locks.hold("p1"):
+            order.append(f"{name}-in")
+            await asyncio.sleep(0.01)
+            order.append(f"{name}-out")
+
+    async def run() -> None:
+        await asyncio.gather(worker("a"), worker("b"))
+
+    asyncio.run(run())
+    assert order == ["a-in", "a-out", "b-in", "b-out"]
+    stats = locks.stats()
+    assert stats["acquisitions"] == 2
+    assert stats["contended"] == 1
+    assert stats["wait_max_ms"] > 0
+    assert stats["active_keys"] == 0
+
+
+def test_distinct_keys_never_contend() -> None:
+    locks = KeyedLocks("player")
+
+    async def worker(key: str) -> None:
+        async with locks.hold(key):
+            await asyncio.sleep(0.01)
+
+    async def run() -> None:
+        await asyncio.gather(*(worker(f"p{i}") for i in range(20)))
+
+    asyncio.run(run())
+    assert locks.stats()["contended"] == 0
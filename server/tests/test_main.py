@@ -86,3 +86,91 @@ def test_event_emit_broadcasts_to_channel() -> None:
         assert emit_response.status_code == 202
         message = websocket.receive_json()
         assert message["message"] == "测试广播"
+
+
+def test_map_view_is_cached_with_etag() -> None:
+    client = make_client()
+    first = client.get("/map")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert etag.startswith('"')
+    assert "nodes" in first.json()
+    second = client.get("/map", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.headers["etag"] == etag
+    assert client.get("/map", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_map_spatial_queries() -> None:
+    client = make_client()
+    visible = {node["id"] for node in client.get("/map").json()["nodes"]}
+    point = client.get("/map/at", params={"x": 0.5, "y": 0.5})
+    assert point.status_code == 200
+    body = point.json()
+    assert body["tile_id"] is not None
+    if visible:
+        assert body["nearest_node"]["id"] in visible
+    viewport = client.get("/map/viewport").json()
+    assert {node["id"] for node in viewport["nodes"]} == visible
+    assert client.get("/map/viewport", params={"x0": 0.8, "x1": 0.2}).status_code == 400
+
+
+def test_map_tiles_manifest_and_tile_payloads() -> None:
+    client = make_client()
+    visible = {node["id"] for node in client.get("/map").json()["nodes"]}
+    manifest = client.get("/map/tiles")
+    assert manifest.status_code == 200
+    assert "tiles" not in manifest.json()["style"]
+    tile_ids = [tile["id"] for tile in manifest.json()["tiles"]]
+    assert tile_ids
+    seen: set[str] = set()
+    for tile_id in tile_ids:
+        tile = client.get(f"/map/tiles/{tile_id}")
+        assert tile.status_code == 200
+        assert client.get(f"/map/tiles/{tile_id}", headers={"If-None-Match": tile.headers["etag"]}).status_code == 304
+        body = tile.json()
+        assert body["tile"]["id"] == tile_id
+        seen.update(node["id"] for node in body["nodes"])
+    assert seen == visible
+    assert client.get("/map/tiles/no-such-tile").status_code == 404
+
+
+def test_shop_purchase_failed_save_returns_stock_and_keeps_player(tmp_path, monkeypatch) -> None:
+    import app.persistence as persistence
+    from app.data import PlayerStore
+    from app.persistence import GroupCommitWriter
+
+    monkeypatch.setenv("STOCK_LEDGER_PATH", str(tmp_path / "stock.sqlite3"))
+    app = create_app()
+    repository = app.state.game_repository
+    writer = GroupCommitWriter(window=0.1)
+    players = PlayerStore(tmp_path / "players", writer=writer)
+    app.state.player_store = players
+    world = repository.get_state()
+    shop = next(s for s in world.shops.values() if any(i.stock > 0 for i in s.inventory))
+    item = next(i for i in shop.inventory if i.stock > 0)
+    before = world.player.model_copy(update={"current_location": shop.location_id, "spirit_stones": item.price})
+    for pid in ("buyer", "other"):
+        players.save(pid, before)
+    writer.flush()
+    stock = repository.shop_stock(shop)[item.id][0]
+
+    real_write = persistence.atomic_write
+
+    def flaky(path, data, **kwargs):
+        if "buyer" in path.parts:
+            raise OSError("disk full")
+        real_write(path, data, **kwargs)
+
+    monkeypatch.setattr(persistence, "atomic_write", flaky)
+    client = TestClient(app, raise_server_exceptions=False)
+    client.cookies.set("player_id", "buyer")
+    # 同一批次中其他玩家的保存成功，不影响失败者的回滚
+    other = players.save("other", players.load("other").model_copy(update={"spirit_stones": 0}))
+    response = client.post(f"/shops/{shop.id}/purchase", json={"item_id": item.id, "quantity": 1})
+    assert response.status_code == 500
+    assert other.result(timeout=1) is None
+    # 保存失败：库存归还账本，玩家状态回到磁盘上的最后一版
+    assert repository.shop_stock(shop)[item.id][0] == stock
+    assert players.load("buyer") == before
+    writer.close()
@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from app.codec import available_codecs, decode_state, get_codec
+from app.data import PlayerStore
+from app.journal import StockDelta
+from app.persistence import GroupCommitWriter, atomic_write
+from app.world_state import PlayerState, WorldStateStore
+
+from tests.test_player_store import _state
+
+
+def test_atomic_write_replaces_without_leftovers(tmp_path: Path) -> None:
+    target = tmp_path / "doc.json"
+    atomic_write(target, b"{}")
+    atomic_write(target, b'{"v": 2}')
+    assert json.loads(target.read_text()) == {"v": 2}
+    assert [p.name for p in tmp_path.iterdir()] == ["doc.json"]
+
+
+def test_group_commit_coalesces_saves_and_reads_own_writes(tmp_path: Path) -> None:
+    writer = GroupCommitWriter(window=5.0)
+    store = PlayerStore(tmp_path, writer=writer)
+    for loc in ("n1", "n2", "n3"):
+        store.save("a", _state(loc))
+    path = store._dir_for("a") / "state.json"
+    assert not path.exists()
+    assert store.load("a").current_location == "n3"
+    assert PlayerStore(tmp_path, writer=writer).load("a").current_location == "n3"
+    writer.flush()
+    stats = writer.stats()
+    assert stats["written"] == 1 and stats["coalesced"] == 2
+    assert json.loads(path.read_text(encoding="utf-8"))["current_location"] == "n3"
+    assert store.load("a").current_location == "n3"
+    writer.close()
+
+
+def test_group_commit_acknowledges_after_fsync_in_submission_order(tmp_path: Path) -> None:
+    writer = GroupCommitWriter(window=5.0)
+    first = writer.submit(tmp_path / "meta", b"1")
+    second = writer.submit(tmp_path / "shop", b"2")
+    # 重复提交的路径移到批次末尾
+    again = writer.submit(tmp_path / "meta", b"3")
+    assert first is again and second is not first and not first.done()
+    assert list(writer._pending) == [tmp_path / "shop", tmp_path / "meta"]
+    writer.flush()
+    assert first.result(timeout=1) is None and second.result(timeout=1) is None
+    assert (tmp_path / "meta").read_bytes() == b"3"
+    # 写入失败只影响失败路径的等待者，同批次已落盘的保存照常确认
+    failed = writer.submit(tmp_path / "missing-dir" / "x", b"4")
+    ok = writer.submit(tmp_path / "ok", b"5")
+    both = writer.submit_many([(tmp_path / "ok2", b"6"), (tmp_path / "missing-dir" / "y", b"7")])
+    writer.flush()
+    assert isinstance(failed.exception(timeout=1), OSError)
+    assert ok.result(timeout=1) is None and (tmp_path / "ok").read_bytes() == b"5"
+    assert isinstance(both.exception(timeout=1), OSError)
+    writer.close()
+
+
+def test_failed_group_commit_is_not_served_from_cache(tmp_path: Path, monkeypatch) -> None:
+    import app.persistence as persistence
+
+    writer = GroupCommitWriter(window=5.0)
+    store = PlayerStore(tmp_path, writer=writer)
+    for pid in ("alice", "bob"):
+        store.save(pid, _state("n1"))
+    writer.flush()
+    real_write = persistence.atomic_write
+
+    def flaky(path: Path, data: bytes, **kwargs) -> None:
+        if "alice" in path.parts:
+            raise OSError("disk full")
+        real_write(path, data, **kwargs)
+
+    monkeypatch.setattr(persistence, "atomic_write", flaky)
+    alice = store.save("alice", _state("n2"))
+    bob = store.save("bob", _state("n2"))
+    writer.flush()
+    assert isinstance(alice.exception(timeout=1), OSError)
+    assert bob.result(timeout=1) is None
+    # 失败的保存不留在缓存中：读取回到磁盘上的最后一版
+    assert store.load("alice").current_location == "n1"
+    # 成功的保存在落盘后补记文件标记，继续命中缓存
+    hits = store.cache_info()["hits"]
+    assert store.load("bob").current_location == "n2"
+    assert store.cache_info()["hits"] == hits + 1
+    writer.close()
+
+
+def test_world_store_flush_writes_latest_state(tmp_path: Path) -> None:
+    source = Path(__file__).resolve().parent.parent / "world_state.json"
+    path = tmp_path / "world_state.json"
+    path.write_bytes(source.read_bytes())
+    writer = GroupCommitWriter(window=5.0)
+    store = WorldStateStore(path, writer=writer)
+    store.update(
+        lambda current: current.model_copy(
+            update={"player": current.player.model_copy(update={"spirit_stones": 4321})}
+        ),
+        sections=(),
+    )
+    store.flush()
+    assert WorldStateStore(path).state.player.spirit_stones == 4321
+    writer.close()
+
+
+def test_codecs_round_trip_and_read_legacy_files(tmp_path: Path) -> None:
+    state = _state("n7")
+    legacy = json.dumps(state.model_dump(mode="json"), ensure_ascii=False, indent=2).encode("utf-8")
+    assert decode_state(legacy, PlayerState) == state
+    for name, codec in available_codecs().items():
+        blob = codec.encode(state)
+        assert decode_state(blob, PlayerState) == state, name
+        assert len(blob) < len(legacy)
+    assert get_codec("no-such-codec").name == "json"
+
+    # 旧版缩进存档在新编码器下照常读取，重新保存后为紧凑格式
+    (tmp_path / "old").mkdir()
+    (tmp_path / "old" / "state.json").write_bytes(legacy)
+    store = PlayerStore(tmp_path)
+    assert store.list_players_at("n7")[0][0] == "old"
+    store.save("old", store.load("old"))
+    assert (store._dir_for("old") / "state.json").read_bytes() == state.model_dump_json().encode("utf-8")
+
+
+def test_world_store_writes_only_dirty_sections(tmp_path: Path) -> None:
+    source = Path(__file__).resolve().parent.parent / "world_state.json"
+    path = tmp_path / "world_state.json"
+    path.write_bytes(source.read_bytes())
+    writer = GroupCommitWriter(window=0.05)
+    store = WorldStateStore(path, writer=writer)
+    state = store.state
+    shop_id, shop = next(iter(state.shops.items()))
+
+    # 旧版单文件在首次写入时整体转换为分段目录
+    store.update_state(state, sections=[f"shops/{shop_id}"])
+    full = writer.stats()["submitted"]
+    assert full == len(WorldStateStore.section_names(state))
+
+    def restock(current):
+        item = current.shops[shop_id].inventory[0]
+        inventory = [item.model_copy(update={"stock": item.stock - 1}), *current.shops[shop_id].inventory[1:]]
+        shops = {**current.shops, shop_id: current.shops[shop_id].model_copy(update={"inventory": inventory})}
+        return current.model_copy(update={"shops": shops})
+
+    state = store.update(restock, sections=[f"shops/{shop_id}"])
+    assert writer.stats()["submitted"] - full == 2  # 商铺片段 + meta
+    store.flush()
+    reloaded = WorldStateStore(path)
+    assert reloaded.state.shops[shop_id].inventory[0].stock == shop.inventory[0].stock - 1
+    assert reloaded.state.model_dump() == state.model_dump()
+
+    # 整体替换时清理已移除商铺的片段文件
+    shops = dict(state.shops)
+    shops.pop(shop_id)
+    store.set_state(state.model_copy(update={"shops": shops}))
+    store.flush()
+    assert shop_id not in WorldStateStore(path).state.shops
+    assert len(list((store.sections_dir / "shops").iterdir())) == len(shops)
+    writer.close()
+
+
+def test_world_journal_replays_and_compacts_without_double_apply(tmp_path: Path) -> None:
+    source = Path(__file__).resolve().parent.parent / "world_state.json"
+    path = tmp_path / "world_state.json"
+    path.write_bytes(source.read_bytes())
+    store = WorldStateStore(path)
+    shop_id, shop = next(iter(store.state.shops.items()))
+    item = shop.inventory[0]
+    before = item.stock
+    snapshot = store.state
+    store.apply(StockDelta(shop_id=shop_id, item_id=item.id, delta=-1))
+    store.apply(StockDelta(shop_id=shop_id, item_id=item.id, delta=-1))
+    assert store.state.shops[shop_id].inventory[0].stock == before - 2
+    # 写时复制：已发布的旧快照保持不变，未改动的部分与新快照共享
+    assert item.stock == before
+    assert snapshot.shops[shop_id] is shop
+    assert store.state.companions is snapshot.companions
+
+    # 未落盘快照：重启后由日志重放
+    assert WorldStateStore(path).state.shops[shop_id].inventory[0].stock == before - 2
+
+    # 快照已写入但日志未截断（压缩中途崩溃）：已折叠的变更不重复应用
+    store.save()
+    assert store.journal_size() == 2
+    assert WorldStateStore(path).state.shops[shop_id].inventory[0].stock == before - 2
+
+    store.compact()
+    assert store.journal_size() == 0
+    store.apply(StockDelta(shop_id=shop_id, item_id=item.id, delta=-1))
+    reopened = WorldStateStore(path)
+    assert reopened.state.shops[shop_id].inventory[0].stock == before - 3
+    assert reopened.journal_size() == 1
+
+
+def test_world_journal_groups_fsync_of_concurrent_appends(tmp_path: Path) -> None:
+    from app.journal import WorldJournal
+
+    journal = WorldJournal(tmp_path / "journal.jsonl", window=0.05)
+    first = journal.append(StockDelta(seq=1, shop_id="s", item_id="i", delta=-1))
+    second = journal.append(StockDelta(seq=2, shop_id="s", item_id="i", delta=-1))
+    # append 只写入操作系统即返回，窗口内的追加共享同一次 fsync
+    assert first is second and not first.done()
+    assert first.result(timeout=2) is None
+    assert journal.syncs() == 1
+    assert [m.seq for m in journal.read()] == [1, 2]
+    third = journal.append(StockDelta(seq=3, shop_id="s", item_id="i", delta=-1))
+    journal.sync()
+    assert third.done() and journal.syncs() == 2
@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import json
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from app.data import GameRepository, PlayerStore
+from app.player_sqlite import SqlitePlayerStore
+from app.schemas import AscensionProgress, ChronicleLog, CommandResult, PlayerProfile
+from app.segments import CursorExpiredError
+from app.world_state import PlayerState, WorldState
+
+
+def _log(i: int) -> ChronicleLog:
+    return ChronicleLog(
+        id=f"log-{i}",
+        title=f"事件 {i}",
+        timestamp=datetime(2025, 1, 1, tzinfo=UTC) + timedelta(minutes=i),
+        summary=f"第 {i} 条",
+        tags=["测试"],
+    )
+
+
+def _cmd(i: int) -> CommandResult:
+    return CommandResult(
+        id=f"cmd-{i}",
+        content=f"指令 {i}",
+        feedback=f"回响 {i}",
+        created_at=datetime(2025, 1, 1, tzinfo=UTC) + timedelta(minutes=i),
+    )
+
+
+def test_logs_append_as_jsonl_and_read_newest_first(tmp_path: Path) -> None:
+    store = PlayerStore(tmp_path)
+    for i in range(5):
+        store.append_log("p1", _log(i))
+    lines = (store._dir_for("p1") / "logs.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 5
+    assert json.loads(lines[-1])["id"] == "log-4"
+    assert [e.id for e in store.list_logs("p1")] == [f"log-{i}" for i in range(4, -1, -1)]
+
+
+def test_segments_compact_to_max_entries(tmp_path: Path) -> None:
+    store = PlayerStore(tmp_path)
+    cap = GameRepository._max_commands
+    for i in range(cap * 2 + 1):
+        store.append_command("p1", _cmd(i))
+    path = store._dir_for("p1") / "commands.jsonl"
+    assert len(path.read_text(encoding="utf-8").splitlines()) == cap
+    history = store.list_commands("p1")
+    assert len(history) == cap
+    assert history[0].id == f"cmd-{cap * 2}"
+
+
+def test_legacy_json_history_is_migrated(tmp_path: Path) -> None:
+    legacy_dir = tmp_path / "p1"
+    legacy_dir.mkdir()
+    legacy = [_log(i).model_dump(mode="json") for i in (2, 1, 0)]
+    (legacy_dir / "logs.json").write_text(json.dumps(legacy, ensure_ascii=False), encoding="utf-8")
+    store = PlayerStore(tmp_path)
+    assert [e.id for e in store.list_logs("p1")] == ["log-2", "log-1", "log-0"]
+    store.append_log("p1", _log(3))
+    assert not (legacy_dir / "logs.json").exists()
+    assert (store._dir_for("p1") / "logs.jsonl").exists()
+    assert [e.id for e in store.list_logs("p1")][:2] == ["log-3", "log-2"]
+
+
+def _state(location: str) -> PlayerState:
+    return PlayerState(
+        profile=PlayerProfile(
+            id="p",
+            name="测试者",
+            realm="凡人九品",
+            guild="",
+            faction_reputation={},
+            attributes={},
+            techniques=[],
+            achievements=[],
+            ascension_progress=AscensionProgress(stage="凡人九品", score=0, next_milestone="炼气一阶"),
+        ),
+        current_location=location,
+        spirit_stones=10,
+        inventory=[],
+    )
+
+
+def test_location_index_tracks_save_and_delete(tmp_path: Path) -> None:
+    store = PlayerStore(tmp_path)
+    store.save("a", _state("n1"))
+    store.save("b", _state("n1"))
+    store.save("c", _state("n2"))
+    assert sorted(pid for pid, _ in store.list_players_at("n1")) == ["a", "b"]
+    store.save("b", _state("n2"))
+    assert [pid for pid, _ in store.list_players_at("n1")] == ["a"]
+    store.delete_player("c")
+    assert [pid for pid, _ in store.list_players_at("n2", exclude_pid="a")] == ["b"]
+    # 重启后由磁盘重建索引
+    reopened = PlayerStore(tmp_path)
+    assert sorted(reopened.list_ids()) == ["a", "b"]
+    assert [pid for pid, _ in reopened.list_players_at("n2")] == ["b"]
+    reopened.clear_all()
+    assert reopened.list_players_at("n1") == []
+
+
+def test_state_cache_hits_and_revalidates_on_external_write(tmp_path: Path) -> None:
+    store = PlayerStore(tmp_path, cache_size=2)
+    store.save("a", _state("n1"))
+    assert store.load("a").current_location == "n1"
+    assert store.cache_info()["hits"] == 1
+    # 外部改写文件：mtime/size 变化后重新读取
+    path = store._dir_for("a") / "state.json"
+    data = json.loads(path.read_text(encoding="utf-8"))
+    data["current_location"] = "n3-external"
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    assert store.load("a").current_location == "n3-external"
+    assert store.cache_info()["misses"] == 1
+    store.save("b", _state("n1"))
+    store.save("c", _state("n1"))
+    assert store.cache_info()["size"] == 2
+
+
+def test_loaded_states_do_not_share_objects_with_cache_or_world(tmp_path: Path) -> None:
+    world = WorldState.model_validate_json(
+        (Path(__file__).resolve().parent.parent / "world_state.json").read_bytes()
+    )
+    template_qty = world.player.inventory[0].quantity
+    for store in (PlayerStore(tmp_path / "files"), SqlitePlayerStore(tmp_path / "players.sqlite3")):
+        a = store.create_from_world("a", world)
+        store.create_from_world("b", world)
+        a.inventory[0].quantity += 5
+        store.save("a", a)
+        # 保存后继续修改调用方的实例，不影响缓存
+        a.inventory[0].quantity += 100
+        assert world.player.inventory[0].quantity == template_qty
+        assert store.load("b").inventory[0].quantity == template_qty
+        loaded = store.load("a")
+        assert loaded.inventory[0].quantity == template_qty + 5
+        loaded.spirit_stones += 1
+        assert store.load("a").spirit_stones == loaded.spirit_stones - 1
+
+
+def test_sqlite_backend_matches_file_interface(tmp_path: Path) -> None:
+    store = SqlitePlayerStore(tmp_path / "players.sqlite3")
+    assert not store.exists("a")
+    store.save("a", _state("n1"))
+    store.save("b", _state("n1"))
+    assert store.exists("a")
+    assert store.load("a").current_location == "n1"
+    assert store.cache_info()["hits"] == 1
+    assert [pid for pid, _ in store.list_players_at("n1", exclude_pid="a")] == ["b"]
+    for i in range(GameRepository._max_chronicle_entries + 3):
+        store.append_log("a", _log(i))
+    logs = store.list_logs("a")
+    assert len(logs) == GameRepository._max_chronicle_entries
+    assert logs[0].id == f"log-{GameRepository._max_chronicle_entries + 2}"
+    store.delete_player("b")
+    assert store.list_ids() == ["a"]
+
+
+def test_sqlite_migrates_directory_layout(tmp_path: Path) -> None:
+    files = PlayerStore(tmp_path / "players")
+    files.save("a", _state("n1"))
+    files.append_log("a", _log(0))
+    files.append_log("a", _log(1))
+    files.append_command("a", _cmd(0))
+    store = SqlitePlayerStore(tmp_path / "players.sqlite3")
+    assert store.migrate_from_directory(files) == 1
+    assert store.load("a").current_location == "n1"
+    assert [e.id for e in store.list_logs("a")] == ["log-1", "log-0"]
+    assert [c.id for c in store.list_commands("a")] == ["cmd-0"]
+
+
+def test_history_cursor_pagination_file_and_sqlite(tmp_path: Path) -> None:
+    for store in (PlayerStore(tmp_path / "files"), SqlitePlayerStore(tmp_path / "players.sqlite3")):
+        for i in range(10):
+            store.append_log("a", _log(i))
+        # 同一秒内生成的重复 id 仍分配不同游标
+        store.append_log("a", _log(9))
+        logs = store.list_logs("a")
+        assert [e.id for e in logs[:3]] == ["log-9", "log-9", "log-8"]
+        cursors = [e.cursor for e in logs]
+        assert len(set(cursors)) == 11 and cursors == sorted(cursors, reverse=True)
+        by_id = {e.id: e.cursor for e in reversed(logs)}
+        assert [e.id for e in store.list_logs("a", limit=3, before=by_id["log-7"])] == ["log-6", "log-5", "log-4"]
+        assert [e.id for e in store.list_logs("a", limit=2, after=by_id["log-4"])] == ["log-6", "log-5"]
+        assert [e.id for e in store.list_logs("a", before=by_id["log-6"], after=by_id["log-3"])] == ["log-5", "log-4"]
+        # 游标不早于最新记录：没有更新的记录
+        assert store.list_logs("a", after=logs[0].cursor) == []
+        assert store.list_logs("a", after=logs[0].cursor + 100) == []
+        # 游标记录被截断淘汰后两种后端都要求客户端重新加载
+        oldest = logs[-1].cursor
+        for i in range(GameRepository._max_chronicle_entries):
+            store.append_log("a", _log(100 + i))
+        with pytest.raises(CursorExpiredError):
+            store.list_logs("a", after=oldest)
+        kept = store.list_logs("a", before=oldest + 1000)
+        assert len(kept) == GameRepository._max_chronicle_entries
+        # 紧接最旧保留记录之前的游标没有缺失
+        assert store.list_logs("a", after=kept[-1].cursor - 1) == kept
+        # 未截断时 after=0 即从头读取
+        for i in range(3):
+            store.append_log("b", _log(i))
+        first = store.list_logs("b")[-1].cursor
+        assert [e.id for e in store.list_logs("b", after=0)] == ["log-2", "log-1", "log-0"]
+        assert [e.id for e in store.list_logs("b", after=first)] == ["log-2", "log-1"]
+
+
+def test_sharded_layout_migrates_v1_and_v2_players_online(tmp_path: Path) -> None:
+    v2_dir = tmp_path / "abcdef"
+    v2_dir.mkdir()
+    (v2_dir / "state.json").write_text(_state("n1").model_dump_json(), encoding="utf-8")
+    (v2_dir / "logs.jsonl").write_text(_log(1).model_dump_json() + "\n", encoding="utf-8")
+    (tmp_path / "x.json").write_text(_state("n2").model_dump_json(), encoding="utf-8")
+
+    store = PlayerStore(tmp_path)
+    assert sorted(store.list_ids()) == ["abcdef", "x"]
+    assert store.pending_migrations() == 2
+    # 读路径不创建目录
+    assert not store.exists("nobody")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["abcdef", "x.json"]
+
+    # 首次访问时迁移
+    assert store.load("abcdef").current_location == "n1"
+    assert store._dir_for("abcdef") == tmp_path / "ab" / "cd" / "abcdef"
+    assert [e.id for e in store.list_logs("abcdef")] == ["log-1"]
+    assert not v2_dir.exists()
+
+    assert store.migrate_layout() == 1
+    assert not (tmp_path / "x.json").exists()
+    assert (tmp_path / "x_" / "__" / "x" / "state.json").exists()
+    reopened = PlayerStore(tmp_path)
+    assert reopened.pending_migrations() == 0
+    assert [pid for pid, _ in reopened.list_players_at("n2")] == ["x"]
+
+
+def test_segment_log_file_stats_are_bounded(tmp_path: Path) -> None:
+    from app.segments import SegmentLog, record_cursor
+
+    segments = SegmentLog(4, cache_size=2)
+    paths = [tmp_path / f"{n}.jsonl" for n in range(5)]
+    for _ in range(3):
+        for path in paths:
+            segments.append(path, _log(0).model_dump_json(exclude={"cursor"}))
+    assert len(segments._line_counts) == 2 and len(segments._last_cursor) == 2
+    # 淘汰后从文件重新统计，游标与压缩照常延续
+    for _ in range(6):
+        segments.append(paths[0], _log(1).model_dump_json(exclude={"cursor"}))
+    assert [record_cursor(line) for line in segments.window(paths[0])] == [9, 8, 7, 6]
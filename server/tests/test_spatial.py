@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import math
+import random
+
+from app.spatial import SpatialIndex
+
+
+def _tiles(cols: int, rows: int) -> list[dict]:
+    tiles = []
+    for r in range(rows):
+        for c in range(cols):
+            tiles.append(
+                {
+                    "id": f"tile_{r}_{c}",
+                    "bbox": {"x0": c / cols, "y0": r / rows, "x1": (c + 1) / cols, "y1": (r + 1) / rows},
+                    "areas": [],
+                }
+            )
+    tiles[0]["areas"] = [{"points": [{"x": 0.0, "y": 0.0}, {"x": 0.2, "y": 0.0}, {"x": 0.0, "y": 0.2}]}]
+    return tiles
+
+
+def test_spatial_queries_match_linear_scans() -> None:
+    rng = random.Random(7)
+    nodes = [(f"n{i}", rng.random(), rng.random()) for i in range(300)]
+    index = SpatialIndex(nodes, _tiles(3, 2))
+
+    assert index.tile_at(0.1, 0.1) == "tile_0_0"
+    assert index.tile_at(1 / 3, 0.25) == "tile_0_1"  # 左边界属于右侧 tile
+    assert index.tile_at(1.0, 1.0) == "tile_1_2"  # 地图右下角归属最后一格
+    assert index.areas_at(0.05, 0.05) == [("tile_0_0", 0)]
+    assert index.areas_at(0.15, 0.15) == []
+
+    for _ in range(50):
+        x0, x1 = sorted((rng.random(), rng.random()))
+        y0, y1 = sorted((rng.random(), rng.random()))
+        expected = {n for n, x, y in nodes if x0 <= x <= x1 and y0 <= y <= y1}
+        assert set(index.nodes_in(x0, y0, x1, y1)) == expected
+
+        px, py = rng.random(), rng.random()
+        best = min(math.hypot(x - px, y - py) for _, x, y in nodes)
+        node_id, dist = index.nearest_node(px, py)
+        assert math.isclose(dist, best)
+
+    allowed = {n for n, _, _ in nodes[:5]}
+    node_id, _ = index.nearest_node(0.5, 0.5, accept=allowed.__contains__)
+    assert node_id in allowed
+    assert SpatialIndex([]).nearest_node(0.5, 0.5) is None
+
+
+def test_tile_coverage_reports_every_gap_and_overlap() -> None:
+    from app.spatial import check_tile_coverage
+
+    assert check_tile_coverage(_tiles(60, 60)) == []
+    # AI 常见的六位小数舍入不应被视为空隙或重叠
+    rounded = [
+        {"id": "a", "bbox": {"x0": 0.0, "y0": 0.0, "x1": 0.333333, "y1": 1.0}},
+        {"id": "b", "bbox": {"x0": 0.333334, "y0": 0.0, "x1": 0.666667, "y1": 1.0}},
+        {"id": "c", "bbox": {"x0": 0.666667, "y0": 0.0, "x1": 1.0, "y1": 1.0}},
+    ]
+    assert check_tile_coverage(rounded) == []
+
+    broken = _tiles(4, 4)
+    broken.pop(5)  # tile_1_1 缺失
+    broken.pop(0)  # tile_0_0 缺失
+    broken.append({"id": "extra", "bbox": {"x0": 0.5, "y0": 0.5, "x1": 1.0, "y1": 0.75}})
+    issues = check_tile_coverage(broken)
+    gaps = [(i.x0, i.y0, i.x1, i.y1) for i in issues if i.kind == "gap"]
+    overlaps = [i for i in issues if i.kind == "overlap"]
+    assert gaps == [(0.0, 0.0, 0.25, 0.25), (0.25, 0.25, 0.5, 0.5)]
+    assert len(overlaps) == 1
+    assert (overlaps[0].x0, overlaps[0].y0, overlaps[0].x1, overlaps[0].y1) == (0.5, 0.5, 1.0, 0.75)
+    assert set(overlaps[0].tile_ids) == {"tile_2_2", "tile_2_3", "extra"}
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+
+import pytest
+
+from app.stock import OutOfStockError, StockConflictError, StockLedger
+
+
+def test_reserve_is_compare_and_set() -> None:
+    ledger = StockLedger()
+    assert ledger.reserve("w", "shop/s/i", 2, initial=5) == (3, 1)
+    with pytest.raises(StockConflictError) as conflict:
+        ledger.reserve("w", "shop/s/i", 1, initial=5, expected_version=0)
+    assert (conflict.value.stock, conflict.value.version) == (3, 1)
+    assert ledger.reserve("w", "shop/s/i", 1, initial=5, expected_version=1) == (2, 2)
+    with pytest.raises(OutOfStockError):
+        ledger.reserve("w", "shop/s/i", 3, initial=5)
+    assert ledger.release("w", "shop/s/i", 1) == (3, 3)
+    # 其他世界的同名条目相互独立，prune 清理旧世界
+    assert ledger.snapshot("w2", {"shop/s/i": 5}) == {"shop/s/i": (5, 0)}
+    assert ledger.prune("w2") == 1
+    assert ledger.snapshot("w2", {"shop/s/i": 9}) == {"shop/s/i": (5, 0)}
+
+
+def test_concurrent_buyers_across_connections_never_oversell(tmp_path: Path) -> None:
+    path = tmp_path / "stock.sqlite3"
+    ledgers = [StockLedger(path) for _ in range(4)]  # 模拟多个工作进程
+    sold: list[int] = []
+    lock = threading.Lock()
+
+    def buyer(ledger: StockLedger) -> None:
+        for _ in range(25):
+            try:
+                ledger.reserve("w", "shop/s/hot", 1, initial=40)
+            except OutOfStockError:
+                continue
+            with lock:
+                sold.append(1)
+
+    threads = [threading.Thread(target=buyer, args=(ledgers[n % 4],)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(sold) == 40
+    assert ledgers[0].snapshot("w", {"shop/s/hot": 40}) == {"shop/s/hot": (0, 40)}
+    for ledger in ledgers:
+        ledger.close()
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from app.data import GameRepository
+from app.journal import NodeDiscovered
+from app.world_state import WorldStateStore
+
+
+def _store(tmp_path: Path) -> WorldStateStore:
+    source = Path(__file__).resolve().parent.parent / "world_state.json"
+    path = tmp_path / "world_state.json"
+    path.write_bytes(source.read_bytes())
+    return WorldStateStore(path)
+
+
+def test_indexes_match_linear_scans_and_rebuild_on_replace(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+    repo = GameRepository(store)
+    world = store.state
+    for node in world.map_state.nodes:
+        assert repo.node(node.id) is node
+        assert repo.neighbors(node.id) == set(node.connections)
+        assert repo.shops_at(node.id) == [s for s in world.shops.values() if s.location_id == node.id]
+        assert repo.auctions_at(node.id) == [a for a in world.auctions.values() if a.location_id == node.id]
+    for key, auction in world.auctions.items():
+        assert repo.auction_by_id(auction.id) == (key, auction)
+    assert repo.node("no-such-node") is None
+    assert repo.auction_by_id("no-such-auction") is None
+
+    # 整体替换世界后索引随存储代数重建
+    replaced = world.model_copy(
+        update={"map_state": world.map_state.model_copy(update={"nodes": world.map_state.nodes[:1]})}
+    )
+    store.set_state(replaced)
+    assert repo.node(world.map_state.nodes[0].id) is replaced.map_state.nodes[0]
+    assert len(repo.index().node_pos) == 1
+
+
+def test_map_view_cache_invalidates_on_map_change(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+    repo = GameRepository(store)
+    etag, body = repo.get_map_view_encoded()
+    assert repo.get_map_view_encoded()[1] is body
+    hidden = next((n for n in store.state.map_state.nodes if not n.discovered), None)
+    if hidden is None:
+        hidden = store.state.map_state.nodes[0]
+        nodes = [hidden.model_copy(update={"discovered": False}), *store.state.map_state.nodes[1:]]
+        store.update(
+            lambda current: current.model_copy(update={"map_state": current.map_state.model_copy(update={"nodes": nodes})}),
+            sections=["map"],
+        )
+        etag, body = repo.get_map_view_encoded()
+    store.apply(NodeDiscovered(node_id=hidden.id))
+    new_etag, new_body = repo.get_map_view_encoded()
+    assert new_etag != etag
+    assert hidden.id.encode() in new_body
+    # 节点发现生成新快照，索引按下标取到的是新版本的节点
+    assert repo.node(hidden.id).discovered
+    # 不存在的 tile 不占用缓存
+    for n in range(50):
+        assert repo.get_map_tile_encoded(f"bogus-{n}") is None
+    assert not any(name.startswith("tile:bogus") for name in repo._map_payloads)
+
+
+def test_route_table_shortest_paths(tmp_path: Path) -> None:
+    from app.routing import RouteTable
+
+    routes = RouteTable(
+        {
+            "a": frozenset({"b", "c"}),
+            "b": frozenset({"d"}),
+            "c": frozenset({"d", "ghost"}),
+            "d": frozenset({"e"}),
+            "e": frozenset(),
+        }
+    )
+    assert routes.path("a", "e") == ["a", "b", "d", "e"]
+    assert routes.distance("a", "e") == 3
+    assert routes.path("a", "a") == ["a"]
+    assert routes.path("e", "a") is None  # 连接为有向边
+    assert routes.path("a", "ghost") is None
+
+    repo = GameRepository(_store(tmp_path))
+    nodes = repo.get_state().map_state.nodes
+    for node in nodes:
+        for target in node.connections:
+            if repo.node(target):
+                assert repo.route(node.id, target) == [node.id, target]
+
+
+def test_purchase_reserves_shared_stock_and_releases_on_failure(tmp_path: Path) -> None:
+    from fastapi import HTTPException
+
+    store = _store(tmp_path)
+    repo = GameRepository(store)
+    world = store.state
+    shop = next(s for s in world.shops.values() if s.inventory)
+    item = shop.inventory[0]
+    # 将主角移到商铺所在地并给足灵石
+    store.update(
+        lambda current: current.model_copy(
+            update={"player": current.player.model_copy(update={"current_location": shop.location_id, "spirit_stones": item.price})}
+        ),
+        sections=(),
+    )
+    repo.purchase_from_shop(shop.id, item.id, 1)
+    assert repo.shop_stock(shop)[item.id] == (item.stock - 1, 1)
+    assert store.state.shops[shop.id].inventory[0].stock == item.stock - 1
+    # 灵石已用尽：扣费失败时归还预留，库存不变
+    with pytest.raises(HTTPException):
+        repo.purchase_from_shop(shop.id, item.id, 1)
+    assert repo.shop_stock(shop)[item.id][0] == item.stock - 1
+    # 世界标识随 meta 持久化，重启后账本命名空间不变
+    store.save()
+    assert WorldStateStore(store.path).state.world_id == world.world_id